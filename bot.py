@@ -4,8 +4,13 @@ import logging
 import pytz
 import asyncio
 import requests
+import sqlite3
+import sys
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from menu_db import normalize_name
+from menu_sites import SiteRegistry
 
 # --- FIX per APScheduler < 3.10 su Python recenti ---
 # APScheduler 3.6.3 (usato da python-telegram-bot su certi setup) crasha
@@ -44,38 +49,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Carica il file menu.json
-def load_menu():
-    try:
-        with open(os.path.join(DATA_DIR, "menu.json"), "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logger.error("Errore: menu.json non trovato!")
-        return {}
-
-MENU = load_menu()
-
-# Carica il file canteens.json
-def load_canteens():
-    try:
-        with open(os.path.join(DATA_DIR, "canteens.json"), "r", encoding="utf-8") as f:
-            data = json.load(f)
-            # Mappa id -> nome per filtro e nome -> id visualizzazione se serve
-            return {c["id"]: c["name"] for c in data}
-    except FileNotFoundError:
-        logger.error("Errore: canteens.json non trovato!")
-        return {}
-
-def load_canteens_full():
-    try:
-        with open(os.path.join(DATA_DIR, "canteens.json"), "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logger.error("Errore: canteens.json non trovato!")
-        return []
-
-CANTEENS = load_canteens()
-CANTEENS_FULL = load_canteens_full()
+# Siti serviti (scripts/menu_sites.py): ognuno con menu, mense, menu.db, statistiche,
+# previsioni e cache dei testi propri. UNIPI viene caricato subito, UNIFI al primo uso.
+REGISTRY = SiteRegistry(DATA_DIR)
 
 def load_feste():
     try:
@@ -149,9 +125,10 @@ FEEDBACK_TEXT = (
 # --- RIMOSSO PATCH APSCHEDULER RIDONDANTE ---
 
 
-def get_menu_text(date_str, meal_type, canteen_name=None):
+def get_menu_text(date_str, meal_type, canteen_name=None, site=None):
     """Recupera il testo del menù per una data, un tipo di pasto e una mensa specifica."""
-    day_menu = MENU.get(date_str)
+    site = site or REGISTRY.default
+    day_menu = site.menu.get(date_str)
     
     # Intestazione Data Decorativa
     header = ""
@@ -177,7 +154,7 @@ def get_menu_text(date_str, meal_type, canteen_name=None):
 
     is_all_mode = (canteen_name == "TUTTE")
     if not is_all_mode and canteen_name:
-        c_id_match = next((k for k, v in CANTEENS.items() if v == canteen_name), None)
+        c_id_match = next((k for k, v in site.canteens.items() if v == canteen_name), None)
         if c_id_match:
             try:
                 date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -191,6 +168,19 @@ def get_menu_text(date_str, meal_type, canteen_name=None):
             except Exception:
                 pass
 
+    # Il corpo dipende solo da menu.json: lo teniamo in cache (le festività sopra no)
+    key = (date_str, meal_type, canteen_name)
+    body = site.text_cache.get(key)
+    if body is None:
+        body = site.text_cache[key] = build_menu_body(meal_menu, canteen_name)
+    if not body:
+        return f"{header}ʕ ´•̥̥̥ ᴥ•̥̥̥ ʔ Oh no... Nessun piatto disponibile per questa mensa."
+    return header + body
+
+def build_menu_body(meal_menu, canteen_name=None):
+    """Elenco dei piatti di un pasto filtrato per mensa ("" se non ce ne sono)."""
+    is_all_mode = (canteen_name == "TUTTE")
+
     # Calcoliamo le mense attive per questo pasto se siamo in modalità TUTTE
     active_canteens = set()
     if is_all_mode:
@@ -201,7 +191,7 @@ def get_menu_text(date_str, meal_type, canteen_name=None):
                         available = dish.get("available_at", [])
                         active_canteens.update(available)
 
-    text = header
+    text = ""
     has_dishes = False
 
     # Itera sulle categorie (es. Primi Piatti, Secondi Piatti)
@@ -254,34 +244,41 @@ def get_menu_text(date_str, meal_type, canteen_name=None):
                 text += "\n"
             
     if not has_dishes:
-        return f"{header}ʕ ´•̥̥̥ ᴥ•̥̥̥ ʔ Oh no... Nessun piatto disponibile per questa mensa."
+        return ""
 
     text += "ʕ•ᴥ•ʔﾉ♡ Buon Appetito!"
     return text
 
-def get_canteen_selection_keyboard():
+def get_canteen_selection_keyboard(site=None):
     """Tastiera per selezionare la mensa."""
+    site = site or REGISTRY.default
     buttons = []
     # Ordina per nome per consistenza
-    sorted_canteens = sorted(CANTEENS.items(), key=lambda x: x[1])
+    sorted_canteens = sorted(site.canteens.items(), key=lambda x: x[1])
     
     # Aggiungi bottone TUTTE
-    buttons.append([InlineKeyboardButton("TUTTE", callback_data="sel_canteen|all")])
+    buttons.append([InlineKeyboardButton("TUTTE", callback_data=site.callback("sel_canteen|all"))])
 
     for c_id, c_name in sorted_canteens:
         # Pulisci o accorcia il nome se serve, per ora usiamo il nome completo
         clean_name = c_name.replace("Mensa ", "")
-        buttons.append([InlineKeyboardButton(clean_name, callback_data=f"sel_canteen|{c_id}")])
+        buttons.append([InlineKeyboardButton(clean_name, callback_data=site.callback(f"sel_canteen|{c_id}"))])
+
+    # Passaggio agli altri siti (es. mense di Firenze)
+    for other in REGISTRY.sites:
+        if other is not site:
+            buttons.append([InlineKeyboardButton(f"MENSE {other.label}", callback_data=other.callback("sel_canteen|reset"))])
         
     return InlineKeyboardMarkup(buttons)
 
-def get_keyboard(date_str, meal_type, canteen_id, is_inline=False):
+def get_keyboard(date_str, meal_type, canteen_id, is_inline=False, site=None):
     """Crea la tastiera inline con i pulsanti di navigazione."""
+    site = site or REGISTRY.default
     
     # Bottone per cambiare pasto (Pranzo <-> Cena)
     other_meal = "Cena" if meal_type == "Pranzo" else "Pranzo"
     # callback_data format: action|date|meal|canteen_id
-    toggle_button = InlineKeyboardButton(other_meal.upper(), callback_data=f"toggle|{date_str}|{other_meal}|{canteen_id}")
+    toggle_button = InlineKeyboardButton(other_meal.upper(), callback_data=site.callback(f"toggle|{date_str}|{other_meal}|{canteen_id}"))
     
     try:
         current_date_obj = datetime.strptime(date_str, "%Y-%m-%d")
@@ -295,18 +292,18 @@ def get_keyboard(date_str, meal_type, canteen_id, is_inline=False):
     # Logica bottone centrale (Oggi/Home)
     if not is_inline and date_str == today_date:
         # Se NON è inline e siamo già a oggi, torna alla selezione mense
-        center_callback = "sel_canteen|reset"
+        center_callback = site.callback("sel_canteen|reset")
     else:
         # Altrimenti (inline o data diversa da oggi), torna sempre a oggi per la stessa mensa
-        center_callback = f"nav|{today_date}|{meal_type}|{canteen_id}"
+        center_callback = site.callback(f"nav|{today_date}|{meal_type}|{canteen_id}")
 
     nav_buttons = [
-        InlineKeyboardButton("◀︎\uFE0E", callback_data=f"nav|{prev_date}|{meal_type}|{canteen_id}"),
+        InlineKeyboardButton("◀︎\uFE0E", callback_data=site.callback(f"nav|{prev_date}|{meal_type}|{canteen_id}")),
         InlineKeyboardButton("○︎\uFE0E", callback_data=center_callback),
-        InlineKeyboardButton("▶︎\uFE0E", callback_data=f"nav|{next_date}|{meal_type}|{canteen_id}"),
+        InlineKeyboardButton("▶︎\uFE0E", callback_data=site.callback(f"nav|{next_date}|{meal_type}|{canteen_id}")),
     ]
     
-    orario_button = InlineKeyboardButton("ORARIO", callback_data=f"orario|{date_str}|{meal_type}|{canteen_id}")
+    orario_button = InlineKeyboardButton("ORARIO", callback_data=site.callback(f"orario|{date_str}|{meal_type}|{canteen_id}"))
     
     keyboard = [
         nav_buttons,
@@ -321,12 +318,28 @@ def format_date_it(date_obj):
     months = ["", "GEN", "FEB", "MAR", "APR", "MAG", "GIU", "LUG", "AGO", "SET", "OTT", "NOV", "DIC"]
     return f"{days[date_obj.weekday()]} {date_obj.day} {months[date_obj.month]}"
 
-def get_dish_schedule(dish_name):
-    """Genera il testo con la lista delle future occorrenze del piatto (senza emoji)."""
-    target_clean = dish_name.strip().upper()
+def get_dish_occurrences(target_clean, today, site=None):
+    """Occorrenze future del piatto: query indicizzata su menu.db, altrimenti scansione del menu."""
+    site = site or REGISTRY.default
+    if site.db is not None:
+        try:
+            rows = site.db.dish_schedule(target_clean, start=today.isoformat())
+        except sqlite3.Error as e:
+            logger.error(f"Errore query menu.db: {e}")
+        else:
+            occurrences = []
+            for row in rows:
+                menu_date = datetime.strptime(row["date"], "%Y-%m-%d").date()
+                occurrences.append({
+                    "date": menu_date,
+                    "diff": (menu_date - today).days,
+                    "meal": "P" if row["meal"] == "Pranzo" else "C",
+                    "canteens": row["canteens"]
+                })
+            return occurrences
+
     occurrences = []
-    today = datetime.now(pytz.timezone('Europe/Rome')).date()
-    sorted_dates = sorted(MENU.keys())
+    sorted_dates = sorted(site.menu.keys())
     
     for date_str in sorted_dates:
         try:
@@ -338,7 +351,7 @@ def get_dish_schedule(dish_name):
              continue
              
         days_diff = (menu_date - today).days
-        day_menu = MENU[date_str]
+        day_menu = site.menu[date_str]
         
         for meal in ["Pranzo", "Cena"]:
              if meal in day_menu:
@@ -370,8 +383,61 @@ def get_dish_schedule(dish_name):
                          "meal": "P" if meal == "Pranzo" else "C",
                          "canteens": unique_canteens
                      })
-    
-    if not occurrences:
+    return occurrences
+
+def get_dish_stats_text(target_clean, today, site=None):
+    """Vista statistiche del piatto: frequenza, prima/ultima volta, intervallo medio, giorni della settimana."""
+    site = site or REGISTRY.default
+    stats = site.stats.get(normalize_name(target_clean))
+    if not stats:
+        return f"*{target_clean}*\n\nNessuna statistica disponibile: il piatto non compare nello storico."
+
+    days_short = ["LUN", "MAR", "MER", "GIO", "VEN", "SAB", "DOM"]
+    months_short = ["", "GEN", "FEB", "MAR", "APR", "MAG", "GIU", "LUG", "AGO", "SET", "OTT", "NOV", "DIC"]
+
+    def fmt(date_str):
+        d = datetime.strptime(date_str, "%Y-%m-%d").date()
+        return f"{d.day} {months_short[d.month]} {d.year % 100:02d}"
+
+    def fmt_gap(gap):
+        return f"~{gap:g}G" if gap is not None else "-"
+
+    last_ago = (today - datetime.strptime(stats["last"], "%Y-%m-%d").date()).days
+    lines = [
+        f"SERVITO  {stats['n']} VOLTE (P {stats['meals'][0]}, C {stats['meals'][1]})",
+        f"PRIMA    {fmt(stats['first'])}",
+        f"ULTIMA   {fmt(stats['last'])} ({last_ago}G FA)",
+        f"OGNI     {fmt_gap(stats['gap'])}",
+        "",
+    ]
+    wd = [f"{days_short[i]} {n:<3}" for i, n in enumerate(stats["wd"])]
+    lines.append("  ".join(wd[:4]).rstrip())
+    lines.append("  ".join(wd[4:]).rstrip())
+
+    if stats["canteens"]:
+        lines.append("")
+        for canteen, c_stats in stats["canteens"].items():
+            c_clean = canteen.replace("Mensa ", "").upper()
+            lines.append(f"{c_clean[:10]:<10} {c_stats['n']:>4} {fmt(c_stats['last']):<9} {fmt_gap(c_stats['gap'])}")
+
+    return "\n".join([f"*{target_clean}*", "", "```"] + lines + ["```"])
+
+def get_dish_schedule(dish_name, view="schedule", site=None):
+    """Genera il testo con la lista delle future occorrenze del piatto (senza emoji).
+    view="stats" mostra invece le statistiche calcolate dallo storico."""
+    site = site or REGISTRY.default
+    target_clean = dish_name.strip().upper()
+    today = datetime.now(pytz.timezone('Europe/Rome')).date()
+    if view == "stats":
+        return get_dish_stats_text(target_clean, today, site)
+    occurrences = get_dish_occurrences(target_clean, today, site)
+    # Previsioni precalcolate: solo date future, già oltre l'ultimo giorno pubblicato
+    predictions = [
+        p for p in site.predictions.get(normalize_name(target_clean), [])
+        if p[0] > today.isoformat()
+    ]
+
+    if not occurrences and not predictions:
         return f"*{target_clean}*\n\nNessuna occorrenza futura trovata."
 
     # Costruisci il messaggio
@@ -388,17 +454,15 @@ def get_dish_schedule(dish_name):
 
     MAX_OCC = 60
     has_more = len(occurrences) > MAX_OCC
-    
-    for occ in occurrences[:MAX_OCC]:
-        d = occ["date"]
+
+    def format_line(d, diff, meal_flag, canteens, suffix=""):
         wd = days_short[d.weekday()]
         day_month = f"{d.day} {months_short[d.month]}"
-        diff_str = f"{occ['diff']}G" # Accorciato GG in G
-        meal_flag = occ["meal"]
+        diff_str = f"{diff}G" # Accorciato GG in G
         
         # Mense: M. Martiri -> Martiri
         c_list = []
-        for c in occ["canteens"]:
+        for c in canteens:
             c_clean = c.replace("Mensa ", "").upper()
             c_list.append(c_clean)
         
@@ -414,31 +478,68 @@ def get_dish_schedule(dish_name):
         # meal (1) + 1 ("P")
         # c_str
         
-        line = f"{wd:<3} {day_month:<6} {diff_str:<4} {meal_flag} {c_str}"
-        list_lines.append(line)
+        return f"{wd:<3} {day_month:<6} {diff_str:<4} {meal_flag} {c_str}{suffix}"
+    
+    for occ in occurrences[:MAX_OCC]:
+        list_lines.append(format_line(occ["date"], occ["diff"], occ["meal"], occ["canteens"]))
         
     if has_more:
         list_lines.append("")
         list_lines.append(f"... {len(occurrences) - MAX_OCC} altre")
     
     # Unico blocco codice per allineamento
-    text_lines.append("```")
-    text_lines.extend(list_lines)
-    text_lines.append("```")
+    if list_lines:
+        text_lines.append("```")
+        text_lines.extend(list_lines)
+        text_lines.append("```")
+    else:
+        text_lines.append("Nessuna data pubblicata.")
+
+    # Previsioni: blocco separato ed etichettato, con la confidenza
+    if predictions and not has_more:
+        text_lines.append("")
+        text_lines.append("*PREVISIONI* (non ufficiali, dalla rotazione dei menu)")
+        text_lines.append("```")
+        for date_str, meal_flag, canteens, confidence in predictions:
+            d = datetime.strptime(date_str, "%Y-%m-%d").date()
+            text_lines.append(format_line(d, (d - today).days, meal_flag, canteens, f" ~{confidence:.0%}"))
+        text_lines.append("```")
     
     return "\n".join(text_lines)
 
-def get_update_keyboard(dish_name):
-    """Tastiera con bottone Aggiorna per i risultati di ricerca."""
+def get_dish_history_text(entry, today):
+    """Testo per un risultato della ricerca nello storico (s:): ultima volta per mensa."""
+    months_short = ["", "GEN", "FEB", "MAR", "APR", "MAG", "GIU", "LUG", "AGO", "SET", "OTT", "NOV", "DIC"]
+    lines = []
+    for c in entry["canteens"]:
+        d = datetime.strptime(c["last"], "%Y-%m-%d").date()
+        c_clean = c["canteen"].replace("Mensa ", "").upper()
+        day_month = f"{d.day} {months_short[d.month]} {d.year % 100:02d}"
+        meal_flag = "P" if c["meal"] == "Pranzo" else "C"
+        lines.append(f"{c_clean[:10]:<10} {day_month:<9} {meal_flag} {(today - d).days}G FA")
+    return "\n".join([f"*{entry['name']}*", "", "*ULTIMA VOLTA*", "```"] + lines + ["```"])
+
+def get_update_keyboard(dish_name, view="schedule", site=None):
+    """Tastiera con bottone Aggiorna e cambio vista (date / statistiche) per i risultati di ricerca."""
+    site = site or REGISTRY.default
     # Tagliamo il nome se troppo lungo per evitare errori API (limite 64 bytes totali)
     # upd| è 4 char, restano 60.
     safe_name = dish_name.strip().upper()
     if len(safe_name.encode('utf-8')) > 50:
          safe_name = safe_name[:50]
          
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("AGGIORNA", callback_data=f"upd|{safe_name}")]
-    ])
+    if view == "history":
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton("PROSSIME DATE", callback_data=site.callback(f"upd|{safe_name}")),
+            InlineKeyboardButton("STATISTICHE", callback_data=site.callback(f"stats|{safe_name}"))
+        ]])
+    if view == "stats":
+        refresh, switch = InlineKeyboardButton("AGGIORNA", callback_data=site.callback(f"stats|{safe_name}")), \
+            InlineKeyboardButton("PROSSIME DATE", callback_data=site.callback(f"upd|{safe_name}"))
+    else:
+        refresh, switch = InlineKeyboardButton("AGGIORNA", callback_data=site.callback(f"upd|{safe_name}")), \
+            InlineKeyboardButton("STATISTICHE", callback_data=site.callback(f"stats|{safe_name}"))
+    return InlineKeyboardMarkup([[refresh, switch]])
 
 # --- FUNZIONI PER ORARI MENSE ---
 DAYS_REV = ["LUN", "MAR", "MER", "GIO", "VEN", "SAB", "DOM"]
@@ -631,14 +732,15 @@ def format_canteen_info_for_day(canteen, date_str):
                          
     return "\n".join(message_lines)
 
-def format_all_canteens_info_for_today():
+def format_all_canteens_info_for_today(site=None):
     """Genera il testo HTML con gli orari di tutte le mense per oggi."""
+    site = site or REGISTRY.default
     tz = pytz.timezone('Europe/Rome')
     today_date = datetime.now(tz).date()
     date_str = today_date.strftime("%Y-%m-%d")
     
     blocks = []
-    for canteen in CANTEENS_FULL:
+    for canteen in site.canteens_full:
         blocks.append(format_canteen_info_for_day(canteen, date_str))
         
     return "\n\n".join(blocks)
@@ -701,10 +803,11 @@ def format_canteen_info(canteen):
 
     return "\n".join(message_lines)
 
-def get_info_keyboard(canteen_id):
+def get_info_keyboard(canteen_id, site=None):
     """Tastiera per aggiornare le info della mensa."""
+    site = site or REGISTRY.default
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("AGGIORNA", callback_data=f"upd_info|{canteen_id}")]
+        [InlineKeyboardButton("AGGIORNA", callback_data=site.callback(f"upd_info|{canteen_id}"))]
     ])
 
 def get_rates_for_isee(isee_value):
@@ -777,7 +880,8 @@ def get_rate_message_text(band, note=None):
 
 async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Gestisce le ricerche inline dei piatti."""
-    query = update.inline_query.query
+    # Alias del sito in testa alla query (es. "fi p:arista"); senza alias il sito principale
+    site, query = REGISTRY.route_query(update.inline_query.query)
     results = []
 
     # Se la query è vuota, mostra il menu di ogni mensa
@@ -786,10 +890,10 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         meal_type = "Pranzo"
         
         # --- AGGIUNTA VOCE TUTTE ---
-        text_all = get_menu_text(today, meal_type, canteen_name="TUTTE")
+        text_all = get_menu_text(today, meal_type, canteen_name="TUTTE", site=site)
         
         # is_inline=True così il bottone centrale ricarica la stessa vista e non prova a tornare indietro
-        reply_markup_all = get_keyboard(today, meal_type, canteen_id="all", is_inline=True)
+        reply_markup_all = get_keyboard(today, meal_type, canteen_id="all", is_inline=True, site=site)
         
         results.append(
             InlineQueryResultArticle(
@@ -803,13 +907,13 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         
         # Ordiniamo le mense alfabeticamente
-        sorted_canteens = sorted(CANTEENS.items(), key=lambda x: x[1])
+        sorted_canteens = sorted(site.canteens.items(), key=lambda x: x[1])
         
         for c_id, c_name in sorted_canteens:
             # Testo e tastiera specifici per ogni mensa
-            text = get_menu_text(today, meal_type, canteen_name=c_name)
+            text = get_menu_text(today, meal_type, canteen_name=c_name, site=site)
             # Passiamo is_inline=True così il bottone centrale NON torna alla selezione mense
-            reply_markup = get_keyboard(today, meal_type, canteen_id=c_id, is_inline=True)
+            reply_markup = get_keyboard(today, meal_type, canteen_id=c_id, is_inline=True, site=site)
             
             clean_name = c_name.upper() # Nome mensa in CAPS
             
@@ -833,6 +937,13 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 "text": "*COME CERCARE UN PIATTO*\n\nVuoi sapere dove fanno l'arista o le lasagne?\nDigita nella chat:\n`@cibounipibot p:nome_piatto`\n\n_Esempio:_ `@cibounipibot p:Arista`\n\nIl bot ti mostrerà in quali mense e in quali giorni dei prossimi menù sarà disponibile!",
                 "thumb": "https://raw.githubusercontent.com/plumkewe/mense-unipi-bot/main/assets/icons/info.png?v=2"
             },
+            {
+                "id": "inst_s",
+                "title": "Cerca nello Storico",
+                "desc": "s:<piatto>@<mensa> (es. s:Arista@Martiri)",
+                "text": "*QUANDO L'HANNO FATTO L'ULTIMA VOLTA?*\n\nVuoi sapere quando è stato servito un piatto nei menù passati?\nDigita nella chat:\n`@cibounipibot s:nome_piatto`\n\n_Esempi:_\n`@cibounipibot s:Lasagne`\n`@cibounipibot s:Arista@Martiri` (solo in una mensa)\n\nIl bot ti mostrerà l'ultima volta che è stato servito in ogni mensa.",
+                "thumb": "https://raw.githubusercontent.com/plumkewe/mense-unipi-bot/main/assets/icons/info.png?v=2"
+            },
             {
                 "id": "inst_i",
                 "title": "Informazioni Mense",
@@ -895,7 +1006,7 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         # Se la query è solo "i:", mostra lista mense per info
         search_term = query[2:].strip().lower()
         
-        for canteen in CANTEENS_FULL:
+        for canteen in site.canteens_full:
             c_name = canteen["name"]
             c_id = canteen["id"]
             
@@ -903,7 +1014,7 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 seats = canteen.get("seats", "N/D")
                 
                 message_text = format_canteen_info(canteen)
-                reply_markup = get_info_keyboard(c_id)
+                reply_markup = get_info_keyboard(c_id, site)
 
                 results.append(
                     InlineQueryResultArticle(
@@ -1016,6 +1127,60 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.inline_query.answer(results, cache_time=0)
         return
 
+    # Intercetta query che iniziano con "s:" per la ricerca nello storico (s:piatto@mensa)
+    if query.lower().startswith("s:"):
+        search_term, _, canteen_term = query[2:].partition("@")
+        search_term, canteen_term = search_term.strip(), canteen_term.strip().lower()
+        today = datetime.now(pytz.timezone('Europe/Rome')).date()
+
+        canteen = None
+        if canteen_term:
+            canteen = next((c for c in sorted(site.canteens.values()) if canteen_term in c.lower()), None)
+            if canteen is None:
+                button = InlineQueryResultsButton(text="Mensa non trovata!", start_parameter="help")
+                await update.inline_query.answer([], cache_time=0, button=button)
+                return
+
+        if site.db is None or not search_term:
+            text = "Storico non disponibile!" if site.db is None else "Scrivi il nome di un piatto!"
+            button = InlineQueryResultsButton(text=text, start_parameter="help")
+            await update.inline_query.answer([], cache_time=0, button=button)
+            return
+
+        try:
+            found = site.db.last_served(search_term, canteen=canteen, before=today.isoformat(), limit=49)
+        except sqlite3.Error as e:
+            logger.error(f"Errore query menu.db: {e}")
+            found = []
+
+        for entry in found:
+            last_date = datetime.strptime(entry["last"], "%Y-%m-%d").date()
+            days_ago = (today - last_date).days
+            canteen_desc = ", ".join(c["canteen"].replace("Mensa ", "").upper() for c in entry["canteens"])
+            thumb_url = (
+                f"https://raw.githubusercontent.com/plumkewe/mense-unipi-bot/main/assets/numbers/{days_ago}.png?v=5"
+                if days_ago <= 100 else
+                "https://raw.githubusercontent.com/plumkewe/mense-unipi-bot/main/assets/icons/info.png?v=2"
+            )
+            results.append(
+                InlineQueryResultArticle(
+                    id=str(uuid4()),
+                    title=entry["name"],
+                    description=f"ULTIMA: {format_date_it(last_date)} {last_date.year}  ({days_ago}G FA)\n{canteen_desc}",
+                    thumbnail_url=thumb_url,
+                    input_message_content=InputTextMessageContent(
+                        get_dish_history_text(entry, today), parse_mode=ParseMode.MARKDOWN
+                    ),
+                    reply_markup=get_update_keyboard(entry["name"], view="history", site=site)
+                )
+            )
+
+        button = None
+        if not results:
+            button = InlineQueryResultsButton(text="Mai servito!", start_parameter="help")
+        await update.inline_query.answer(results, cache_time=5, button=button)
+        return
+
     # Intercetta solo le query che iniziano con "p:"
     if not query.lower().startswith("p:"):
         return
@@ -1027,7 +1192,7 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     today = datetime.now(pytz.timezone('Europe/Rome')).date()
     
     # Ordina le date del menu
-    sorted_dates = sorted(MENU.keys())
+    sorted_dates = sorted(site.menu.keys())
     
     seen_dishes = set()
     count = 0
@@ -1047,7 +1212,7 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         days_diff = (menu_date - today).days
         
         # Cerca nei pasti
-        day_menu = MENU[date_str]
+        day_menu = site.menu[date_str]
         
         for meal in ["Pranzo", "Cena"]:
             if meal in day_menu:
@@ -1090,8 +1255,8 @@ async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                              result_id = str(uuid4())
                              
                              # Costruisci il messaggio con la lista di tutte le occorrenze future
-                             content_text = get_dish_schedule(clean_dish_name)
-                             reply_markup = get_update_keyboard(clean_dish_name)
+                             content_text = get_dish_schedule(clean_dish_name, site=site)
+                             reply_markup = get_update_keyboard(clean_dish_name, site=site)
 
                              results.append(
                                  InlineQueryResultArticle(
@@ -1118,7 +1283,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"*Benvenuto/a* nel *CIBOUNIPI BOT*! 🍱\n\n"
         "Sono qui per aiutarti a consultare i menù delle mense universitarie di Pisa. 🍕\n\n"
         "🔍 *Ricerca Piatto*\n"
-        "Digita `@cibounipibot p:nome piatto` in qualsiasi chat.\n\n"
+        "Digita `@cibounipibot p:nome piatto` in qualsiasi chat.\n"
+        "Con `s:nome piatto` cerchi nei menù passati.\n\n"
         "📅 *Menu di Oggi*\n"
         "Digita `@cibounipibot` (seguito da spazio) in qualsiasi chat e seleziona la mensa.\n\n"
         "🕒 *Info & Orari*\n"
@@ -1135,6 +1301,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     keyboard = [
         [InlineKeyboardButton("Menu di Oggi", switch_inline_query_current_chat="")],
         [InlineKeyboardButton("Cerca Piatto", switch_inline_query_current_chat="p:")],
+        [InlineKeyboardButton("Cerca nello Storico", switch_inline_query_current_chat="s:")],
         [InlineKeyboardButton("Informazioni Mense", switch_inline_query_current_chat="i:")],
         [InlineKeyboardButton("Calcola Tariffa", switch_inline_query_current_chat="t:")],
         [InlineKeyboardButton("Scegli Mensa", callback_data="sel_canteen|reset")],
@@ -1183,7 +1350,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/help - Mostra questo messaggio\n\n"
         "*1. Ricerca Piatto*\n"
         "Puoi cercare un piatto specifico (es. \"Pollo\") per scoprire quando e dove verrà servito.\n"
-        "Digita `@cibounipibot p:Arista` in qualsiasi chat.\n\n"
+        "Digita `@cibounipibot p:Arista` in qualsiasi chat.\n"
+        "Per i menù passati usa `s:` (es. `s:Arista@Martiri`): mostra l'ultima volta che è stato servito.\n\n"
         "*2. Menu di Oggi*\n"
         "Per vedere rapidamente il menu di oggi:\n"
         "Digita `@cibounipibot` (seguito da spazio) in qualsiasi chat e seleziona la mensa.\n\n"
@@ -1197,7 +1365,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "Una volta aperto un menu:\n"
         "◀︎\uFE0E ▶︎\uFE0E : Scorri i giorni (Precedente / Successivo)\n"
         "○︎\uFE0E : Torna ad oggi (o alla lista mense)\n"
-        "PRANZO / CENA : Cambia il pasto visualizzato" +
+        "PRANZO / CENA : Cambia il pasto visualizzato\n\n"
+        "*6. Mense di Firenze*\n"
+        "Anteponi `fi` a qualsiasi ricerca (es. `@cibounipibot fi p:Arista`) oppure scegli MENSE UNIFI da /menu." +
         FEEDBACK_TEXT
     )
     
@@ -1211,7 +1381,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer() 
 
-    data = query.data.split("|")
+    # Prefisso del sito (es. "fi:nav|..."); i bottoni senza prefisso sono del sito principale
+    site, raw_data = REGISTRY.route_callback(query.data)
+    data = raw_data.split("|")
     action = data[0]
 
     if action == "an_menu":
@@ -1222,10 +1394,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         if canteen_id == "all":
             canteen_name = "TUTTE"
         else:
-            canteen_name = CANTEENS.get(canteen_id)
-        text = get_menu_text(today, meal_type, canteen_name)
+            canteen_name = site.canteens.get(canteen_id)
+        text = get_menu_text(today, meal_type, canteen_name, site=site)
         reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("INDIETRO", callback_data="an_back")]
+            [InlineKeyboardButton("INDIETRO", callback_data=site.callback("an_back"))]
         ])
         try:
             await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
@@ -1235,8 +1407,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     if action == "an_back":
-        text = format_all_canteens_info_for_today()
-        keyboard = build_aperti_ora_keyboard()
+        text = format_all_canteens_info_for_today(site)
+        keyboard = build_aperti_ora_keyboard(site)
         try:
             await query.edit_message_text(text=text, reply_markup=keyboard, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
         except BadRequest as e:
@@ -1259,7 +1431,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         if canteen_id == "reset":
             text = "*Seleziona una mensa per vedere il menù:*"
-            reply_markup = get_canteen_selection_keyboard()
+            reply_markup = get_canteen_selection_keyboard(site)
             
             # Se il messaggio originale contiene "CIBOUNIPI BOT", è il messaggio di start
             # In questo caso mandiamo un NUOVO messaggio.
@@ -1274,22 +1446,23 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         if canteen_id == "all":
             canteen_name = "TUTTE"
         else:
-            canteen_name = CANTEENS.get(canteen_id)
+            canteen_name = site.canteens.get(canteen_id)
 
         current_date = datetime.now(pytz.timezone('Europe/Rome')).strftime("%Y-%m-%d")
         meal_type = "Pranzo" # Default
         
-        text = get_menu_text(current_date, meal_type, canteen_name)
-        reply_markup = get_keyboard(current_date, meal_type, canteen_id)
+        text = get_menu_text(current_date, meal_type, canteen_name, site=site)
+        reply_markup = get_keyboard(current_date, meal_type, canteen_id, site=site)
         
         # Modifica il messaggio esistente
         await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
         return
 
-    if action == "upd":
+    if action in ("upd", "stats"):
         dish_name = data[1]
-        text = get_dish_schedule(dish_name)
-        reply_markup = get_update_keyboard(dish_name)
+        view = "stats" if action == "stats" else "schedule"
+        text = get_dish_schedule(dish_name, view=view, site=site)
+        reply_markup = get_update_keyboard(dish_name, view=view, site=site)
         try:
             await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
         except Exception:
@@ -1299,12 +1472,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if action == "upd_info":
         canteen_id = data[1]
         # Trova la mensa nei dati completi
-        canteen = next((c for c in CANTEENS_FULL if c["id"] == canteen_id), None)
+        canteen = next((c for c in site.canteens_full if c["id"] == canteen_id), None)
         
         if canteen:
             try:
                 text = format_canteen_info(canteen)
-                reply_markup = get_info_keyboard(canteen_id)
+                reply_markup = get_info_keyboard(canteen_id, site)
                 await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
             except BadRequest as e:
                 # Se il messaggio non è cambiato, ignoriamo l'errore
@@ -1324,12 +1497,12 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         blocks = []
         if canteen_id == "all":
             # Mostriamo gli orari per tutte le mense (solo query del giorno stesso)
-            sorted_canteens = sorted(CANTEENS_FULL, key=lambda x: x["name"])
+            sorted_canteens = sorted(site.canteens_full, key=lambda x: x["name"])
             for c in sorted_canteens:
                 blocks.append(format_canteen_info_for_day(c, date_str))
             text = "\n\n".join(blocks)
         else:
-            canteen = next((c for c in CANTEENS_FULL if c["id"] == canteen_id), None)
+            canteen = next((c for c in site.canteens_full if c["id"] == canteen_id), None)
             if canteen:
                 text = format_canteen_info_for_day(canteen, date_str)
             else:
@@ -1337,7 +1510,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
         reply_markup = InlineKeyboardMarkup([
             [InlineKeyboardButton("AGGIORNA", callback_data=query.data)],
-            [InlineKeyboardButton("INDIETRO", callback_data=f"nav|{date_str}|{meal_type}|{canteen_id}")]
+            [InlineKeyboardButton("INDIETRO", callback_data=site.callback(f"nav|{date_str}|{meal_type}|{canteen_id}"))]
         ])
         
         try:
@@ -1376,7 +1549,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if canteen_id == "all":
         canteen_name = "TUTTE"
     else:
-        canteen_name = CANTEENS.get(canteen_id)
+        canteen_name = site.canteens.get(canteen_id)
     
     # Se canteen_id è "None" (stringa) o non trovato, canteen_name è None -> mostra tutto (ma senza logica TUTTE)
     if canteen_id == "None":
@@ -1385,8 +1558,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Check if query is from inline message
     is_inline_msg = query.inline_message_id is not None
 
-    text = get_menu_text(date_str, meal_type, canteen_name)
-    reply_markup = get_keyboard(date_str, meal_type, canteen_id, is_inline=is_inline_msg)
+    text = get_menu_text(date_str, meal_type, canteen_name, site=site)
+    reply_markup = get_keyboard(date_str, meal_type, canteen_id, is_inline=is_inline_msg, site=site)
 
     try:
         if is_inline_msg:
@@ -1401,13 +1574,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     except Exception as e:
         logger.warning(f"Non è stato possibile aggiornare il messaggio: {e}")
 
-def build_aperti_ora_keyboard():
+def build_aperti_ora_keyboard(site=None):
     """Tastiera inline con i bottoni per ogni mensa sotto la risposta APERTE ORA."""
-    sorted_canteens = sorted(CANTEENS.items(), key=lambda x: x[1])
-    rows = [[InlineKeyboardButton("TUTTE", callback_data="an_menu|all")]]
+    site = site or REGISTRY.default
+    sorted_canteens = sorted(site.canteens.items(), key=lambda x: x[1])
+    rows = [[InlineKeyboardButton("TUTTE", callback_data=site.callback("an_menu|all"))]]
     for c_id, c_name in sorted_canteens:
         clean = c_name.replace("Mensa ", "")
-        rows.append([InlineKeyboardButton(clean, callback_data=f"an_menu|{c_id}")])
+        rows.append([InlineKeyboardButton(clean, callback_data=site.callback(f"an_menu|{c_id}"))])
     return InlineKeyboardMarkup(rows)
 
 async def handle_aperti_ora(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1435,6 +1609,22 @@ async def self_ping(context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Ping fallito: {e}")
 
+async def refresh_menu(context: ContextTypes.DEFAULT_TYPE):
+    """Applica ai siti già caricati le nuove run di smart_update (menu_changes.json)."""
+    for site in REGISTRY.loaded():
+        # Lettura dei JSON e ricostruzione di menu.db fuori dall'event loop; lo scambio dei dati avviene qui
+        try:
+            update = await asyncio.to_thread(site.prepare_refresh)
+        except Exception as e:
+            # Nessuno stato toccato: il prossimo giro riprova la stessa run
+            logger.error(f"[{site.label}] Ricarica del menu fallita: {e}")
+            continue
+        result = site.apply_refresh(update) if update else None
+        if result:
+            previous, sequence, services, dropped = result
+            logger.info(f"[{site.label}] Menu ricaricato: run #{previous} -> #{sequence}, "
+                        f"{services} servizi cambiati, {dropped} testi invalidati.")
+
 def main() -> None:
     """Avvia il bot."""
     # Recupera il token dalle variabili d'ambiente (GitHub Secrets)
@@ -1457,6 +1647,10 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(InlineQueryHandler(inline_query))
 
+    # Controlla ogni 5 minuti se c'è una nuova run di smart_update da applicare
+    if application.job_queue:
+        application.job_queue.run_repeating(refresh_menu, interval=300, first=300)
+
     # Configurazione Webhook (per Render) o Polling (locale)
     PORT = int(os.environ.get("PORT", "8443"))
     WEBHOOK_URL = os.environ.get("RENDER_EXTERNAL_URL")
@@ -0,0 +1,210 @@
+"""
+Scritture atomiche dei file dati e manifest degli hash.
+
+Tutti gli script che scrivono in data/ passano da qui invece di aprire il
+file in 'w': un crash a metà o un lettore concorrente (il bot che ricarica
+i menu) non vedono mai un file troncato.
+
+- atomic_write(): scrive in un file temporaneo nella stessa directory,
+  fsync, os.replace() sul file finale, fsync della directory.
+- write_data() / write_json(): come sopra, più la voce del file nel
+  manifest della sua directory (data/manifest.json, data/unifi/manifest.json):
+
+    {
+      "version": 1,
+      "files": {
+        "menu.json": {"sha256": "9f2c...", "bytes": 182734},
+        ...
+      }
+    }
+
+  Se il contenuto è identico a quello già su disco il file non viene
+  riscritto (mtime invariato).
+
+I lettori confrontano file_version() con l'hash visto l'ultima volta e
+ri-parsano il file solo se è cambiato. Il manifest è aggiornato solo da
+write_data(): dopo una modifica a mano va rigenerato con
+
+    python scripts/data_io.py rebuild [--data-dir data/unifi]
+    python scripts/data_io.py verify
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# File dati di un sito registrati nel manifest da `rebuild`
+TRACKED_FILES = [
+    'menu.json', 'menu_today.json', 'menu_changes.json', 'scrape_state.json',
+    'dish_stats.json', 'dish_predictions.json', 'canteens.json', 'feste.json',
+    'rates.json', 'combinations.json', 'shortcuts.json', 'subsandcarnets.json',
+]
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def sha256_bytes(blob):
+    return hashlib.sha256(blob).hexdigest()
+
+
+def _fsync_dir(directory):
+    # Rende persistente il rename; non supportato su Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data):
+    """Scrive `data` (str o bytes) in `path` con tmp + fsync + rename. Ritorna lo sha256 del contenuto."""
+    blob = data.encode('utf-8') if isinstance(data, str) else data
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp crea il file 0600: manteniamo i permessi del file esistente
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+    return sha256_bytes(blob)
+
+
+def manifest_path(data_dir):
+    return os.path.join(data_dir, MANIFEST_FILENAME)
+
+
+def load_manifest(data_dir):
+    """manifest.json di una directory come dict; vuoto se manca, è illeggibile o di un'altra versione."""
+    try:
+        with open(manifest_path(data_dir), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, ValueError):
+        return {'version': MANIFEST_VERSION, 'files': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'files': {}}
+    manifest.setdefault('files', {})
+    return manifest
+
+
+def save_manifest(data_dir, manifest):
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'files': {name: manifest['files'][name] for name in sorted(manifest['files'])},
+    }
+    atomic_write(manifest_path(data_dir), json.dumps(manifest, indent=2, ensure_ascii=False) + '\n')
+
+
+def file_version(data_dir, filename):
+    """sha256 di un file secondo il manifest (None se non registrato)."""
+    return load_manifest(data_dir)['files'].get(filename, {}).get('sha256')
+
+
+def _current_hash(path):
+    try:
+        with open(path, 'rb') as f:
+            return sha256_bytes(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def write_data(path, data):
+    """
+    Scrittura atomica di un file dati + aggiornamento del manifest della sua
+    directory. Se il contenuto non cambia il file non viene toccato.
+    Ritorna (sha256, scritto).
+    """
+    blob = data.encode('utf-8') if isinstance(data, str) else data
+    digest = sha256_bytes(blob)
+    written = _current_hash(path) != digest
+    if written:
+        atomic_write(path, blob)
+
+    data_dir = os.path.dirname(os.path.abspath(path))
+    manifest = load_manifest(data_dir)
+    entry = {'sha256': digest, 'bytes': len(blob)}
+    if manifest['files'].get(os.path.basename(path)) != entry:
+        manifest['files'][os.path.basename(path)] = entry
+        save_manifest(data_dir, manifest)
+    return digest, written
+
+
+def write_json(path, obj, indent=None, sort_keys=False, trailing_newline=False):
+    """json.dump atomico: minificato senza indent, altrimenti come json.dump(indent=...)."""
+    separators = (',', ':') if indent is None else None
+    text = json.dumps(obj, indent=indent, separators=separators, sort_keys=sort_keys, ensure_ascii=False)
+    if trailing_newline:
+        text += '\n'
+    return write_data(path, text)
+
+
+def rebuild_manifest(data_dir):
+    """Ricalcola il manifest dai file presenti. Ritorna il numero di file registrati."""
+    manifest = {'version': MANIFEST_VERSION, 'files': {}}
+    for filename in TRACKED_FILES:
+        path = os.path.join(data_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            blob = f.read()
+        manifest['files'][filename] = {'sha256': sha256_bytes(blob), 'bytes': len(blob)}
+    save_manifest(data_dir, manifest)
+    return len(manifest['files'])
+
+
+def verify_manifest(data_dir):
+    """Confronta gli hash del manifest con i file su disco. Ritorna la lista dei problemi."""
+    problems = []
+    for filename, entry in load_manifest(data_dir)['files'].items():
+        digest = _current_hash(os.path.join(data_dir, filename))
+        if digest is None:
+            problems.append(f"{filename}: file mancante")
+        elif digest != entry['sha256']:
+            problems.append(f"{filename}: hash diverso dal manifest")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manifest degli hash dei file dati.")
+    parser.add_argument("command", choices=['rebuild', 'verify'],
+                        help="rebuild: ricalcola il manifest dai file; verify: controlla gli hash.")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR,
+                        help="Directory dati del sito (default: data/).")
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        count = rebuild_manifest(args.data_dir)
+        print(f"{MANIFEST_FILENAME} rigenerato: {count} file.")
+        return
+
+    problems = verify_manifest(args.data_dir)
+    for problem in problems:
+        print(f"  ✗ {problem}")
+    count = len(load_manifest(args.data_dir)['files'])
+    print(f"{count} file nel manifest: {'OK' if not problems else f'{len(problems)} problemi'}")
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Previsione delle prossime date dei piatti oltre il menu pubblicato.
+
+I menu delle mense seguono una rotazione di più settimane. Per ogni mensa:
+1. detect_cycle(): per k = 1..MAX_CYCLE_WEEKS confronta ogni servizio
+   (data + pasto) con quello di k settimane prima (similarità di Jaccard
+   tra gli insiemi di piatti) e sceglie il k con similarità media più alta.
+2. predict(): per ogni data oltre l'ultimo giorno pubblicato guarda gli
+   stessi servizi 1, 2, ... cicli prima (solo dati reali) e stima per ogni
+   piatto una confidenza = similarità del ciclo * (presenze + 1) / (ancore + 2).
+
+Il risultato viene scritto in data/dish_predictions.json già indicizzato per
+nome normalizzato, così il bot fa solo un lookup:
+
+{
+  "version": 1,
+  "published_until": "2026-11-08",
+  "cycles": {"Mensa Martiri": {"weeks": 5, "similarity": 0.75}},
+  "dishes": {"PASTA POMODORO": [["2026-11-09", "P", ["Mensa Martiri"], 0.62], ...]}
+}
+
+    python scripts/dish_predictions.py [--data-dir data/unifi] [--backtest 4]
+"""
+import argparse
+import datetime
+import json
+import os
+
+from data_io import write_json
+from history_store import HistoryStore
+from menu_db import normalize_name
+from menu_format import load_menu
+
+PREDICTIONS_FILENAME = 'dish_predictions.json'
+PREDICTIONS_VERSION = 1
+
+MAX_CYCLE_WEEKS = 8
+MIN_CYCLE_SIMILARITY = 0.5   # sotto questa soglia la mensa non ha una rotazione affidabile
+MIN_CYCLE_SAMPLES = 20       # coppie di servizi confrontate per accettare un ciclo
+LOOKBACK_CYCLES = 3          # cicli passati usati come ancore
+HORIZON_WEEKS = 6            # settimane previste oltre il menu pubblicato
+MIN_CONFIDENCE = 0.3
+MAX_PER_DISH = 10
+
+MEAL_ORDER = ['Pranzo', 'Cena']
+MEAL_SHORT = {'Pranzo': 'P', 'Cena': 'C'}
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def build_services(days):
+    """
+    days: iterabile di (date_str, giorno).
+    Returns {canteen: {(date_obj, meal): set(nomi normalizzati)}}
+    """
+    services = {}
+    for date_str, day in days:
+        try:
+            date_obj = datetime.date.fromisoformat(date_str)
+        except ValueError:
+            continue
+        for meal in MEAL_ORDER:
+            for dishes in (day.get(meal) or {}).values():
+                for dish in dishes or []:
+                    if not isinstance(dish, dict):
+                        continue
+                    name = normalize_name(dish.get('name', ''))
+                    for canteen in dish.get('available_at', []):
+                        services.setdefault(canteen, {}).setdefault((date_obj, meal), set()).add(name)
+    return services
+
+
+def detect_cycle(canteen_services):
+    """(settimane, similarità) della rotazione di una mensa, oppure (None, similarità migliore)."""
+    best_k, best_sim = None, 0.0
+    for k in range(1, MAX_CYCLE_WEEKS + 1):
+        shift = datetime.timedelta(weeks=k)
+        sims = []
+        for (date_obj, meal), dishes in canteen_services.items():
+            previous = canteen_services.get((date_obj - shift, meal))
+            if previous:
+                sims.append(len(dishes & previous) / len(dishes | previous))
+        if len(sims) < MIN_CYCLE_SAMPLES:
+            continue
+        sim = sum(sims) / len(sims)
+        if sim > best_sim:
+            best_k, best_sim = k, sim
+    if best_sim < MIN_CYCLE_SIMILARITY:
+        return None, round(best_sim, 3)
+    return best_k, round(best_sim, 3)
+
+
+def predict(services, start, end):
+    """
+    Previsioni per le date in [start, end] usando solo i servizi reali (< start).
+    Returns (cycles, {nome: {(date_obj, meal): {canteen: confidenza}}})
+    """
+    cycles = {}
+    predicted = {}
+    for canteen, canteen_services in sorted(services.items()):
+        known = {key: dishes for key, dishes in canteen_services.items() if key[0] < start}
+        weeks, similarity = detect_cycle(known)
+        cycles[canteen] = {'weeks': weeks, 'similarity': similarity}
+        if weeks is None:
+            continue
+
+        date_obj = start
+        while date_obj <= end:
+            for meal in MEAL_ORDER:
+                anchors = []
+                for j in range(1, LOOKBACK_CYCLES + 1):
+                    anchor = date_obj - datetime.timedelta(weeks=weeks * j)
+                    # Le ancore devono essere dati reali: per date lontane si salta ai cicli precedenti
+                    if anchor >= start:
+                        continue
+                    dishes = known.get((anchor, meal))
+                    if dishes:
+                        anchors.append(dishes)
+                if not anchors:
+                    continue
+                hits = {}
+                for dishes in anchors:
+                    for name in dishes:
+                        hits[name] = hits.get(name, 0) + 1
+                for name, count in hits.items():
+                    confidence = similarity * (count + 1) / (len(anchors) + 2)
+                    if confidence >= MIN_CONFIDENCE:
+                        slot = predicted.setdefault(name, {}).setdefault((date_obj, meal), {})
+                        slot[canteen] = round(confidence, 2)
+            date_obj += datetime.timedelta(days=1)
+    return cycles, predicted
+
+
+def build_index(cycles, predicted, published_until):
+    dishes = {}
+    for name in sorted(predicted):
+        rows = []
+        for (date_obj, meal), by_canteen in sorted(
+            predicted[name].items(), key=lambda kv: (kv[0][0], MEAL_ORDER.index(kv[0][1]))
+        ):
+            rows.append([date_obj.isoformat(), MEAL_SHORT[meal], sorted(by_canteen), max(by_canteen.values())])
+        dishes[name] = rows[:MAX_PER_DISH]
+    return {
+        'version': PREDICTIONS_VERSION,
+        'published_until': published_until.isoformat(),
+        'cycles': cycles,
+        'dishes': dishes,
+    }
+
+
+def update_predictions(data_dir, history=None, menu=None):
+    """Ricalcola dish_predictions.json per un sito. Ritorna l'indice scritto."""
+    if history is None:
+        history = HistoryStore(data_dir)
+    if menu is None:
+        menu = load_menu(os.path.join(data_dir, 'menu.json'))
+    all_days = history.load_all()
+    all_days.update(menu)
+
+    services = build_services(all_days.items())
+    known_dates = [d for d, day in all_days.items() if day.get('Pranzo') or day.get('Cena')]
+    published_until = datetime.date.fromisoformat(max(known_dates)) if known_dates else datetime.date.today()
+
+    start = published_until + datetime.timedelta(days=1)
+    end = published_until + datetime.timedelta(weeks=HORIZON_WEEKS)
+    cycles, predicted = predict(services, start, end)
+    index = build_index(cycles, predicted, published_until)
+
+    write_json(os.path.join(data_dir, PREDICTIONS_FILENAME), index)
+    return index
+
+
+def load_predictions(path):
+    """dish_predictions.json come dict; {} se manca, è illeggibile o di un'altra versione."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, ValueError):
+        return {}
+    if index.get('version') != PREDICTIONS_VERSION:
+        return {}
+    return index
+
+
+def backtest(services, cutoff, weeks):
+    """
+    Prevede [cutoff, cutoff + weeks) con i soli dati precedenti e confronta col reale.
+    Returns (precisione, richiamo, previsioni) a livello di (piatto, data, pasto, mensa).
+    """
+    end = cutoff + datetime.timedelta(weeks=weeks) - datetime.timedelta(days=1)
+    _, predicted = predict(services, cutoff, end)
+
+    guessed = {
+        (name, date_obj, meal, canteen)
+        for name, slots in predicted.items()
+        for (date_obj, meal), by_canteen in slots.items()
+        for canteen in by_canteen
+    }
+    actual = {
+        (name, date_obj, meal, canteen)
+        for canteen, canteen_services in services.items()
+        for (date_obj, meal), names in canteen_services.items()
+        if cutoff <= date_obj <= end
+        for name in names
+    }
+    hit = len(guessed & actual)
+    precision = hit / len(guessed) if guessed else 0.0
+    recall = hit / len(actual) if actual else 0.0
+    return precision, recall, len(guessed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prevede le prossime date dei piatti dalla rotazione dei menu.")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR,
+                        help="Directory dati del sito (default: data/).")
+    parser.add_argument("--backtest", type=int, default=0, metavar="SETTIMANE",
+                        help="Valuta le previsioni sulle ultime N settimane pubblicate invece di scrivere l'indice.")
+    parser.add_argument("--cutoff", type=datetime.date.fromisoformat, default=None,
+                        help="Con --backtest: prima data da prevedere (default: N settimane prima dell'ultima pubblicata).")
+    args = parser.parse_args()
+
+    if args.backtest:
+        history = HistoryStore(args.data_dir)
+        all_days = history.load_all()
+        all_days.update(load_menu(os.path.join(args.data_dir, 'menu.json')))
+        services = build_services(all_days.items())
+        cutoff = args.cutoff
+        if cutoff is None:
+            last = datetime.date.fromisoformat(max(all_days))
+            cutoff = last - datetime.timedelta(weeks=args.backtest) + datetime.timedelta(days=1)
+        precision, recall, count = backtest(services, cutoff, args.backtest)
+        print(f"Backtest dal {cutoff} ({args.backtest} settimane): {count} previsioni, "
+              f"precisione {precision:.0%}, richiamo {recall:.0%}")
+        return
+
+    index = update_predictions(args.data_dir)
+    for canteen, cycle in index['cycles'].items():
+        weeks = f"{cycle['weeks']} settimane" if cycle['weeks'] else "nessuna rotazione"
+        print(f"  {canteen}: {weeks} (similarità {cycle['similarity']})")
+    print(f"{PREDICTIONS_FILENAME} generato: {len(index['dishes'])} piatti previsti "
+          f"oltre il {index['published_until']}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Statistiche precalcolate sui piatti a partire dallo storico.
+
+Per ogni piatto (nome normalizzato) e per ogni mensa:
+  n      servizi (coppie data + pasto)
+  days   giorni distinti
+  first  prima data servita
+  last   ultima data servita
+  gap    intervallo medio in giorni tra due giorni consecutivi (null se servito una volta)
+  wd     distribuzione per giorno della settimana [lun, ..., dom]
+  meals  [pranzo, cena]
+
+Scritte in data/dish_stats.json (JSON minificato) dal job notturno: il bot
+le carica all'avvio e risponde con un lookup per nome, senza toccare lo storico.
+
+    python scripts/dish_stats.py [--data-dir data/unifi]
+"""
+import argparse
+import datetime
+import json
+import os
+
+from data_io import write_json
+from history_store import HistoryStore
+from menu_db import normalize_name
+
+STATS_FILENAME = 'dish_stats.json'
+STATS_VERSION = 1
+
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class _Acc:
+    """Accumulatore delle occorrenze di un piatto (totale o per mensa)."""
+    __slots__ = ('services', 'dates', 'wd', 'meals')
+
+    def __init__(self):
+        self.services = set()
+        self.dates = set()
+        self.wd = [0] * 7
+        self.meals = [0, 0]
+
+    def add(self, date_str, weekday, meal_idx):
+        if (date_str, meal_idx) in self.services:
+            return
+        self.services.add((date_str, meal_idx))
+        self.dates.add(date_str)
+        self.wd[weekday] += 1
+        self.meals[meal_idx] += 1
+
+    def to_dict(self):
+        dates = sorted(self.dates)
+        gap = None
+        if len(dates) > 1:
+            span = (datetime.date.fromisoformat(dates[-1]) - datetime.date.fromisoformat(dates[0])).days
+            gap = round(span / (len(dates) - 1), 1)
+        return {
+            'n': len(self.services),
+            'days': len(dates),
+            'first': dates[0],
+            'last': dates[-1],
+            'gap': gap,
+            'wd': self.wd,
+            'meals': self.meals,
+        }
+
+
+def compute_stats(days):
+    """
+    days: iterabile di (date_str, giorno) nella struttura di menu.json.
+    Returns il dict da salvare in dish_stats.json.
+    """
+    totals = {}
+    by_canteen = {}
+    first = last = None
+
+    for date_str, day in days:
+        try:
+            weekday = datetime.date.fromisoformat(date_str).weekday()
+        except ValueError:
+            continue
+        first = date_str if first is None or date_str < first else first
+        last = date_str if last is None or date_str > last else last
+        for meal_idx, meal in enumerate(MEAL_ORDER):
+            for dishes in (day.get(meal) or {}).values():
+                for dish in dishes or []:
+                    raw_name = dish.get('name', '') if isinstance(dish, dict) else dish
+                    name = normalize_name(raw_name)
+                    if not name:
+                        continue
+                    totals.setdefault(name, _Acc()).add(date_str, weekday, meal_idx)
+                    canteens = dish.get('available_at', []) if isinstance(dish, dict) else []
+                    for canteen in canteens:
+                        by_canteen.setdefault(name, {}).setdefault(canteen, _Acc()).add(date_str, weekday, meal_idx)
+
+    dishes = {}
+    for name in sorted(totals):
+        entry = totals[name].to_dict()
+        entry['canteens'] = {
+            canteen: acc.to_dict()
+            for canteen, acc in sorted(by_canteen.get(name, {}).items())
+        }
+        dishes[name] = entry
+
+    return {
+        'version': STATS_VERSION,
+        'range': [first, last],
+        'dishes': dishes,
+    }
+
+
+def write_stats(data_dir, stats):
+    path = os.path.join(data_dir, STATS_FILENAME)
+    write_json(path, stats)
+    return path
+
+
+def load_stats(path):
+    """dish_stats.json come dict; {} se manca, è illeggibile o di un'altra versione."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, ValueError):
+        return {}
+    if stats.get('version') != STATS_VERSION:
+        return {}
+    return stats
+
+
+def update_stats(data_dir, history=None):
+    """Ricalcola le statistiche dallo storico del sito. Ritorna il numero di piatti."""
+    if history is None:
+        history = HistoryStore(data_dir)
+    stats = compute_stats(history.iter_days())
+    write_stats(data_dir, stats)
+    return len(stats['dishes'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcola le statistiche dei piatti dallo storico.")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR,
+                        help="Directory dati del sito (default: data/).")
+    args = parser.parse_args()
+
+    history = HistoryStore(args.data_dir)
+    if not history.exists():
+        print(f"Nessuno storico in {args.data_dir} (esegui prima smart_update.py).")
+        return
+    count = update_stats(args.data_dir, history)
+    print(f"{STATS_FILENAME} generato: {count} piatti.")
+
+
+if __name__ == '__main__':
+    main()
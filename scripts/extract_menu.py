@@ -1,31 +1,51 @@
-import requests
+import argparse
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 import sys
 import datetime
 import os
+from http_client import CLIENT, FetchError
+from history_store import HistoryStore
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 
+# Public host: used for the dish links stored in menu.json
+PUBLIC_CANTEEN_URL = "https://canteen.dsutoscana.cloud"
+# Host actually contacted by the scraper. Override it to run offline against
+# scripts/fixture_server.py (e.g. DSU_CANTEEN_BASE_URL=http://127.0.0.1:8765)
+CANTEEN_BASE_URL = os.environ.get("DSU_CANTEEN_BASE_URL", PUBLIC_CANTEEN_URL).rstrip("/")
+
+
+def rebase_url(url):
+    """Points a public canteen URL (e.g. today_menu_url) to CANTEEN_BASE_URL."""
+    if url.startswith(PUBLIC_CANTEEN_URL):
+        return CANTEEN_BASE_URL + url[len(PUBLIC_CANTEEN_URL):]
+    return url
+
 def init_session(canteen_url):
     """
     Initialize a session by visiting the canteen-specific URL first.
     This ensures that the server sets the correct cookies/session variables
     for that specific canteen (e.g. correct 'id_ristorante').
+    Sessions share the pooled keep-alive connections of http_client.CLIENT.
     """
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-    })
+    session = CLIENT.new_session()
     try:
-        session.get(canteen_url, timeout=10)
-    except requests.RequestException as e:
+        CLIENT.request(session, 'GET', rebase_url(canteen_url))
+    except FetchError as e:
         print(f"Warning: Failed to connect to base URL {canteen_url}: {e}")
     return session
 
 def fetch_week_data(session, timestamp, tipo_menu_id):
-    api_url = "https://canteen.dsutoscana.cloud/ajax_tools/get_week"
+    """
+    Fetches the weekly menu JSON for a canteen.
+    Transient errors are retried by the HTTP client; raises FetchError if the
+    week could not be fetched, so callers can tell a failure from an empty week.
+    """
+    api_url = f"{CANTEEN_BASE_URL}/ajax_tools/get_week"
     
     payload = {
         'timestamp_selezionato': str(timestamp),
@@ -36,13 +56,11 @@ def fetch_week_data(session, timestamp, tipo_menu_id):
         'X-Requested-With': 'XMLHttpRequest'
     }
     
+    response = CLIENT.request(session, 'POST', api_url, data=payload, headers=headers)
     try:
-        response = session.post(api_url, data=payload, headers=headers, timeout=10)
-        response.raise_for_status()
         return response.json()
-    except Exception as e:
-        # print(f"API request failed for timestamp {timestamp}: {e}")
-        return None
+    except ValueError as e:
+        raise FetchError(f"Invalid JSON for timestamp {timestamp}: {e}") from e
 
 def parse_menu_html(html):
     soup = BeautifulSoup(html, 'html.parser')
@@ -93,13 +111,13 @@ def parse_menu_html(html):
                         link_url = None
                         if raw_link:
                             if raw_link.startswith("http"):
-                                link_url = f"https://canteen.dsutoscana.cloud/menu#cbp={raw_link}"
+                                link_url = f"{PUBLIC_CANTEEN_URL}/menu#cbp={raw_link}"
                             else:
                                 if raw_link.startswith("/"):
-                                    full_raw = f"https://canteen.dsutoscana.cloud{raw_link}"
+                                    full_raw = f"{PUBLIC_CANTEEN_URL}{raw_link}"
                                 else:
-                                    full_raw = f"https://canteen.dsutoscana.cloud/{raw_link}"
-                                link_url = f"https://canteen.dsutoscana.cloud/menu#cbp={full_raw}"
+                                    full_raw = f"{PUBLIC_CANTEEN_URL}/{raw_link}"
+                                link_url = f"{PUBLIC_CANTEEN_URL}/menu#cbp={full_raw}"
 
                         dish_obj = {
                             "name": text_content,
@@ -114,16 +132,18 @@ def parse_menu_html(html):
                     
     return result
 
-def scrape_canteen_menu(canteen, year):
-    """
-    Scrapes the menu for a single canteen for the given year.
-    Returns a dict: Date -> Meal -> Course -> [List of dishes]
-    """
-    url = canteen.get('today_menu_url')
-    name = canteen.get('name')
-    if not url:
-        return {}
+DAY_MAPPING = {
+    'Lunedì': 0, 'Martedì': 1, 'Mercoledì': 2, 'Giovedì': 3,
+    'Venerdì': 4, 'Sabato': 5, 'Domenica': 6
+}
 
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+CHECKPOINT_FILENAME = 'backfill_checkpoint.jsonl'
+CHECKPOINT_VERSION = 2
+
+
+def get_tipo_menu_id(url):
     # Extract tipo_menu_id from URL
     # URL structure: .../menu/0/0/{tipo_menu_id}/{tipo_pasto_id}
     # e.g., https://canteen.dsutoscana.cloud/menu/0/0/4/3 -> tipo_menu_id = 4
@@ -131,150 +151,141 @@ def scrape_canteen_menu(canteen, year):
         parts = url.rstrip('/').split('/')
         # We want the second to last part
         if len(parts) >= 2:
-            tipo_menu_id = parts[-2]
-        else:
-            print(f"Warning: URL format unexpected: {url}. Defaulting to 3.")
-            tipo_menu_id = '3'
+            return parts[-2]
+        print(f"Warning: URL format unexpected: {url}. Defaulting to 3.")
     except Exception as e:
         print(f"Error parsing URL {url}: {e}. Defaulting to 3.")
-        tipo_menu_id = '3'
+    return '3'
+
 
+def scrape_canteen_range(canteen, start_date, end_date, done_weeks=(), on_week=None):
+    """
+    Scrapes the menu for a single canteen for every week touching [start_date, end_date].
+    Weeks whose Monday (ISO string) is in `done_weeks` are skipped.
+    `on_week(monday_iso, week_days)` is called after every successfully fetched week,
+    and `on_week(None, None)` once the canteen is finished with no failed weeks.
+    Returns a dict: Date -> Meal -> Course -> [List of dishes]
+    """
+    url = canteen.get('today_menu_url')
+    if not url:
+        return {}
+
+    tipo_menu_id = get_tipo_menu_id(url)
     session = init_session(url)
     canteen_menus = {} # Key: Date -> Meal -> Course -> [Dishes]
-    
-    # Start mainly from the beginning of the year
-    current_date = datetime.date(year, 1, 1)
+
     # Align to Monday
-    start_week_monday = current_date - datetime.timedelta(days=current_date.weekday())
-    
-    day_mapping = {
-        'Lunedì': 0, 'Martedì': 1, 'Mercoledì': 2, 'Giovedì': 3,
-        'Venerdì': 4, 'Sabato': 5, 'Domenica': 6
-    }
-    
-    current_monday = start_week_monday
-    # Loop until we are well into the next year to cover everything
-    end_limit = datetime.date(year + 1, 1, 15)
-    
-    # Track consecutive failures to break early if needed
-    empty_streak = 0
-    
-    while current_monday < end_limit:
+    current_monday = start_date - datetime.timedelta(days=start_date.weekday())
+    failed_weeks = 0
+
+    while current_monday <= end_date:
+        monday_iso = current_monday.isoformat()
+        if monday_iso in done_weeks:
+            current_monday += datetime.timedelta(days=7)
+            continue
+
         timestamp = int(datetime.datetime.combine(current_monday, datetime.time(12, 0)).timestamp())
-        
-        data = fetch_week_data(session, timestamp, tipo_menu_id)
-        
-        week_has_data = False
-        if data and data.get('status') == 'success':
+
+        try:
+            data = fetch_week_data(session, timestamp, tipo_menu_id)
+        except FetchError as e:
+            # Request failed: leave the week out of the checkpoint so a resume retries it
+            print(f"  -> {canteen.get('name')}: settimana {monday_iso} non scaricata: {e}")
+            failed_weeks += 1
+            current_monday += datetime.timedelta(days=7)
+            continue
+
+        week_days = {}
+        if data.get('status') == 'success':
             html_content = data.get('visualizzazione_settimanale', '')
             weekly_data = parse_menu_html(html_content)
-            
+
             # Map simplified day names back to real ISO dates
             for meal_type, days_dict in weekly_data.items():
                 for day_key, courses in days_dict.items():
                     # day_key is "Lunedì" or "Lunedì 10/02"
                     # We just need the day name to calculate offset
-                    day_name = day_key.split()[0].capitalize() 
-                    
-                    if day_name in day_mapping:
-                        offset = day_mapping[day_name]
-                        actual_date = current_monday + datetime.timedelta(days=offset)
-                        date_str = actual_date.isoformat()
-                        
-                        # Only store if within reasonable range (optional, but clean)
-                        # if actual_date.year != year: ...
-                        
-                        if date_str not in canteen_menus:
-                            canteen_menus[date_str] = {"date": date_str}
-                        
-                        if meal_type not in canteen_menus[date_str]:
-                             canteen_menus[date_str][meal_type] = {}
-                             
-                        # Merge courses
-                        for course, dishes in courses.items():
-                            canteen_menus[date_str][meal_type][course] = dishes
-                            week_has_data = True
-        
-        if week_has_data:
-            empty_streak = 0
-        else:
-            empty_streak += 1
-            if data and data.get('errors') and "NOSEASON" in str(data.get('errors')):
-                # Explicit end of season signal
-                break
-        
-        # If we have too many empty weeks in a row late in the year, maybe stop
-        # But holidays exist, so be careful. 
-        
+                    day_name = day_key.split()[0].capitalize()
+                    if day_name not in DAY_MAPPING:
+                        continue
+
+                    actual_date = current_monday + datetime.timedelta(days=DAY_MAPPING[day_name])
+                    if not (start_date <= actual_date <= end_date):
+                        continue
+                    date_str = actual_date.isoformat()
+
+                    for course, dishes in courses.items():
+                        week_days.setdefault(date_str, {"date": date_str})
+                        week_days[date_str].setdefault(meal_type, {})
+                        week_days[date_str][meal_type][course] = dishes
+
+        canteen_menus.update(week_days)
+        if on_week:
+            on_week(monday_iso, week_days)
+
+        if not week_days and data.get('errors') and "NOSEASON" in str(data.get('errors')):
+            # Explicit end of season signal
+            break
+
         current_monday += datetime.timedelta(days=7)
-        # time.sleep(0.2) # Be nice
-        
+
+    if failed_weeks:
+        print(f"  -> {canteen.get('name')}: {failed_weeks} settimane non scaricate (verranno ritentate).")
+    elif on_week:
+        on_week(None, None)
     return canteen_menus
 
-def main():
-    _canteens_path = os.path.join(DATA_DIR, 'canteens.json')
-    if not os.path.exists(_canteens_path):
-        print("Error: canteens.json not found.")
-        return
 
-    with open(_canteens_path, 'r') as f:
-        canteens = json.load(f)
-        
-    scrape_year_target = 2026
-    print(f"Updating menu cache for year {scrape_year_target}...")
-    
-    # We will aggregate all data into this structure:
-    # aggregated[Date][Meal][Course][DishName] = { ... info + list of canteens ... }
-    aggregated = {}
-    
-    for canteen in canteens:
-        c_name = canteen['name']
-        print(f"Scraping {c_name} ...")
-        
-        c_data = scrape_canteen_menu(canteen, scrape_year_target)
-        days_found = len(c_data)
-        print(f"  -> Found menus for {days_found} days.")
-        
-        # Merge this canteen's data into the aggregated structure
-        for date_str, day_content in c_data.items():
-            if date_str not in aggregated:
-                aggregated[date_str] = {}
-            
-            for meal_type, courses in day_content.items():
-                if meal_type == "date": continue
-                
-                if meal_type not in aggregated[date_str]:
-                    aggregated[date_str][meal_type] = {}
-                
-                for course, dishes in courses.items():
-                    if course not in aggregated[date_str][meal_type]:
-                         aggregated[date_str][meal_type][course] = {}
-                    
-                    target_course_map = aggregated[date_str][meal_type][course]
-                    
-                    for dish in dishes:
-                        # Use exact name for now as key, could be normalized if needed
-                        d_name = dish['name'].strip()
-                        
-                        if d_name not in target_course_map:
-                            target_course_map[d_name] = {
-                                "name": d_name,
-                                "link": dish['link'],
-                                "available_at": []
-                            }
-                        
-                        # Append current canteen if not already present
-                        if c_name not in target_course_map[d_name]['available_at']:
-                            target_course_map[d_name]['available_at'].append(c_name)
+def scrape_canteen_menu(canteen, year):
+    """
+    Scrapes the menu for a single canteen for the given year.
+    Returns a dict: Date -> Meal -> Course -> [List of dishes]
+    """
+    return scrape_canteen_range(canteen, datetime.date(year, 1, 1), datetime.date(year + 1, 1, 15))
+
+
+def merge_canteen_days(aggregated, c_name, c_data):
+    """
+    Merges one canteen's days into the aggregated structure:
+    aggregated[Date][Meal][Course][DishName] = { ... info + list of canteens ... }
+    """
+    for date_str, day_content in c_data.items():
+        if date_str not in aggregated:
+            aggregated[date_str] = {}
+
+        for meal_type, courses in day_content.items():
+            if meal_type == "date": continue
+
+            if meal_type not in aggregated[date_str]:
+                aggregated[date_str][meal_type] = {}
+
+            for course, dishes in courses.items():
+                if course not in aggregated[date_str][meal_type]:
+                     aggregated[date_str][meal_type][course] = {}
 
-    # Convert aggregated data to the final list-based structure
-    print("Aggregating results...")
+                target_course_map = aggregated[date_str][meal_type][course]
+
+                for dish in dishes:
+                    # Use exact name for now as key, could be normalized if needed
+                    d_name = dish['name'].strip()
+
+                    if d_name not in target_course_map:
+                        target_course_map[d_name] = {
+                            "name": d_name,
+                            "link": dish['link'],
+                            "available_at": []
+                        }
+
+                    # Append current canteen if not already present
+                    if c_name not in target_course_map[d_name]['available_at']:
+                        target_course_map[d_name]['available_at'].append(c_name)
+
+
+def build_final_output(aggregated):
+    """Converts aggregated data to the final list-based structure of menu.json."""
     final_output = {}
-    
-    MEAL_ORDER = ['Pranzo', 'Cena']
 
-    dates_sorted = sorted(aggregated.keys())
-    for date_str in dates_sorted:
+    for date_str in sorted(aggregated.keys()):
         final_output[date_str] = {"date": date_str}
 
         # Always include Pranzo and Cena (empty {} if no data for that meal)
@@ -285,18 +296,209 @@ def main():
             final_output[date_str][meal_type] = {}
 
             for course, dish_map in aggregated[date_str][meal_type].items():
-                # Convert dict of dishes back to list
-                dish_list = list(dish_map.values())
-                # Sort dishes alphabetically
-                dish_list.sort(key=lambda x: x['name'])
-
+                # Convert dict of dishes back to list, sorted alphabetically
+                dish_list = sorted(dish_map.values(), key=lambda x: x['name'])
                 final_output[date_str][meal_type][course] = dish_list
 
-    output_file = os.path.join(DATA_DIR, 'menu.json')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(final_output, f, separators=(',', ':'), ensure_ascii=False)
-        
-    print(f"Done. Saved {len(final_output)} days to {output_file}.")
+    return final_output
+
+
+class BackfillCheckpoint:
+    """
+    Append-only JSONL checkpoint: one line per (canteen, week) fetched,
+    plus one line per finished canteen. Each append costs O(1) regardless
+    of how many weeks have already been stored, and a truncated last line
+    (crash mid-write) is simply ignored on resume.
+
+    Records are not tied to the range of the run that wrote them: every week
+    line stores the days it covered ("from"/"to", the week clipped to that
+    run's range) and every finished line the range it finished. A later run
+    with a different range (e.g. the default --end moving to a new
+    "yesterday") reuses every week whose covered days include the part of
+    the week inside the new range, and fetches only the rest.
+    """
+
+    def __init__(self, path, start_date, end_date):
+        self.path = path
+        self.start = start_date.isoformat()
+        self.end = end_date.isoformat()
+        self.lock = threading.Lock()
+        self.weeks = {}     # canteen -> set of Monday ISO strings
+        self.days = {}      # canteen -> Date -> day content
+        self.finished = set()
+
+    def _bounds(self, monday_iso):
+        """(first, last) day of the week inside this run's range (first > last if outside)."""
+        monday = datetime.date.fromisoformat(monday_iso)
+        first = max(monday.isoformat(), self.start)
+        last = min((monday + datetime.timedelta(days=6)).isoformat(), self.end)
+        return first, last
+
+    def load(self):
+        """
+        Loads an existing checkpoint, keeping what covers the current range.
+        Returns False if there is none; raises ValueError if the file is not
+        a checkpoint this version can read (the caller must not overwrite it).
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        if not records:
+            return False
+        header = records[0]
+        if not isinstance(header, dict) or 'canteen' in header:
+            raise ValueError("intestazione mancante")
+        # Versione 1: intestazione {"start", "end"} e record senza intervallo proprio
+        if header.get('version', 1) not in (1, CHECKPOINT_VERSION):
+            raise ValueError(f"versione {header.get('version')} non supportata")
+        default_start, default_end = header.get('start'), header.get('end')
+
+        for rec in records[1:]:
+            c_name = rec.get('canteen')
+            if rec.get('finished'):
+                if rec.get('start', default_start) <= self.start and rec.get('end', default_end) >= self.end:
+                    self.finished.add(c_name)
+                continue
+            first, last = self._bounds(rec['week'])
+            if first > last:
+                continue
+            if rec.get('from', default_start) <= first and rec.get('to', default_end) >= last:
+                self.weeks.setdefault(c_name, set()).add(rec['week'])
+                self.days.setdefault(c_name, {}).update(
+                    (d, day) for d, day in rec.get('days', {}).items() if self.start <= d <= self.end
+                )
+        return True
+
+    def reset(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"version": CHECKPOINT_VERSION}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append(self, record):
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def recorder(self, c_name):
+        """Returns an on_week callback for scrape_canteen_range."""
+        def on_week(monday_iso, week_days):
+            if monday_iso is None:
+                self._append({"canteen": c_name, "finished": True, "start": self.start, "end": self.end})
+                with self.lock:
+                    self.finished.add(c_name)
+                return
+            first, last = self._bounds(monday_iso)
+            self._append({"canteen": c_name, "week": monday_iso, "from": first, "to": last, "days": week_days})
+            with self.lock:
+                self.weeks.setdefault(c_name, set()).add(monday_iso)
+                self.days.setdefault(c_name, {}).update(week_days)
+        return on_week
+
+
+def backfill(canteens, start_date, end_date, data_dir, workers=3, reset=False):
+    """
+    Scrapes [start_date, end_date] for every canteen with a resumable checkpoint
+    and appends the past days to the history store (existing dates are kept).
+    Returns the number of dates added to the history.
+    """
+    checkpoint_path = os.path.join(data_dir, CHECKPOINT_FILENAME)
+    checkpoint = BackfillCheckpoint(checkpoint_path, start_date, end_date)
+    try:
+        resumed = not reset and checkpoint.load()
+    except ValueError as e:
+        # Mai troncare un checkpoint che non sappiamo leggere: contiene settimane già scaricate
+        raise SystemExit(f"Checkpoint {checkpoint_path} non leggibile ({e}): usa --reset per ricominciare da capo.")
+    if resumed:
+        done = sum(len(w) for w in checkpoint.weeks.values())
+        print(f"Ripresa dal checkpoint: {done} settimane già scaricate, {len(checkpoint.finished)} mense complete.")
+    else:
+        checkpoint.reset()
+
+    pending = [c for c in canteens if c.get('today_menu_url') and c['name'] not in checkpoint.finished]
+
+    def run(canteen):
+        c_name = canteen['name']
+        print(f"Scraping {c_name} ({start_date} → {end_date})...")
+        scrape_canteen_range(
+            canteen, start_date, end_date,
+            done_weeks=frozenset(checkpoint.weeks.get(c_name, ())),
+            on_week=checkpoint.recorder(c_name),
+        )
+        print(f"  -> {c_name}: {len(checkpoint.days.get(c_name, {}))} giorni.")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for future in [pool.submit(run, c) for c in pending]:
+            future.result()
+
+    aggregated = {}
+    for canteen in canteens:
+        c_name = canteen['name']
+        merge_canteen_days(aggregated, c_name, checkpoint.days.get(c_name, {}))
+    final_output = build_final_output(aggregated)
+
+    # Solo i giorni passati vanno nello storico: da oggi in poi se ne occupa smart_update.py
+    today_str = datetime.date.today().isoformat()
+    history = HistoryStore(data_dir)
+    history.migrate()
+    added = history.append({d: day for d, day in final_output.items() if d < today_str})
+
+    if all(c['name'] in checkpoint.finished for c in canteens if c.get('today_menu_url')):
+        os.remove(checkpoint_path)
+    else:
+        print(f"Alcune settimane non sono state scaricate: checkpoint mantenuto in {checkpoint_path}.")
+    return added
+
+
+def parse_args():
+    today = datetime.date.today()
+    parser = argparse.ArgumentParser(
+        description="Backfill dello storico menu con checkpoint riprendibile."
+    )
+    parser.add_argument("--start", type=datetime.date.fromisoformat,
+                        default=datetime.date(today.year, 1, 1),
+                        help="Data di inizio YYYY-MM-DD (default: 1 gennaio dell'anno corrente).")
+    parser.add_argument("--end", type=datetime.date.fromisoformat,
+                        default=today - datetime.timedelta(days=1),
+                        help="Data di fine YYYY-MM-DD (default: ieri).")
+    parser.add_argument("--workers", type=int, default=3,
+                        help="Numero di mense scaricate in parallelo (default: 3).")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR,
+                        help="Directory dati del sito (default: data/).")
+    parser.add_argument("--reset", action="store_true",
+                        help="Ignora un checkpoint esistente e ricomincia da capo.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    _canteens_path = os.path.join(args.data_dir, 'canteens.json')
+    if not os.path.exists(_canteens_path):
+        print("Error: canteens.json not found.")
+        return
+
+    with open(_canteens_path, 'r') as f:
+        canteens = json.load(f)
+
+    if args.start > args.end:
+        print(f"Error: --start {args.start} è successiva a --end {args.end}.")
+        return
+
+    print(f"Backfill storico menu dal {args.start} al {args.end} ({args.workers} worker)...")
+    added = backfill(canteens, args.start, args.end, args.data_dir,
+                     workers=args.workers, reset=args.reset)
+    print(f"Done. Aggiunte {added} date allo storico.")
+    print(CLIENT.summary())
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,13 @@
-import requests
+from data_io import write_json
+from http_client import CLIENT, FetchError
 from bs4 import BeautifulSoup
 import json
 import re
 import os
 
-URL = "https://www.dsu.toscana.it/-/tariffa-agevolata-su-base-isee"
+# Override DSU_BASE_URL to run offline against scripts/fixture_server.py
+DSU_BASE_URL = os.environ.get("DSU_BASE_URL", "https://www.dsu.toscana.it").rstrip("/")
+URL = f"{DSU_BASE_URL}/-/tariffa-agevolata-su-base-isee"
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 OUTPUT_FILE = os.path.join(DATA_DIR, "combinations.json")
 
@@ -17,9 +20,8 @@ def clean_text(text):
 def fetch_combinations():
     print(f"Fetching {URL}...")
     try:
-        response = requests.get(URL)
-        response.raise_for_status()
-    except requests.RequestException as e:
+        response = CLIENT.request(CLIENT.new_session(), 'GET', URL)
+    except FetchError as e:
         print(f"Error fetching URL: {e}")
         return
 
@@ -106,8 +108,7 @@ def fetch_combinations():
     print("Extracted Data:")
     print(json.dumps(final_result, indent=4, ensure_ascii=False))
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_result, f, indent=4, ensure_ascii=False)
+    write_json(OUTPUT_FILE, final_result, indent=4)
     
     print(f"Saved to {OUTPUT_FILE}")
 
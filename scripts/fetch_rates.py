@@ -1,11 +1,13 @@
 
-import requests
+from data_io import write_json
+from http_client import CLIENT
 from bs4 import BeautifulSoup
-import json
 import re
 import os
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+# Override to run offline against scripts/fixture_server.py
+DSU_BASE_URL = os.environ.get("DSU_BASE_URL", "https://www.dsu.toscana.it").rstrip("/")
 
 def clean_text(text):
     """Cleans text from whitespace and special characters"""
@@ -88,11 +90,10 @@ def parse_isee_range(isee_str):
     return {"min_isee": min_val, "max_isee": max_val, "scholarship": False}
 
 def fetch_rates():
-    url = "https://www.dsu.toscana.it/-/tariffa-agevolata-su-base-isee"
+    url = f"{DSU_BASE_URL}/-/tariffa-agevolata-su-base-isee"
     
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        response = CLIENT.request(CLIENT.new_session(), 'GET', url)
         soup = BeautifulSoup(response.content, 'html.parser')
         
         # Find the table containing "Fascia ISEE"
@@ -149,8 +150,7 @@ def fetch_rates():
             rates_data.append(entry)
             
         # Write to JSON
-        with open(os.path.join(DATA_DIR, 'rates.json'), 'w', encoding='utf-8') as f:
-            json.dump(rates_data, f, indent=4, ensure_ascii=False)
+        write_json(os.path.join(DATA_DIR, 'rates.json'), rates_data, indent=4)
             
         print(f"Successfully extracted {len(rates_data)} rates to rates.json")
         
@@ -0,0 +1,389 @@
+"""
+Server locale che sostituisce canteen.dsutoscana.cloud e www.dsu.toscana.it
+per testare e cronometrare gli scraper senza toccare i siti live.
+
+Risponde a:
+- GET  /menu/...                          pagina della mensa (imposta il cookie di sessione)
+- POST /ajax_tools/get_week               JSON settimanale come l'API reale
+- GET  /-/tariffa-agevolata-su-base-isee  pagina delle tariffe
+
+Di default le risposte vengono ricostruite dai dati in data/ (menu.json,
+storico, rates.json, combinations.json). Con --fixtures-dir si usano
+prima le risposte registrate in quella directory (vedi --record) e si
+ricade su data/ per quelle mancanti.
+
+Uso tipico:
+    python scripts/fixture_server.py --port 8765 --latency-ms 80 --error-rate 0.05
+    DSU_CANTEEN_BASE_URL=http://127.0.0.1:8765 DSU_BASE_URL=http://127.0.0.1:8765 \\
+        python scripts/smart_update.py --full
+
+Per registrare le risposte reali (una volta, poi riusate offline):
+    python scripts/fixture_server.py --fixtures-dir /tmp/dsu-fixtures --record
+"""
+import argparse
+import datetime
+import html
+import http.cookiejar
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from history_store import load_history
+from menu_format import load_menu
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATA_DIR = os.path.join(REPO_ROOT, 'data')
+
+PUBLIC_CANTEEN_URL = 'https://canteen.dsutoscana.cloud'
+PUBLIC_DSU_URL = 'https://www.dsu.toscana.it'
+RATES_PATH = '/-/tariffa-agevolata-su-base-isee'
+
+DAY_NAMES = ['Lunedì', 'Martedì', 'Mercoledì', 'Giovedì', 'Venerdì', 'Sabato', 'Domenica']
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+
+def _load_json(path, fallback):
+    if not os.path.exists(path):
+        return fallback
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = f.read().strip()
+    return json.loads(raw) if raw else fallback
+
+
+class MenuSource:
+    """Indice tipo_menu_id -> (nome mensa, giorni) costruito dai file in data/."""
+
+    def __init__(self, data_dirs):
+        self.canteens = {}   # tipo_menu_id -> canteen name
+        self.days = {}       # date_str -> giorno (tutti i siti)
+        for data_dir in data_dirs:
+            for canteen in _load_json(os.path.join(data_dir, 'canteens.json'), []):
+                url = canteen.get('today_menu_url')
+                if not url:
+                    continue
+                parts = url.rstrip('/').split('/')
+                if len(parts) >= 2:
+                    self.canteens[parts[-2]] = canteen['name']
+            for days in (load_history(data_dir), load_menu(os.path.join(data_dir, 'menu.json'))):
+                for date_str, day in days.items():
+                    self._merge_day(date_str, day)
+        self.last_date = max(self.days) if self.days else None
+
+    def _merge_day(self, date_str, day):
+        target = self.days.setdefault(date_str, {})
+        for meal in MEAL_ORDER:
+            for course, dishes in (day.get(meal) or {}).items():
+                target.setdefault(meal, {}).setdefault(course, []).extend(dishes)
+
+    def week_html(self, tipo_menu_id, monday):
+        """Ricostruisce l'HTML di visualizzazione_settimanale per una mensa e una settimana."""
+        c_name = self.canteens.get(str(tipo_menu_id))
+        dates = [monday + datetime.timedelta(days=i) for i in range(7)]
+        has_data = False
+        sections = []
+        for meal in MEAL_ORDER:
+            courses = []
+            for d in dates:
+                for course in self.days.get(d.isoformat(), {}).get(meal, {}):
+                    if course not in courses:
+                        courses.append(course)
+
+            head = ''.join(
+                f'<th class="giorno_della_settimana">{DAY_NAMES[d.weekday()]} {d.strftime("%d/%m")}</th>'
+                for d in dates
+            )
+            rows = []
+            for course in courses:
+                cells = []
+                for d in dates:
+                    dishes = self.days.get(d.isoformat(), {}).get(meal, {}).get(course, [])
+                    items = []
+                    for dish in dishes:
+                        if c_name not in dish.get('available_at', []):
+                            continue
+                        has_data = True
+                        name = html.escape(dish['name'])
+                        link = dish.get('link') or ''
+                        href = link.split('#cbp=', 1)[1] if '#cbp=' in link else ''
+                        if href:
+                            items.append(f'<p class="piatto_inline"><a href="{html.escape(href)}">{name}</a></p>')
+                        else:
+                            items.append(f'<p class="piatto_inline">{name}</p>')
+                    cells.append(f"<td>{''.join(items)}</td>")
+                rows.append(f'<tr class="portata"><th>{html.escape(course)}</th>{"".join(cells)}</tr>')
+
+            sections.append(
+                f'<div class="tipo_pasto_settimanale" data-tipo-pasto="{meal}">'
+                f'<table class="tabella_menu_settimanale"><tr><th></th>{head}</tr>{"".join(rows)}</table>'
+                f'</div>'
+            )
+        return ''.join(sections), has_data
+
+
+def _format_money(value):
+    if not value:
+        return 'gratuito'
+    return '€ ' + f'{value:.2f}'.replace('.', ',')
+
+
+def rates_page_html(data_dir):
+    """Ricostruisce la pagina delle tariffe da rates.json e combinations.json."""
+    rates = _load_json(os.path.join(data_dir, 'rates.json'), [])
+    combos = _load_json(os.path.join(data_dir, 'combinations.json'), {})
+
+    rows = ['<tr><th>Fascia ISEE</th><th>Pasto completo</th><th>Pasto ridotto A</th>'
+            '<th>Pasto ridotto B</th><th>Pasto ridotto C</th></tr>']
+    for band in rates:
+        cols = [band.get('original_label', '')] + [
+            _format_money(band.get(k)) for k in
+            ('pasto_completo', 'pasto_ridotto_a', 'pasto_ridotto_b', 'pasto_ridotto_c')
+        ]
+        rows.append('<tr>' + ''.join(f'<td>{html.escape(c)}</td>' for c in cols) + '</tr>')
+
+    combo_table = (
+        '<table><tr><td>Pasto completo</td><td>Pasto ridotto con primo (pasto ridotto A)</td>'
+        '<td>Pasto ridotto con secondo (pasto ridotto B)</td><td>Pasto ridotto C</td></tr><tr>'
+        + ''.join(
+            f'<td>{html.escape(combos.get(k, ""))}</td>'
+            for k in ('pasto_completo', 'pasto_ridotto_a', 'pasto_ridotto_b', 'pasto_ridotto_c')
+        )
+        + '</tr></table>'
+    )
+    return f'<html><body><table>{"".join(rows)}</table>{combo_table}</body></html>'
+
+
+class FixtureConfig:
+    def __init__(self, args):
+        self.fixtures_dir = args.fixtures_dir
+        self.data_dir = args.data_dir
+        self.latency = args.latency_ms / 1000.0
+        self.jitter = args.jitter_ms / 1000.0
+        self.error_rate = args.error_rate
+        self.retry_after = args.retry_after
+        self.noseason_after = args.noseason_after
+        self.record = args.record
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.source = MenuSource([args.data_dir, os.path.join(args.data_dir, 'unifi')])
+        self.stats = {'requests': 0, 'errors': 0, 'recorded': 0}
+        self.upstream_openers = {}   # tipo_menu_id -> opener con i cookie della mensa
+        self.upstream_lock = threading.Lock()
+
+    def random(self):
+        with self.rng_lock:
+            return self.rng.random()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = 'DSUFixture/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        payload = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _simulate_network(self):
+        """Applica latenza ed errori configurati. Ritorna True se ha già risposto con un errore."""
+        cfg = self.config
+        cfg.stats['requests'] += 1
+        delay = cfg.latency + (cfg.random() * cfg.jitter if cfg.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if cfg.error_rate and cfg.random() < cfg.error_rate:
+            cfg.stats['errors'] += 1
+            headers = {'Retry-After': str(cfg.retry_after)} if cfg.retry_after else None
+            self._send(503, 'Service Unavailable', headers=headers)
+            return True
+        return False
+
+    def _fixture_path(self, *parts):
+        """Percorso della risposta registrata, None senza --fixtures-dir."""
+        if not self.config.fixtures_dir:
+            return None
+        return os.path.join(self.config.fixtures_dir, *parts)
+
+    def _upstream_opener(self, tipo_menu_id):
+        """Opener con una sessione upstream dedicata alla mensa (come init_session)."""
+        cfg = self.config
+        with cfg.upstream_lock:
+            opener = cfg.upstream_openers.get(tipo_menu_id)
+            if opener is None:
+                opener = urllib.request.build_opener(
+                    urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+                )
+                opener.addheaders = [('User-Agent', self.headers.get('User-Agent', 'Mozilla/5.0'))]
+                if tipo_menu_id is not None:
+                    opener.open(f'{PUBLIC_CANTEEN_URL}/menu/0/0/{tipo_menu_id}/3', timeout=30).read()
+                cfg.upstream_openers[tipo_menu_id] = opener
+        return opener
+
+    def _proxy(self, upstream, body=None, tipo_menu_id=None):
+        """Inoltra la richiesta al sito reale (modalità --record). Ritorna (status, body)."""
+        headers = {}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+        req = urllib.request.Request(upstream, data=body, headers=headers,
+                                     method='POST' if body is not None else 'GET')
+        try:
+            with self._upstream_opener(tipo_menu_id).open(req, timeout=30) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def do_GET(self):
+        if self._simulate_network():
+            return
+        path = urllib.parse.urlsplit(self.path).path
+
+        if path.startswith('/menu'):
+            self._send(200, '<html><body>menu</body></html>',
+                       headers={'Set-Cookie': f'id_ristorante={path.rstrip("/").split("/")[-2]}; Path=/'})
+            return
+
+        if path == RATES_PATH:
+            fixture = self._fixture_path('tariffa-agevolata.html')
+            if fixture and os.path.exists(fixture):
+                with open(fixture, 'rb') as f:
+                    self._send(200, f.read())
+                return
+            if self.config.record:
+                status, body = self._proxy(PUBLIC_DSU_URL + RATES_PATH)
+                if status == 200:
+                    self._save(fixture, body)
+                self._send(status, body)
+                return
+            self._send(200, rates_page_html(self.config.data_dir))
+            return
+
+        self._send(404, 'Not Found')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        if self._simulate_network():
+            return
+        path = urllib.parse.urlsplit(self.path).path
+        if path != '/ajax_tools/get_week':
+            self._send(404, 'Not Found')
+            return
+
+        form = urllib.parse.parse_qs(raw_body.decode('utf-8'))
+        try:
+            timestamp = int(form['timestamp_selezionato'][0])
+            tipo_menu_id = form['tipo_menu_id'][0]
+        except (KeyError, ValueError, IndexError):
+            self._send(400, json.dumps({'status': 'error', 'errors': ['BADREQUEST']}),
+                       content_type='application/json')
+            return
+
+        day = datetime.date.fromtimestamp(timestamp)
+        monday = day - datetime.timedelta(days=day.weekday())
+        fixture = self._fixture_path('get_week', str(tipo_menu_id), f'{monday.isoformat()}.json')
+
+        if fixture and os.path.exists(fixture):
+            with open(fixture, 'rb') as f:
+                self._send(200, f.read(), content_type='application/json')
+            return
+
+        if self.config.record:
+            status, body = self._proxy(PUBLIC_CANTEEN_URL + '/ajax_tools/get_week', raw_body,
+                                       tipo_menu_id=tipo_menu_id)
+            if status == 200:
+                self._save(fixture, body)
+            self._send(status, body, content_type='application/json')
+            return
+
+        cfg = self.config
+        noseason_after = cfg.noseason_after
+        if noseason_after is None and cfg.source.last_date:
+            noseason_after = datetime.date.fromisoformat(cfg.source.last_date)
+        if noseason_after is not None and monday > noseason_after:
+            payload = {'status': 'error', 'errors': ['NOSEASON']}
+        else:
+            week_html, _ = cfg.source.week_html(tipo_menu_id, monday)
+            payload = {'status': 'success', 'visualizzazione_settimanale': week_html}
+        self._send(200, json.dumps(payload, ensure_ascii=False), content_type='application/json')
+
+    def _save(self, path, body):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+        self.config.stats['recorded'] += 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Server locale con risposte registrate/ricostruite dei siti DSU."
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures-dir", type=str, default=None,
+                        help="Directory delle risposte registrate da usare prima di data/ "
+                             "(default: nessuna, tutto ricostruito da data/).")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR,
+                        help="Dati da cui ricostruire le risposte mancanti (default: data/).")
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="Latenza fissa aggiunta a ogni risposta.")
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="Latenza casuale aggiuntiva (0..jitter).")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Frazione di richieste che rispondono 503 (0..1).")
+    parser.add_argument("--retry-after", type=int, default=0,
+                        help="Valore dell'header Retry-After sulle risposte 503 (0 = assente).")
+    parser.add_argument("--noseason-after", type=datetime.date.fromisoformat, default=None,
+                        help="Le settimane dopo questa data rispondono NOSEASON "
+                             "(default: ultimo giorno presente nei dati).")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed per latenza ed errori (run riproducibili).")
+    parser.add_argument("--record", action="store_true",
+                        help="Per le fixture mancanti inoltra al sito reale e salva la risposta "
+                             "in --fixtures-dir.")
+    parser.add_argument("--quiet", action="store_true", help="Non stampare il log delle richieste.")
+    args = parser.parse_args()
+    if args.record and not args.fixtures_dir:
+        parser.error("--record richiede --fixtures-dir (dove salvare le risposte).")
+    return args
+
+
+def main():
+    args = parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), FixtureHandler)
+    server.daemon_threads = True
+    server.config = FixtureConfig(args)
+    server.quiet = args.quiet
+    base = f"http://{args.host}:{server.server_port}"
+    print(f"Fixture server in ascolto su {base}")
+    print(f"  DSU_CANTEEN_BASE_URL={base} DSU_BASE_URL={base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats = server.config.stats
+        print(f"\nRichieste: {stats['requests']} | errori simulati: {stats['errors']} | registrate: {stats['recorded']}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 import argparse
 import datetime as dt
 import json
+import math
+import os
 import random
 import colorsys
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 from PIL import Image, ImageDraw, ImageFont
 
+from data_io import atomic_write, sha256_bytes
+from menu_format import expand_menu
+
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = REPO_ROOT / "data"
@@ -14,6 +22,39 @@ MENU_PATH = DATA_DIR / "menu.json"
 CANTEENS_PATH = DATA_DIR / "canteens.json"
 DEFAULT_OUTPUT_DIR = REPO_ROOT / "assets" / "posts"
 
+# assets/posts/manifest.json: filename -> render key + sha256 of the JPEG
+POSTS_MANIFEST_FILENAME = "manifest.json"
+POSTS_MANIFEST_VERSION = 1
+# Bump on any renderer change that alters the output (layout, fonts, colours, encoding):
+# every post gets a new key and is rendered again
+RENDERER_VERSION = 1
+# Files produced by the last --range / --days run, per date
+RENDER_INDEX_FILENAME = "index.json"
+
+# Post formats: canvas size, card width/height and a scale for the card paddings and fonts
+# (CARD_STYLE / CARD_FONTS are the feed values). Each format is composed from the same
+# fonts, pattern masks and layout code; its files get a "_<format>" suffix (none for feed).
+POST_FORMATS = {
+    "feed":   {"canvas": (2160, 2880), "card_w": 1660, "max_card_h": 2600, "font_scale": 1.0},
+    "story":  {"canvas": (2160, 3840), "card_w": 1800, "max_card_h": 3200, "font_scale": 1.15},
+    "square": {"canvas": (2160, 2160), "card_w": 1500, "max_card_h": 1900, "font_scale": 0.8},
+}
+DEFAULT_FORMATS = ("feed",)
+
+# Files written from each composed format. "width" resizes keeping the aspect ratio (None = full size):
+# 1080 gives Instagram's native 1080x1440 feed and 1080x1920 story.
+OUTPUT_VARIANTS = {
+    "full":        {"suffix": "",         "ext": ".jpg",  "format": "JPEG", "width": None,
+                    "options": {"quality": 95, "dpi": (300, 300)}},
+    "web":         {"suffix": "_1080",    "ext": ".jpg",  "format": "JPEG", "width": 1080,
+                    "options": {"quality": 90}},
+    "thumb":       {"suffix": "_thumb",   "ext": ".webp", "format": "WEBP", "width": 540,
+                    "options": {"quality": 80, "method": 4}},
+    "progressive": {"suffix": "_prog",    "ext": ".jpg",  "format": "JPEG", "width": None,
+                    "options": {"quality": 85, "progressive": True, "optimize": True}},
+}
+DEFAULT_VARIANTS = ("full",)
+
 MEAL_ORDER = ["Pranzo", "Cena"]
 COURSE_ORDER = [
     "Primi Piatti",
@@ -176,61 +217,84 @@ def _lighten_color(hex_color: str, factor: float = 0.95) -> str:
     return f"#{red:02X}{green:02X}{blue:02X}"
 
 
-def _load_font(size: int, bold: bool = False, weight: str = None) -> ImageFont.FreeTypeFont:
-    _fonts_dir = REPO_ROOT / "assets" / "fonts"
-    if weight:
-        font_path = _fonts_dir / f"Poppins-{weight}.ttf"
-    elif bold:
-        font_path = _fonts_dir / "Poppins-Bold.ttf"
+FONTS_DIR = REPO_ROOT / "assets" / "fonts"
+
+# Font registry: (family, size, weight) -> FreeTypeFont, loaded once per process.
+# Font objects are reused, so the metric caches below can key on them.
+_FONTS: dict[tuple, ImageFont.FreeTypeFont] = {}
+
+
+def get_font(family: str, size: int, weight=None) -> ImageFont.FreeTypeFont:
+    """
+    family: "poppins" (weight = "Bold", "Regular", ...), "nunito" (variable,
+    weight 200-1000) or "fa-solid" (FontAwesome, weight ignored).
+    """
+    key = (family, size, weight)
+    font = _FONTS.get(key)
+    if font is not None:
+        return font
+    if family == "poppins":
+        font = ImageFont.truetype(str(FONTS_DIR / f"Poppins-{weight or 'Regular'}.ttf"), size)
+    elif family == "nunito":
+        font = ImageFont.truetype(str(FONTS_DIR / "Nunito-latin.ttf"), size)
+        font.set_variation_by_axes([weight])
+    elif family == "fa-solid":
+        font = ImageFont.truetype(str(FONTS_DIR / "fa-webfonts" / "fa-solid-900.ttf"), size)
     else:
-        font_path = _fonts_dir / "Poppins-Regular.ttf"
-    return ImageFont.truetype(str(font_path), size)
+        raise ValueError(f"Font sconosciuto: {family}")
+    _FONTS[key] = font
+    return font
+
+
+def _load_font(size: int, bold: bool = False, weight: str = None) -> ImageFont.FreeTypeFont:
+    return get_font("poppins", size, weight or ("Bold" if bold else "Regular"))
 
 
 def _load_nunito(size: int, weight: int = 800) -> ImageFont.FreeTypeFont:
     """Load Nunito variable font at a specific weight (200-1000)."""
-    _fonts_dir = REPO_ROOT / "assets" / "fonts"
-    font_path = _fonts_dir / "Nunito-latin.ttf"
-    font = ImageFont.truetype(str(font_path), size)
-    font.set_variation_by_axes([weight])
-    return font
+    return get_font("nunito", size, weight)
 
 
 def _load_fa_solid(size: int) -> ImageFont.FreeTypeFont:
     """Load FontAwesome Solid font."""
-    _fonts_dir = REPO_ROOT / "assets" / "fonts" / "fa-webfonts"
-    font_path = _fonts_dir / "fa-solid-900.ttf"
-    return ImageFont.truetype(str(font_path), size)
+    return get_font("fa-solid", size)
+
 
+# All measurements go through one scratch surface: textbbox does not depend on the target image
+_MEASURE_DRAW = ImageDraw.Draw(Image.new("RGB", (1, 1)))
 
-def _text_width(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont) -> int:
-    left, _, right, _ = draw.textbbox((0, 0), text, font=font)
+
+@functools.lru_cache(maxsize=None)
+def _text_width(text: str, font: ImageFont.ImageFont) -> int:
+    left, _, right, _ = _MEASURE_DRAW.textbbox((0, 0), text, font=font)
     return right - left
 
 
-def _line_height(draw: ImageDraw.ImageDraw, font: ImageFont.ImageFont) -> int:
-    _, top, _, bottom = draw.textbbox((0, 0), "Ag", font=font)
+@functools.lru_cache(maxsize=None)
+def _line_height(font: ImageFont.ImageFont) -> int:
+    _, top, _, bottom = _MEASURE_DRAW.textbbox((0, 0), "Ag", font=font)
     return bottom - top
 
 
-def _wrap_text(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont, max_width: int) -> list[str]:
+@functools.lru_cache(maxsize=None)
+def _wrap_text(text: str, font: ImageFont.ImageFont, max_width: int) -> tuple[str, ...]:
     words = text.split()
     if not words:
-        return [""]
+        return ("",)
 
     lines: list[str] = []
     current = words[0]
 
     for word in words[1:]:
         candidate = f"{current} {word}"
-        if _text_width(draw, candidate, font) <= max_width:
+        if _text_width(candidate, font) <= max_width:
             current = candidate
         else:
             lines.append(current)
             current = word
 
     lines.append(current)
-    return lines
+    return tuple(lines)
 
 
 def _pattern_color(base_color: str, alpha: int = 150) -> tuple:
@@ -243,32 +307,74 @@ def _pattern_color(base_color: str, alpha: int = 150) -> tuple:
     return (pr, pg, pb, alpha)
 
 
-def _generate_background_pattern(base_color: str, width: int, height: int, seed: str, force_pattern: str = None) -> Image.Image:
+PATTERN_TYPES = [
+    "dot_grid",
+    "diagonal_stripes",
+    "crosshatch",
+    "diamond_grid",
+    "zigzag",
+    "concentric_circles",
+    "plus_grid",
+    "waves",
+    "triangles",
+    "x_shapes",
+    "vertical_stripes",
+    "horizontal_stripes",
+]
+
+# Drawn on an oversized layer that used to be pasted onto the pattern layer with
+# its own alpha: the colour is blended twice (darker, lower alpha). Kept as is.
+_DOUBLE_PASTE_PATTERNS = {"diagonal_stripes", "diamond_grid"}
+
+
+def _pattern_spec(seed: str, force_pattern: str = None) -> tuple:
+    """(pattern_type, spacing, thickness) for a seed, drawing from the RNG in the historical order."""
     rng = random.Random(seed)
-    bg = Image.new("RGBA", (width, height), base_color)
-    pc = _pattern_color(base_color)
+    pattern_type = force_pattern or rng.choice(PATTERN_TYPES)
+    spacing = rng.choice([240, 300, 360])
+    if pattern_type == "dot_grid":
+        thickness = None
+    elif pattern_type in ("vertical_stripes", "horizontal_stripes"):
+        thickness = spacing // 3
+    else:
+        thickness = rng.choice([50, 70, 90])
+    return pattern_type, spacing, thickness
+
+
+def _double_paste_color(pc: tuple) -> tuple:
+    """Colour and alpha left by pasting `pc` onto a transparent pixel using its own alpha."""
+    pixel = Image.new("RGBA", (1, 1), (0, 0, 0, 0))
+    src = Image.new("RGBA", (1, 1), pc)
+    pixel.paste(src, (0, 0), src)
+    return pixel.getpixel((0, 0))
 
-    pattern_type = force_pattern or rng.choice([
-        "dot_grid",
-        "diagonal_stripes",
-        "crosshatch",
-        "diamond_grid",
-        "zigzag",
-        "concentric_circles",
-        "plus_grid",
-        "waves",
-        "triangles",
-        "x_shapes",
-        "vertical_stripes",
-        "horizontal_stripes"
-    ])
-
-    layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(layer)
+
+# One mask per canvas size: room for the three formats of a day plus the next day's first
+@functools.lru_cache(maxsize=6)
+def _pattern_mask(
+    pattern_type: str, spacing: int, thickness: int, width: int, height: int, value: int,
+    backend: str = "draw",
+) -> Image.Image:
+    """
+    8-bit mask of the pattern geometry (`value` where a shape is, 0 elsewhere).
+    It depends only on the pattern and its parameters, so a day's posts share
+    one mask and only colourise it.
+
+    backend "numpy" computes it as an antialiased distance field
+    (scripts/pattern_numpy.py); patterns it does not cover fall back to ImageDraw.
+    """
+    if backend == "numpy":
+        import pattern_numpy
+
+        mask = pattern_numpy.pattern_mask(pattern_type, spacing, thickness, width, height, value)
+        if mask is not None:
+            return mask
+
+    mask = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(mask)
 
     if pattern_type == "dot_grid":
         # Offset polka-dot grid — perfectly aligned rows and columns, centered
-        spacing = rng.choice([240, 300, 360])
         radius  = spacing // 4
         ox = (width // 2) % spacing
         oy = (height // 2) % spacing
@@ -276,51 +382,45 @@ def _generate_background_pattern(base_color: str, width: int, height: int, seed:
             x_offset = (spacing // 2) if (row % 2) else 0
             for x in range(-spacing, width + spacing, spacing):
                 cx = x + x_offset + ox
-                draw.ellipse((cx - radius, y - radius, cx + radius, y + radius), fill=pc)
+                draw.ellipse((cx - radius, y - radius, cx + radius, y + radius), fill=value)
 
     elif pattern_type == "diagonal_stripes":
-        # Crisp parallel diagonal stripes at 45°
-        spacing   = rng.choice([240, 300, 360])
-        thickness = rng.choice([50, 70, 90])
-        size      = (width + height) * 2
-        tmp = Image.new("RGBA", (size, size), (0, 0, 0, 0))
-        tmp_draw = ImageDraw.Draw(tmp)
+        # Crisp parallel diagonal stripes at 45°, drawn straight onto the mask
+        # with the offset of the old (w+h)*2 square temporary
+        size = (width + height) * 2
+        ox = -(size - width) // 2
+        oy = -(size - height) // 2
         for i in range(-size, size, spacing):
-            tmp_draw.line([(i, 0), (i + size, size)], fill=pc, width=thickness)
-        rotated = tmp.rotate(0)   # already 45° by construction
-        layer.paste(rotated, (-(size - width) // 2, -(size - height) // 2), rotated)
+            draw.line([(i + ox, oy), (i + size + ox, size + oy)], fill=value, width=thickness)
 
     elif pattern_type == "crosshatch":
         # Regular grid of thin crossing lines, centered
-        spacing = rng.choice([240, 300, 360])
-        thickness = rng.choice([50, 70, 90])
         ox = (width // 2) % spacing
         oy = (height // 2) % spacing
         for x in range(ox - spacing * 2, width + spacing, spacing):
-            draw.line([(x, 0), (x, height)], fill=pc, width=thickness)
+            draw.line([(x, 0), (x, height)], fill=value, width=thickness)
         for y in range(oy - spacing * 2, height + spacing, spacing):
-            draw.line([(0, y), (width, y)], fill=pc, width=thickness)
+            draw.line([(0, y), (width, y)], fill=value, width=thickness)
 
     elif pattern_type == "diamond_grid":
-        # 45°-rotated square grid (diamond lattice)
-        spacing = rng.choice([240, 300, 360])
-        thickness = rng.choice([50, 70, 90])
+        # 45°-rotated square grid (diamond lattice): rotated as a whole, so it
+        # still needs the square temporary, but 8-bit instead of RGBA
         size = (width + height) * 2
-        tmp = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        tmp = Image.new("L", (size, size), 0)
         tmp_draw = ImageDraw.Draw(tmp)
         for i in range(-size, size, spacing):
-            tmp_draw.line([(i, 0), (i, size)], fill=pc, width=thickness)
-            tmp_draw.line([(0, i), (size, i)], fill=pc, width=thickness)
+            tmp_draw.line([(i, 0), (i, size)], fill=value, width=thickness)
+            tmp_draw.line([(0, i), (size, i)], fill=value, width=thickness)
         rotated = tmp.rotate(45, center=(size // 2, size // 2))
-        layer.paste(rotated, (-(size - width) // 2, -(size - height) // 2), rotated)
-
- 
+        del tmp
+        # Same placement as the old paste at (-(size - width) // 2, -(size - height) // 2)
+        left = -(-(size - width) // 2)
+        top = -(-(size - height) // 2)
+        mask = rotated.crop((left, top, left + width, top + height))
 
     elif pattern_type == "zigzag":
         # Horizontal chevron / zigzag bands, centered
-        spacing = rng.choice([240, 300, 360])
         amplitude = spacing // 2
-        thickness = rng.choice([50, 70, 90])
         step = 60
         ox = (width // 2) % (step * 2)
         oy = (height // 2) % spacing
@@ -332,34 +432,27 @@ def _generate_background_pattern(base_color: str, width: int, height: int, seed:
                 y = y_base + (amplitude if phase else -amplitude)
                 pts.append((x + ox, y))
             for i in range(len(pts) - 1):
-                draw.line([pts[i], pts[i + 1]], fill=pc, width=thickness)
+                draw.line([pts[i], pts[i + 1]], fill=value, width=thickness)
 
     elif pattern_type == "concentric_circles":
         # Rings expanding from centre
         cx, cy = width // 2, height // 2
         max_r = int((width ** 2 + height ** 2) ** 0.5 // 2) + 200
-        spacing = rng.choice([240, 300, 360])
-        thickness = rng.choice([50, 70, 90])
         for r in range(spacing, max_r, spacing):
-            draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline=pc, width=thickness)
+            draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline=value, width=thickness)
 
     elif pattern_type == "plus_grid":
         # Evenly spaced + signs on a regular grid, centered
-        spacing  = rng.choice([240, 300, 360])
         arm_len  = spacing // 3
-        thickness = rng.choice([50, 70, 90])
         ox = (width // 2) % spacing
         oy = (height // 2) % spacing
         for y in range(oy - spacing * 2, height + spacing, spacing):
             for x in range(ox - spacing * 2, width + spacing, spacing):
-                draw.line([(x - arm_len, y), (x + arm_len, y)], fill=pc, width=thickness)
-                draw.line([(x, y - arm_len), (x, y + arm_len)], fill=pc, width=thickness)
+                draw.line([(x - arm_len, y), (x + arm_len, y)], fill=value, width=thickness)
+                draw.line([(x, y - arm_len), (x, y + arm_len)], fill=value, width=thickness)
 
     elif pattern_type == "waves":
-        import math
-        spacing = rng.choice([240, 300, 360])
         amplitude = spacing // 3
-        thickness = rng.choice([50, 70, 90])
         oy = (height // 2) % spacing
         # Center the sine wave horizontally: shift phase so wave is symmetric around center
         cx = width / 2.0
@@ -369,11 +462,9 @@ def _generate_background_pattern(base_color: str, width: int, height: int, seed:
                 y = y_base + int(math.sin((x - cx) / 100.0) * amplitude)
                 pts.append((x, y))
             for i in range(len(pts) - 1):
-                draw.line([pts[i], pts[i + 1]], fill=pc, width=thickness)
+                draw.line([pts[i], pts[i + 1]], fill=value, width=thickness)
 
     elif pattern_type == "triangles":
-        spacing = rng.choice([240, 300, 360])
-        thickness = rng.choice([50, 70, 90])
         ox = (width // 2) % spacing
         oy = (height // 2) % spacing
         for row, y in enumerate(range(oy - spacing * 2, height + spacing, spacing)):
@@ -384,39 +475,359 @@ def _generate_background_pattern(base_color: str, width: int, height: int, seed:
                     (x_off - spacing//2, y + spacing),
                     (x_off + spacing//2, y + spacing)
                 ]
-                draw.polygon(pts, outline=pc, width=thickness)
-
- 
+                draw.polygon(pts, outline=value, width=thickness)
 
     elif pattern_type == "x_shapes":
-        spacing = rng.choice([240, 300, 360])
         arm_len = spacing // 3
-        thickness = rng.choice([50, 70, 90])
         ox = (width // 2) % spacing
         oy = (height // 2) % spacing
         for y in range(oy - spacing * 2, height + spacing, spacing):
             for x in range(ox - spacing * 2, width + spacing, spacing):
-                draw.line([(x - arm_len, y - arm_len), (x + arm_len, y + arm_len)], fill=pc, width=thickness)
-                draw.line([(x - arm_len, y + arm_len), (x + arm_len, y - arm_len)], fill=pc, width=thickness)
+                draw.line([(x - arm_len, y - arm_len), (x + arm_len, y + arm_len)], fill=value, width=thickness)
+                draw.line([(x - arm_len, y + arm_len), (x + arm_len, y - arm_len)], fill=value, width=thickness)
 
     elif pattern_type == "vertical_stripes":
-        spacing = rng.choice([240, 300, 360])
-        thickness = spacing // 3
         ox = (width // 2) % spacing
         for x in range(ox - spacing * 2, width + spacing, spacing):
-            draw.line([(x, 0), (x, height)], fill=pc, width=thickness)
+            draw.line([(x, 0), (x, height)], fill=value, width=thickness)
 
     elif pattern_type == "horizontal_stripes":
-        spacing = rng.choice([240, 300, 360])
-        thickness = spacing // 3
         oy = (height // 2) % spacing
         for y in range(oy - spacing * 2, height + spacing, spacing):
-            draw.line([(0, y), (width, y)], fill=pc, width=thickness)
+            draw.line([(0, y), (width, y)], fill=value, width=thickness)
+
+    return mask
+
 
-    bg.paste(layer, (0, 0), layer)
+def _generate_background_pattern(
+    base_color: str, width: int, height: int, seed: str, force_pattern: str = None, backend: str = "draw",
+) -> Image.Image:
+    """Solid `base_color` with the seed's pattern composited on top, as an RGB image."""
+    pattern_type, spacing, thickness = _pattern_spec(seed, force_pattern)
+    pc = _pattern_color(base_color)
+    if pattern_type in _DOUBLE_PASTE_PATTERNS:
+        pc = _double_paste_color(pc)
+    mask = _pattern_mask(pattern_type, spacing, thickness, width, height, pc[3], backend)
+
+    bg = Image.new("RGB", (width, height), base_color)
+    bg.paste(pc[:3], (0, 0, width, height), mask)
     return bg
 
 
+# ── Card style (≈ 4× scale from the 420 px mensa-menu-ui.html) ─────────
+CARD_STYLE = {
+    "card_w":            1660,
+    "card_radius":       80,
+    "min_card_h":        800,
+    "max_card_h":        2600,
+    "pad_x":             80,    # header side padding: 20px × 4
+    "header_top":        72,    # header top padding: 18px × 4
+    "header_bottom":     48,    # header bottom padding: 12px × 4
+    "badge_pad_h":       36,
+    "badge_pad_v":       16,
+    "tab_margin_top":    16,    # mensa-tabs margin-top: 4px × 4
+    "tab_margin_bottom": 48,    # mensa-tabs margin-bottom: 12px × 4
+    "tab_pad":           24,    # mensa-tabs padding: 6px × 4
+    "tab_btn_pad_v":     32,    # tab button padding: 8px × 4
+    "tab_radius":        56,    # mensa-tabs border-radius: 14px × 4
+    "tab_btn_radius":    40,    # tab button border-radius: 10px × 4
+    "list_radius":       56,    # menu-list border-radius: 14px × 4
+    "min_list_h":        200,
+    "cat_pad_top":       32,    # cat padding-top: 8px × 4
+    "cat_pad_bottom":    16,    # cat padding-bottom: 4px × 4
+    "cat_pad_x":         64,    # cat padding-left: 16px × 4
+    "icon_gap":          16,    # spacing between category icon and text
+    "dish_pad_v":        48,    # dish padding vertical: 12px × 4
+    "dish_pad_x":        64,    # dish padding horizontal: 16px × 4
+    "dish_line_gap":     6,
+    "dish_border_w":     4,     # border-bottom: 1px × 4
+    "bottom_pad":        80,    # body bottom padding: 20px × 4 (matches pad_x)
+}
+
+# (family, size, weight) for get_font — Nunito, matching mensa-menu-ui.html
+CARD_FONTS = {
+    "title": ("nunito", 72, 800),     # h2: 18px × 4, weight 800
+    "tab":   ("nunito", 52, 800),     # tab: 13px × 4, weight 800
+    "cat":   ("nunito", 52, 800),     # cat: 13px × 4, weight 800
+    "dish":  ("nunito", 60, 700),     # dish: 15px × 4, weight 700
+    "date":  ("nunito", 44, 800),     # badge text
+    "icon":  ("fa-solid", 44, None),  # FontAwesome icons
+}
+
+CAT_ICONS = {
+    "primi": chr(58091),      # fa-bowl-rice
+    "secondi": chr(63191),    # fa-drumstick-bite
+    "contorni": chr(61548),   # fa-leaf
+    "dolci": chr(127874),     # fa-cake-candles
+}
+
+
+def _dish_block_h(lines: tuple, line_h: int, gap: int) -> int:
+    return max(1, len(lines)) * (line_h + gap) - gap
+
+
+def layout_card(
+    canteen_name: str,
+    meal_name: str,
+    sections: list[tuple[str, list[str]]],
+    date_label: str,
+    style: dict = CARD_STYLE,
+    fonts: dict = CARD_FONTS,
+) -> dict:
+    """
+    Measure the card once and return its layout tree: card size, header
+    (title, date badge, tabs) and the menu list rows with their wrapped lines
+    and coordinates, already truncated to the available height. Pure
+    measurement, no drawing: render_card() paints exactly this.
+    """
+    s = style
+    font = {name: get_font(*spec) for name, spec in fonts.items()}
+    card_w = s["card_w"]
+
+    title_h     = _line_height(font["title"])
+    tab_text_h  = _line_height(font["tab"])
+    cat_text_h  = _line_height(font["cat"])
+    dish_line_h = _line_height(font["dish"])
+    date_text_h = _line_height(font["date"])
+
+    tab_btn_h       = s["tab_btn_pad_v"] * 2 + tab_text_h
+    tab_container_h = s["tab_pad"] * 2 + tab_btn_h
+    cat_row_h       = s["cat_pad_top"] + cat_text_h + s["cat_pad_bottom"]
+    list_w          = card_w - s["pad_x"] * 2
+    max_dish_text_w = list_w - s["dish_pad_x"] * 2
+
+    # ── Header: title + date badge ───────────────────────────────────
+    y = s["header_top"]
+    badge_w = _text_width(date_label, font["date"]) + s["badge_pad_h"] * 2
+    badge_h = date_text_h + s["badge_pad_v"] * 2
+    badge = {
+        "x": card_w - s["pad_x"] - badge_w,
+        "y": y + (title_h - badge_h) // 2,
+        "w": badge_w,
+        "h": badge_h,
+        "text": date_label,
+    }
+    title = {"x": s["pad_x"], "y": y + title_h // 2, "text": canteen_name}
+    y += title_h + s["header_bottom"]
+
+    # ── Tab bar (Pranzo / Cena): each tab is exactly 50%, no gap ─────
+    tab_y = y + s["tab_margin_top"]
+    single_btn_w = (list_w - s["tab_pad"] * 2) // 2
+    tabs = {
+        "x": s["pad_x"], "y": tab_y, "w": list_w, "h": tab_container_h,
+        "buttons": [
+            {
+                "x": s["pad_x"] + s["tab_pad"] + idx * single_btn_w,
+                "y": tab_y + s["tab_pad"],
+                "w": single_btn_w,
+                "h": tab_btn_h,
+                "text": label,
+                "active": label == meal_name,
+            }
+            for idx, label in enumerate(MEAL_ORDER)
+        ],
+    }
+    list_y = tab_y + tab_container_h + s["tab_margin_bottom"]
+
+    # ── Menu list: measure every row once ────────────────────────────
+    measured = []
+    for section_name, dishes in sections:
+        measured.append(("cat", section_name, cat_row_h, None))
+        for dish in dishes:
+            dish = dish.strip().capitalize()
+            lines = _wrap_text(dish, font["dish"], max_dish_text_w)
+            row_h = s["dish_pad_v"] * 2 + _dish_block_h(lines, dish_line_h, s["dish_line_gap"])
+            measured.append(("dish", dish, row_h, lines))
+    full_h = sum(row[2] for row in measured)
+
+    card_h = max(s["min_card_h"], min(list_y + full_h + s["bottom_pad"], s["max_card_h"]))
+    list_h = min(full_h, max(card_h - list_y - s["bottom_pad"], s["min_list_h"]))
+
+    # ── Place rows, truncating at list_h ─────────────────────────────
+    rows = []
+    last_dish = max((i for i, row in enumerate(measured) if row[0] == "dish"), default=-1)
+    overflow = False
+    my = 0
+    for i, (kind, text, row_h, lines) in enumerate(measured):
+        if kind == "cat":
+            # A new section starts only if there is room left
+            if my >= list_h:
+                break
+            icon = CAT_ICONS.get(text.lower().strip(), "")
+            text_x = s["cat_pad_x"]
+            if icon:
+                text_x += _text_width(icon, font["icon"]) + s["icon_gap"]
+            rows.append({
+                "kind": "cat", "y": my, "h": row_h, "text": text.upper(),
+                "icon": icon, "icon_x": s["cat_pad_x"], "text_x": text_x,
+            })
+            my += row_h
+            continue
+
+        if my + row_h > list_h:
+            # Last visible dish: first line with an ellipsis, if it fits
+            if list_h - my > s["dish_pad_v"] + dish_line_h:
+                ell = f"{lines[0] if lines else text} …"
+                while _text_width(ell, font["dish"]) > max_dish_text_w and len(ell) > 3:
+                    ell = ell[:-3] + "…"
+                rows.append({"kind": "ellipsis", "y": my, "h": list_h - my, "text": ell,
+                             "x": s["dish_pad_x"], "text_y": my + s["dish_pad_v"]})
+            overflow = True
+            break
+
+        block_h = _dish_block_h(lines, dish_line_h, s["dish_line_gap"])
+        text_y = my + (row_h - block_h) // 2
+        placed = []
+        for line in lines:
+            placed.append((line, text_y + dish_line_h // 2))
+            text_y += dish_line_h + s["dish_line_gap"]
+        rows.append({
+            "kind": "dish", "y": my, "h": row_h, "lines": placed, "x": s["dish_pad_x"],
+            "border_y": my + row_h - s["dish_border_w"] // 2 if i != last_dish else None,
+        })
+        my += row_h
+
+    return {
+        "style": s,
+        "fonts": fonts,
+        "card_w": card_w,
+        "card_h": card_h,
+        "title": title,
+        "badge": badge,
+        "tabs": tabs,
+        "list": {"x": s["pad_x"], "y": list_y, "w": list_w, "h": list_h},
+        "rows": rows,
+        "overflow": overflow,
+    }
+
+
+def render_card(layout: dict, palette: dict) -> Image.Image:
+    """Paint a layout from layout_card() onto a transparent RGBA card."""
+    s = layout["style"]
+    font = {name: get_font(*spec) for name, spec in layout["fonts"].items()}
+    card_w, card_h = layout["card_w"], layout["card_h"]
+
+    card = Image.new("RGBA", (card_w, card_h), (0, 0, 0, 0))
+    cd   = ImageDraw.Draw(card)
+    cd.rounded_rectangle(
+        [(0, 0), (card_w - 1, card_h - 1)],
+        radius=s["card_radius"], fill=palette["CARD"],
+    )
+
+    # ── Header ───────────────────────────────────────────────────────
+    title = layout["title"]
+    cd.text((title["x"], title["y"]), title["text"], fill=palette["TITLE"], font=font["title"], anchor="lm")
+    badge = layout["badge"]
+    cd.rounded_rectangle(
+        [(badge["x"], badge["y"]), (badge["x"] + badge["w"], badge["y"] + badge["h"])],
+        radius=badge["h"] // 2, fill=palette["CAT"],
+    )
+    cd.text(
+        (badge["x"] + s["badge_pad_h"], badge["y"] + badge["h"] // 2),
+        badge["text"], fill=palette["SECONDARY"], font=font["date"], anchor="lm",
+    )
+
+    # ── Tabs ─────────────────────────────────────────────────────────
+    tabs = layout["tabs"]
+    cd.rounded_rectangle(
+        [(tabs["x"], tabs["y"]), (tabs["x"] + tabs["w"], tabs["y"] + tabs["h"])],
+        radius=s["tab_radius"], fill=palette["CAT"],
+    )
+    for btn in tabs["buttons"]:
+        if btn["active"]:
+            cd.rounded_rectangle(
+                [(btn["x"], btn["y"]), (btn["x"] + btn["w"], btn["y"] + btn["h"])],
+                radius=s["tab_btn_radius"], fill=palette["TAB_ACTIVE"],
+            )
+        cd.text(
+            (btn["x"] + btn["w"] // 2, btn["y"] + btn["h"] // 2),
+            btn["text"],
+            fill=palette["TITLE"] if btn["active"] else palette["SECONDARY"],
+            font=font["tab"],
+            anchor="mm",
+        )
+
+    # ── Menu list (rendered into a buffer, masked for rounded corners) ──
+    lst = layout["list"]
+    list_w, list_h = lst["w"], lst["h"]
+    menu_img = Image.new("RGBA", (list_w, list_h), (0, 0, 0, 0))
+    md = ImageDraw.Draw(menu_img)
+    md.rounded_rectangle(
+        [(0, 0), (list_w - 1, list_h - 1)],
+        radius=s["list_radius"], fill=palette["DISH"],
+    )
+
+    for row in layout["rows"]:
+        if row["kind"] == "cat":
+            mid = row["y"] + row["h"] // 2
+            md.rectangle([(0, row["y"]), (list_w - 1, row["y"] + row["h"] - 1)], fill=palette["CAT"])
+            if row["icon"]:
+                md.text((row["icon_x"], mid), row["icon"], fill=palette["SECONDARY"], font=font["icon"], anchor="lm")
+            md.text((row["text_x"], mid), row["text"], fill=palette["SECONDARY"], font=font["cat"], anchor="lm")
+        elif row["kind"] == "ellipsis":
+            md.text((row["x"], row["text_y"]), row["text"], fill=palette["TITLE"], font=font["dish"])
+        else:
+            for line, line_y in row["lines"]:
+                md.text((row["x"], line_y), line, fill=palette["TITLE"], font=font["dish"], anchor="lm")
+            if row["border_y"] is not None:
+                md.line(
+                    [(0, row["border_y"]), (list_w, row["border_y"])],
+                    fill=palette["BORDER"], width=s["dish_border_w"],
+                )
+
+    mask = Image.new("L", (list_w, list_h), 0)
+    ImageDraw.Draw(mask).rounded_rectangle(
+        [(0, 0), (list_w - 1, list_h - 1)],
+        radius=s["list_radius"], fill=255,
+    )
+    card.paste(menu_img, (lst["x"], lst["y"]), mask)
+    return card
+
+
+def format_style(post_format: str) -> tuple[dict, dict]:
+    """(style, fonts) for layout_card in a format: CARD_STYLE / CARD_FONTS scaled by its font_scale."""
+    spec = POST_FORMATS[post_format]
+    scale = spec["font_scale"]
+    style = {name: round(value * scale) for name, value in CARD_STYLE.items()}
+    style["card_w"] = spec["card_w"]
+    style["max_card_h"] = spec["max_card_h"]
+    style["min_card_h"] = min(style["min_card_h"], spec["max_card_h"])
+    fonts = {name: (family, round(size * scale), weight) for name, (family, size, weight) in CARD_FONTS.items()}
+    return style, fonts
+
+
+def compose_post(
+    post_format: str,
+    canteen_name: str,
+    meal_name: str,
+    sections: list[tuple[str, list[str]]],
+    date_label: str,
+    target_date: str,
+    base_bg: str,
+    palette: dict,
+    angle: float,
+    pattern_backend: str = "draw",
+) -> Image.Image:
+    """Background pattern + tilted card on the canvas of `post_format`."""
+    canvas_w, canvas_h = POST_FORMATS[post_format]["canvas"]
+
+    # Generate patterned background (same pattern for the whole day)
+    seed_key = f"{target_date}"
+    image = _generate_background_pattern(base_bg, canvas_w, canvas_h, seed_key, backend=pattern_backend)
+
+    style, fonts = format_style(post_format)
+    layout = layout_card(canteen_name, meal_name, sections, date_label, style, fonts)
+    card = render_card(layout, palette)
+
+    # ── Slight rotation (no shadow) ──────────────────────────────────
+    card_rot = card.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True)
+
+    cx = (canvas_w - card_rot.width)  // 2
+    cy = (canvas_h - card_rot.height) // 2
+    image.paste(card_rot, (cx, cy), card_rot)
+    return image
+
+
 def build_and_save_gt(
     canteen_name: str,
     meal_name: str,
@@ -424,7 +835,15 @@ def build_and_save_gt(
     target_date: str,
     accent_color: str,
     output_path: Path,
-) -> None:
+    pattern_backend: str = "draw",
+    render_key: str = "",
+    variants: tuple = DEFAULT_VARIANTS,
+    formats: tuple = DEFAULT_FORMATS,
+) -> list[dict]:
+    """
+    Compose the post in each of `formats` and write each of `variants` of it.
+    Returns the save_variants() stats of all the formats, with their "format".
+    """
     date_label = _format_date_label(target_date)
 
     sections: list[tuple[str, list[str]]] = []
@@ -438,266 +857,150 @@ def build_and_save_gt(
     if not sections:
         sections = [("Menu", ["Nessun menu disponibile"])]
 
-    canvas_w, canvas_h = 2160, 2880
-
-    # Generate patterned background (same pattern for the whole day)
-    seed_key = f"{target_date}"
     base_bg = accent_color or POST_BG_COLOR
-    bg_image = _generate_background_pattern(base_bg, canvas_w, canvas_h, seed_key)
-    image = bg_image.convert("RGB")
-
-    # ── Card UI constants (matching mensa-menu-ui.html) ──────────────
-    card_w      = 1660
-    card_radius = 80
-
     # Dynamically derive contrasting UI palette based purely on background hue
     palette = _derive_ui_colors(base_bg)
-    C_CARD_BG     = palette["CARD"]
-    C_TITLE       = palette["TITLE"]
-    C_SECONDARY   = palette["SECONDARY"]
-    C_TAB_BG      = palette["CAT"]
-    C_TAB_ACTIVE  = palette["TAB_ACTIVE"]
-    C_CAT_BG      = palette["CAT"]
-    C_DISH_BG     = palette["DISH"]
-    C_DISH_BORDER = palette["BORDER"]
-
-    # ── Fonts (Nunito, matching mensa-menu-ui.html) ───────────────────
-    title_font = _load_nunito(72, weight=800)   # h2: 18px × 4, weight 800
-    tab_font   = _load_nunito(52, weight=800)   # tab: 13px × 4, weight 800
-    cat_font   = _load_nunito(52, weight=800)   # cat: 13px × 4, weight 800
-    dish_font  = _load_nunito(60, weight=700)   # dish: 15px × 4, weight 700
-    date_font  = _load_nunito(44, weight=800)   # badge text
-    fa_font    = _load_fa_solid(44)             # FontAwesome icons
-
-    # ── Layout constants (≈ 4× scale from 420 px HTML) ──────────────
-    pad_x             = 80       # header side padding: 20px × 4
-    header_top        = 72       # header top padding: 18px × 4
-    header_bottom     = 48       # header bottom padding: 12px × 4
-    tab_margin_top    = 16       # mensa-tabs margin-top: 4px × 4
-    tab_margin_bottom = 48       # mensa-tabs margin-bottom: 12px × 4
-    tab_pad           = 24       # mensa-tabs padding: 6px × 4
-    tab_btn_pad_v     = 32       # tab button padding: 8px × 4
-    tab_radius        = 56       # mensa-tabs border-radius: 14px × 4
-    tab_btn_radius    = 40       # tab button border-radius: 10px × 4
-    list_radius       = 56       # menu-list border-radius: 14px × 4
-    cat_pad_top       = 32       # cat padding-top: 8px × 4
-    cat_pad_bottom    = 16       # cat padding-bottom: 4px × 4
-    cat_pad_x         = 64       # cat padding-left: 16px × 4
-    dish_pad_v        = 48       # dish padding vertical: 12px × 4
-    dish_pad_x        = 64       # dish padding horizontal: 16px × 4
-    dish_border_w     = 4        # border-bottom: 1px × 4
-    bottom_pad        = 80       # body bottom padding: 20px × 4 (matches pad_x)
-
-    # ── Derived metrics ──────────────────────────────────────────────
-    dummy = Image.new("RGB", (1, 1))
-    dd    = ImageDraw.Draw(dummy)
-
-    title_h     = _line_height(dd, title_font)
-    tab_text_h  = _line_height(dd, tab_font)
-    cat_text_h  = _line_height(dd, cat_font)
-    dish_line_h = _line_height(dd, dish_font)
-    date_text_h = _line_height(dd, date_font)
-
-    tab_btn_h       = tab_btn_pad_v * 2 + tab_text_h
-    tab_container_h = tab_pad * 2 + tab_btn_h
-    cat_row_h       = cat_pad_top + cat_text_h + cat_pad_bottom
-    max_dish_text_w = card_w - pad_x * 2 - dish_pad_x * 2
-
-    # ── 1. Measurement pass ──────────────────────────────────────────
-    y_m = header_top + title_h + header_bottom
-    y_m += tab_margin_top + tab_container_h + tab_margin_bottom
-
-    for _, dishes in sections:
-        y_m += cat_row_h
-        for dish in dishes:
-            dish = dish.strip().capitalize()
-            wrapped = _wrap_text(dd, dish, dish_font, max_dish_text_w)
-            y_m += dish_pad_v * 2 + max(1, len(wrapped)) * (dish_line_h + 6) - 6
 
-    y_m += bottom_pad
-    card_h = max(800, min(y_m, 2600))
+    # Seeded from the render key: same inputs, same image (and the same tilt in every format)
+    rng = random.Random(render_key or f"{target_date}_{canteen_name}_{meal_name}")
+    angle = rng.uniform(-4, 4)
 
-    # ── 2. Draw the card ─────────────────────────────────────────────
-    card = Image.new("RGBA", (card_w, card_h), (0, 0, 0, 0))
-    cd   = ImageDraw.Draw(card)
+    stats = []
+    for post_format in formats:
+        image = compose_post(post_format, canteen_name, meal_name, sections, date_label,
+                             target_date, base_bg, palette, angle, pattern_backend)
+        for entry in save_variants(image, format_path(output_path, post_format), variants):
+            entry["format"] = post_format
+            stats.append(entry)
+    return stats
 
-    cd.rounded_rectangle(
-        [(0, 0), (card_w - 1, card_h - 1)],
-        radius=card_radius, fill=C_CARD_BG,
-    )
 
-    y = header_top
+def format_path(output_path: Path, post_format: str) -> Path:
+    """Path of a format: the feed post is `output_path` itself, the others add "_<format>"."""
+    if post_format == "feed":
+        return output_path
+    return output_path.with_name(f"{output_path.stem}_{post_format}{output_path.suffix}")
 
-    # ── Header: title + date badge ───────────────────────────────────
-    cd.text((pad_x, y + title_h // 2), canteen_name, fill=C_TITLE, font=title_font, anchor="lm")
-
-    badge_pad_h, badge_pad_v_ = 36, 16
-    date_w  = _text_width(dd, date_label, date_font)
-    badge_w = date_w + badge_pad_h * 2
-    badge_h = date_text_h + badge_pad_v_ * 2
-    badge_x = card_w - pad_x - badge_w
-    badge_y = y + (title_h - badge_h) // 2
-    cd.rounded_rectangle(
-        [(badge_x, badge_y), (badge_x + badge_w, badge_y + badge_h)],
-        radius=badge_h // 2, fill=C_TAB_BG,
-    )
-    cd.text(
-        (badge_x + badge_pad_h, badge_y + badge_h // 2),
-        date_label, fill=C_SECONDARY, font=date_font, anchor="lm",
-    )
 
-    y += title_h + header_bottom
+def variant_path(output_path: Path, variant: str) -> Path:
+    """Path of a variant: the full-size JPEG is `output_path` itself, the others add a suffix."""
+    spec = OUTPUT_VARIANTS[variant]
+    return output_path.with_name(f"{output_path.stem}{spec['suffix']}{spec['ext']}")
 
-    # ── Tab bar (Pranzo / Cena) ──────────────────────────────────────
-    tab_x       = pad_x
-    tab_y       = y + tab_margin_top
-    tab_total_w = card_w - pad_x * 2
 
-    cd.rounded_rectangle(
-        [(tab_x, tab_y), (tab_x + tab_total_w, tab_y + tab_container_h)],
-        radius=tab_radius, fill=C_TAB_BG,
-    )
+def post_paths(output_path: Path, formats: tuple, variants: tuple) -> list[Path]:
+    """Every file a post writes, for each format and variant."""
+    return [variant_path(format_path(output_path, f), v) for f in formats for v in variants]
 
-    btn_area_w   = tab_total_w - tab_pad * 2
-    single_btn_w = btn_area_w // 2          # each tab is exactly 50%, no gap
-    btn_y        = tab_y + tab_pad
 
-    for idx, tab_label in enumerate(MEAL_ORDER):
-        bx     = tab_x + tab_pad + idx * single_btn_w
-        active = tab_label == meal_name
+def _encode_variant(image: Image.Image, output_path: Path, variant: str) -> dict:
+    start = time.perf_counter()
+    spec = OUTPUT_VARIANTS[variant]
+    out = image
+    if spec["width"] is not None and spec["width"] != image.width:
+        height = round(image.height * spec["width"] / image.width)
+        out = image.resize((spec["width"], height), Image.Resampling.LANCZOS)
+    path = variant_path(output_path, variant)
+    out.save(path, format=spec["format"], **spec["options"])
+    return {"variant": variant, "path": path, "bytes": path.stat().st_size, "seconds": time.perf_counter() - start}
 
-        if active:
-            cd.rounded_rectangle(
-                [(bx, btn_y), (bx + single_btn_w, btn_y + tab_btn_h)],
-                radius=tab_btn_radius, fill=C_TAB_ACTIVE,
-            )
 
-        tw = _text_width(dd, tab_label, tab_font)
-        cd.text(
-            (bx + single_btn_w // 2, btn_y + tab_btn_h // 2),
-            tab_label,
-            fill=C_TITLE if active else C_SECONDARY,
-            font=tab_font,
-            anchor="mm",
-        )
+def save_variants(image: Image.Image, output_path: Path, variants: tuple) -> list[dict]:
+    """
+    Write every variant of a composed post: [{variant, path, bytes, seconds}].
+    Pillow releases the GIL while resizing and encoding, so the variants are
+    encoded in threads (inside each render process).
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if len(variants) <= 1:
+        return [_encode_variant(image, output_path, variant) for variant in variants]
+    with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+        return list(pool.map(lambda variant: _encode_variant(image, output_path, variant), variants))
 
-    y = tab_y + tab_container_h + tab_margin_bottom
 
-    # ── Menu list (rendered into a buffer, masked for rounded corners) ──
-    list_x = pad_x
-    list_w = card_w - pad_x * 2
+def post_render_key(
+    canteen_id: str,
+    meal_name: str,
+    meal_menu: dict,
+    target_date: str,
+    accent_color: str,
+    pattern_backend: str = "draw",
+) -> str:
+    """
+    Content hash of everything that determines a post. The same key always
+    gives the same JPEG: the pattern and palette are derived from the date
+    and canteen, and the card rotation is seeded from the key itself.
+    """
+    payload = {
+        "renderer": RENDERER_VERSION,
+        "date": target_date,
+        "canteen": canteen_id,
+        "meal": meal_name,
+        "menu": {course: meal_menu[course] for course in COURSE_ORDER if meal_menu.get(course)},
+        "palette": accent_color or POST_BG_COLOR,
+        "pattern": [*_pattern_spec(target_date), pattern_backend],
+    }
+    blob = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return sha256_bytes(blob.encode("utf-8"))
 
-    menu_h = 0
-    for _, dishes in sections:
-        menu_h += cat_row_h
-        for dish in dishes:
-            dish = dish.strip().capitalize()
-            wrapped = _wrap_text(dd, dish, dish_font, max_dish_text_w)
-            menu_h += dish_pad_v * 2 + max(1, len(wrapped)) * (dish_line_h + 6) - 6
 
-    max_menu_h = card_h - y - bottom_pad
-    menu_h = min(menu_h, max(max_menu_h, 200))
+def _file_sha256(path: Path) -> str | None:
+    try:
+        return sha256_bytes(path.read_bytes())
+    except FileNotFoundError:
+        return None
 
-    menu_img = Image.new("RGBA", (list_w, menu_h), (0, 0, 0, 0))
-    md = ImageDraw.Draw(menu_img)
 
-    # base fill (dish background colour)
-    md.rounded_rectangle(
-        [(0, 0), (list_w - 1, menu_h - 1)],
-        radius=list_radius, fill=C_DISH_BG,
-    )
+def load_posts_manifest(output_dir: Path) -> dict:
+    """{filename: {"key", "sha256"}} from the posts manifest; empty if missing or of another version."""
+    try:
+        manifest = json.loads((output_dir / POSTS_MANIFEST_FILENAME).read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("version") != POSTS_MANIFEST_VERSION:
+        return {}
+    return manifest.get("posts", {})
 
-    total_dishes  = sum(len(d) for _, d in sections)
-    dish_counter  = 0
-    my            = 0
-    overflow      = False
 
-    for sec_idx, (section_name, dishes) in enumerate(sections):
-        if my >= menu_h or overflow:
-            break
+def save_posts_manifest(output_dir: Path, posts: dict) -> None:
+    # Entries of posts deleted in the meantime are dropped
+    posts = {name: posts[name] for name in sorted(posts) if (output_dir / name).exists()}
+    manifest = {"version": POSTS_MANIFEST_VERSION, "posts": posts}
+    atomic_write(output_dir / POSTS_MANIFEST_FILENAME, json.dumps(manifest, indent=2, ensure_ascii=False) + "\n")
 
-        # ── category header ──
-        cat_icons = {
-            "primi": chr(58091),      # fa-bowl-rice
-            "secondi": chr(63191),    # fa-drumstick-bite
-            "contorni": chr(61548),   # fa-leaf
-            "dolci": chr(127874),     # fa-cake-candles
-        }
-        
-        md.rectangle([(0, my), (list_w - 1, my + cat_row_h - 1)], fill=C_CAT_BG)
-        
-        cat_lower_name = section_name.lower().strip()
-        icon = cat_icons.get(cat_lower_name, "")
-        
-        cx = cat_pad_x
-        if icon:
-            md.text((cx, my + cat_row_h // 2), icon, fill=C_SECONDARY, font=fa_font, anchor="lm")
-            cx += _text_width(dd, icon, fa_font) + 16  # spacing between icon and text
-            
-        md.text(
-            (cx, my + cat_row_h // 2),
-            section_name.upper(), fill=C_SECONDARY, font=cat_font, anchor="lm",
-        )
-        my += cat_row_h
 
-        # ── dishes ──
-        for dish in dishes:
-            dish = dish.strip().capitalize()
-            dish_counter += 1
-            is_last = dish_counter == total_dishes
-
-            wrapped   = _wrap_text(dd, dish, dish_font, max_dish_text_w)
-            content_h = max(1, len(wrapped)) * (dish_line_h + 6) - 6
-            row_h     = dish_pad_v * 2 + content_h
-
-            if my + row_h > menu_h:
-                remaining = menu_h - my
-                if remaining > dish_pad_v + dish_line_h:
-                    first = wrapped[0] if wrapped else dish
-                    ell = f"{first} \u2026"
-                    while (
-                        _text_width(dd, ell, dish_font) > max_dish_text_w
-                        and len(ell) > 3
-                    ):
-                        ell = ell[:-3] + "\u2026"
-                    md.text((dish_pad_x, my + dish_pad_v), ell, fill=C_TITLE, font=dish_font)
-                overflow = True
-                break
+def file_key(render_key: str, post_format: str, variant: str) -> str:
+    """Manifest key of one file: the post's render key plus the specs of its format and variant."""
+    spec = json.dumps({"format": POST_FORMATS[post_format], "variant": OUTPUT_VARIANTS[variant]}, sort_keys=True)
+    return sha256_bytes(f"{render_key}:{spec}".encode("utf-8"))
 
-            # Center text block vertically in the row
-            block_h = max(1, len(wrapped)) * (dish_line_h + 6) - 6
-            text_y = my + (row_h - block_h) // 2
-            for line in wrapped:
-                md.text((dish_pad_x, text_y + dish_line_h // 2), line, fill=C_TITLE, font=dish_font, anchor="lm")
-                text_y += dish_line_h + 6
 
-            if not is_last:
-                border_y = my + row_h - dish_border_w // 2
-                md.line(
-                    [(0, border_y), (list_w, border_y)],
-                    fill=C_DISH_BORDER, width=dish_border_w,
-                )
+def is_cached(posts: dict, files: dict) -> bool:
+    """True if every file ({path: file_key}) was written with that key and has not been touched since."""
+    for path, key in files.items():
+        entry = posts.get(path.name)
+        if not entry or entry.get("key") != key or _file_sha256(path) != entry.get("sha256"):
+            return False
+    return True
 
-            my += row_h
 
-    # rounded-corner mask
-    mask = Image.new("L", (list_w, menu_h), 0)
-    ImageDraw.Draw(mask).rounded_rectangle(
-        [(0, 0), (list_w - 1, menu_h - 1)],
-        radius=list_radius, fill=255,
-    )
-    card.paste(menu_img, (list_x, y), mask)
+def render_post(job: tuple) -> tuple[Path, float, list[dict]]:
+    """Render one post (arguments of build_and_save_gt). Returns (output_path, seconds, variant stats)."""
+    start = time.perf_counter()
+    stats = build_and_save_gt(*job)
+    return job[5], time.perf_counter() - start, stats
 
-    # ── Slight rotation (no shadow) ──────────────────────────────────
-    angle = random.uniform(-4, 4)
-    card_rot = card.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True)
 
-    cx = (canvas_w - card_rot.width)  // 2
-    cy = (canvas_h - card_rot.height) // 2
-    image.paste(card_rot, (cx, cy), card_rot)
-
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    image.save(output_path, format="JPEG", quality=95, dpi=(300, 300))
+def render_posts(jobs: list[tuple], workers: int) -> list[tuple[Path, float, list[dict]]]:
+    """
+    Render all posts, in a process pool when workers > 1.
+    Results come back in the same order as `jobs`, whatever the completion order.
+    """
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        return [render_post(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_post, jobs))
 
 
 def parse_args():
@@ -706,40 +1009,57 @@ def parse_args():
     )
     parser.add_argument("--date", type=str, default=None,
                         help="Data in formato YYYY-MM-DD. Se non fornita usa oggi.")
+    batch = parser.add_mutually_exclusive_group()
+    batch.add_argument("--range", type=parse_date_range, default=None, metavar="INIZIO..FINE",
+                       help="Genera tutte le date con menu nell'intervallo (es. 2026-10-26..2026-11-01) in un'unica run.")
+    batch.add_argument("--days", type=positive_int, default=0, metavar="N",
+                       help="Genera N giorni a partire da --date (o da oggi) in un'unica run.")
     parser.add_argument("--latest", action="store_true",
                         help="Se il menu di oggi non esiste, usa la data più recente disponibile.")
     parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
                         help="Directory di output (default: assets/posts).")
     parser.add_argument("--canteen", type=str, default=None,
                         help="ID o nome di una mensa specifica da generare (es. martiri). Se non fornito, genera per tutte.")
-    return parser.parse_args()
-
-
-def main():
-    args = parse_args()
-    menu_data = load_json(MENU_PATH)
-    canteens  = load_json(CANTEENS_PATH)
-
-    if args.canteen:
-        filtered = [c for c in canteens if slugify(c.get("name", "")) == slugify(args.canteen) or c.get("id") == args.canteen]
-        if not filtered:
-            print(f"Attenzione: nessuna mensa trovata per '{args.canteen}'.")
-            return
-        canteens = filtered
-
-    target_date = pick_target_date(menu_data, args.date, args.latest)
-    day_menu    = menu_data.get(target_date, {})
-    date_tag    = target_date.replace("-", "")
-    generated   = []
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Processi per il rendering in parallelo (default: 1, 0 = tutti i core).")
+    parser.add_argument("--pattern-backend", choices=["draw", "numpy"], default="draw",
+                        help="Disegno dei pattern di sfondo: ImageDraw (default) o NumPy con antialiasing "
+                             "(richiede numpy, vedi scripts/pattern_numpy.py).")
+    parser.add_argument("--formats", type=parse_formats, default=DEFAULT_FORMATS, metavar="F1,F2",
+                        help=f"Formati da comporre per ogni post, tra {', '.join(POST_FORMATS)} (default: feed).")
+    parser.add_argument("--variants", type=parse_variants, default=DEFAULT_VARIANTS, metavar="V1,V2",
+                        help=f"File da scrivere per ogni formato, tra {', '.join(OUTPUT_VARIANTS)} (default: full).")
+    parser.add_argument("--force", action="store_true",
+                        help=f"Rigenera anche i post già presenti con la stessa chiave in {POSTS_MANIFEST_FILENAME}.")
+    args = parser.parse_args()
+    # --date si combina con --days (data di partenza) ma non con --range, che ha già i suoi estremi
+    if args.date and args.range:
+        parser.error("--date non si può usare con --range: indica gli estremi nell'intervallo.")
+    if args.date and args.days:
+        try:
+            dt.date.fromisoformat(args.date)
+        except ValueError:
+            parser.error(f"data non valida: {args.date} (atteso YYYY-MM-DD)")
+    return args
+
+
+def collect_jobs(target_date: str, day_menu: dict, canteens: list, args, posts: dict) -> tuple[list, list, dict]:
+    """
+    Posts of one date: (jobs for render_post, unchanged paths, output_path -> render key).
+    A post is unchanged if the manifest has its key for every file it writes.
+    """
+    date_tag = target_date.replace("-", "")
+    jobs      = []
+    unchanged = []
+    keys      = {}
 
     for canteen in canteens:
         canteen_name = canteen.get("name", "Mensa")
         canteen_id   = canteen.get("id", slugify(canteen_name))
-        
+
         # Color is consistent for the canteen on a specific day
-        bg_seed = f"{date_tag}_{canteen_id}"
         base_color = _random_light_color(target_date, canteen_id)
-        
+
         canteen_menu = collect_canteen_menu(day_menu, canteen_name)
 
         for meal in MEAL_ORDER:
@@ -749,18 +1069,160 @@ def main():
                 continue
 
             accent_color = base_color
-            
 
             filename    = f"{date_tag}_{meal.lower()}_{canteen_id}.jpg"
             output_path = args.output_dir / filename
 
-            build_and_save_gt(canteen_name, meal, meal_menu, target_date, accent_color, output_path)
-            generated.append(output_path)
+            key = post_render_key(canteen_id, meal, meal_menu, target_date, accent_color, args.pattern_backend)
+            files = {
+                variant_path(format_path(output_path, post_format), variant): file_key(key, post_format, variant)
+                for post_format in args.formats for variant in args.variants
+            }
+            if not args.force and is_cached(posts, files):
+                unchanged.append(output_path)
+                continue
+
+            keys[output_path] = key
+            jobs.append((canteen_name, meal, meal_menu, target_date, accent_color, output_path,
+                         args.pattern_backend, key, args.variants, args.formats))
+
+    return jobs, unchanged, keys
+
+
+def _parse_names(value: str, available: dict, what: str) -> tuple:
+    """'a,b' -> ('a', 'b') in the order of `available`."""
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    if not names or names - set(available):
+        raise argparse.ArgumentTypeError(f"{what}: {value} (disponibili: {', '.join(available)})")
+    return tuple(name for name in available if name in names)
+
+
+def parse_variants(value: str) -> tuple:
+    return _parse_names(value, OUTPUT_VARIANTS, "varianti non valide")
 
-    print(f"Data usata: {target_date}")
-    for path in generated:
-        print(f"Generata: {path}")
 
+def parse_formats(value: str) -> tuple:
+    return _parse_names(value, POST_FORMATS, "formati non validi")
+
+
+def positive_int(value: str) -> int:
+    """argparse type for --days: an integer >= 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"numero non valido: {value}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"deve essere almeno 1: {value}")
+    return number
+
+
+def parse_date_range(value: str) -> tuple[str, str]:
+    """'2026-10-26..2026-11-01' -> ('2026-10-26', '2026-11-01')."""
+    first, sep, last = value.partition("..")
+    try:
+        first_date, last_date = dt.date.fromisoformat(first), dt.date.fromisoformat(last)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"intervallo non valido: {value} (atteso YYYY-MM-DD..YYYY-MM-DD)")
+    if not sep or last_date < first_date:
+        raise argparse.ArgumentTypeError(f"intervallo non valido: {value} (atteso YYYY-MM-DD..YYYY-MM-DD)")
+    return first_date.isoformat(), last_date.isoformat()
+
+
+def pick_target_dates(menu_data: dict, args) -> list[str]:
+    """Dates to render: a single one (--date, today, --latest) or those of --range / --days found in menu.json."""
+    if args.range:
+        first, last = args.range
+    elif args.days:
+        first = args.date or dt.date.today().isoformat()
+        last = (dt.date.fromisoformat(first) + dt.timedelta(days=args.days - 1)).isoformat()
+    else:
+        return [pick_target_date(menu_data, args.date, args.latest)]
+
+    dates = sorted(d for d in menu_data if first <= d <= last)
+    if not dates:
+        raise ValueError(f"Nessun menu in menu.json tra il {first} e il {last}")
+    return dates
+
+
+def write_render_index(output_dir: Path, index: dict) -> None:
+    """index.json: date -> files generated / already up to date in the last batch run."""
+    payload = {"dates": {date: index[date] for date in sorted(index)}}
+    atomic_write(output_dir / RENDER_INDEX_FILENAME, json.dumps(payload, indent=2, ensure_ascii=False) + "\n")
+
+
+def main():
+    args = parse_args()
+    # Data loaded once for all the dates; fonts and pattern masks are cached per process
+    menu_data = expand_menu(load_json(MENU_PATH))
+    canteens  = load_json(CANTEENS_PATH)
+
+    if args.canteen:
+        filtered = [c for c in canteens if slugify(c.get("name", "")) == slugify(args.canteen) or c.get("id") == args.canteen]
+        if not filtered:
+            print(f"Attenzione: nessuna mensa trovata per '{args.canteen}'.")
+            return
+        canteens = filtered
+
+    target_dates = pick_target_dates(menu_data, args)
+    posts        = load_posts_manifest(args.output_dir)
+    jobs         = []
+    unchanged    = {}
+    keys         = {}
+
+    for target_date in target_dates:
+        date_jobs, unchanged[target_date], date_keys = collect_jobs(
+            target_date, menu_data.get(target_date, {}), canteens, args, posts
+        )
+        jobs.extend(date_jobs)
+        keys.update(date_keys)
+
+    # All the dates go to the same pool
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    start = time.perf_counter()
+    rendered = render_posts(jobs, workers)
+    elapsed = time.perf_counter() - start
+
+    if rendered:
+        for path, _, stats in rendered:
+            for variant in stats:
+                posts[variant["path"].name] = {
+                    "key": file_key(keys[path], variant["format"], variant["variant"]),
+                    "sha256": _file_sha256(variant["path"]),
+                }
+        save_posts_manifest(args.output_dir, posts)
+
+    rendered_by_date = {target_date: [] for target_date in target_dates}
+    for job, (path, seconds, _) in zip(jobs, rendered):
+        rendered_by_date[job[3]].append((path, seconds))
+
+    for target_date in target_dates:
+        print(f"Data usata: {target_date}")
+        for path, seconds in rendered_by_date[target_date]:
+            print(f"Generata: {path} ({seconds:.2f}s)")
+        for path in unchanged[target_date]:
+            print(f"Invariata: {path}")
+    if rendered:
+        print(f"{len(rendered)} immagini in {elapsed:.2f}s "
+              f"(somma render {sum(s for _, s, _ in rendered):.2f}s, processi: {min(workers, len(rendered))})")
+        for post_format in args.formats:
+            for variant in args.variants:
+                stats = [v for _, _, post_stats in rendered for v in post_stats
+                         if v["format"] == post_format and v["variant"] == variant]
+                print(f"  {post_format + '/' + variant:<20} {len(stats)} file, "
+                      f"{sum(v['bytes'] for v in stats) / len(stats) / 1024:.0f} KB medi, "
+                      f"encoding {sum(v['seconds'] for v in stats) / len(stats) * 1000:.0f} ms medi")
+
+    if args.range or args.days:
+        write_render_index(args.output_dir, {
+            target_date: {
+                "generated": [p.name for path, _ in rendered_by_date[target_date]
+                              for p in post_paths(path, args.formats, args.variants)],
+                "unchanged": [p.name for path in unchanged[target_date]
+                              for p in post_paths(path, args.formats, args.variants)],
+            }
+            for target_date in target_dates
+        })
+        print(f"Indice: {args.output_dir / RENDER_INDEX_FILENAME} ({len(target_dates)} date)")
 
 if __name__ == "__main__":
     main()
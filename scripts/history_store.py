@@ -0,0 +1,322 @@
+"""
+Storico dei menu a segmenti append-only.
+
+Al posto di un unico menu_history.json (riletto, ordinato e riscritto per
+intero ogni notte) lo storico vive in data/history/:
+
+    history/
+      index.json        <- mesi presenti e date contenute in ciascuno
+      2025-09.jsonl.gz  <- mese concluso, compresso (vedi compact())
+      2025-10.jsonl     <- mese in corso: una riga JSON per giorno
+      ...
+
+- append(): aggiunge solo le date nuove in coda al file del mese, poi
+  aggiorna l'indice. Il costo dipende dai giorni aggiunti, non dalla
+  dimensione dello storico.
+- load_month() / iter_days(): i lettori caricano solo i mesi che servono.
+- Le righe di un segmento non sono necessariamente in ordine (un backfill
+  può aggiungere date vecchie); i lettori ordinano. In caso di date
+  duplicate (append interrotto prima di aggiornare l'indice) vale la prima.
+
+I mesi conclusi vengono compattati in archivi gzip (righe ordinate, senza
+duplicati, mtime fisso così lo stesso contenuto produce gli stessi byte).
+index.json fa da manifest: per ogni mese file, date, intervallo first/last
+e, per gli archivi, sha256 del file compresso. Un archivio viene letto e
+decompresso solo quando una query tocca quel mese.
+
+Il vecchio menu_history.json viene convertito una volta con migrate().
+
+    python scripts/history_store.py compact [--data-dir data/unifi]
+    python scripts/history_store.py verify
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+
+from data_io import atomic_write
+
+HISTORY_DIRNAME = 'history'
+INDEX_FILENAME = 'index.json'
+INDEX_VERSION = 1
+LEGACY_FILENAME = 'menu_history.json'
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def month_key(date_str):
+    """'2025-10-03' -> '2025-10'"""
+    return date_str[:7]
+
+
+class HistoryStore:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.root = os.path.join(data_dir, HISTORY_DIRNAME)
+        self.index_path = os.path.join(self.root, INDEX_FILENAME)
+        self.legacy_path = os.path.join(data_dir, LEGACY_FILENAME)
+        self._index = None
+
+    # --- indice ---
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {'version': INDEX_VERSION, 'months': {}}
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        index.setdefault('months', {})
+        return index
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        for entry in self.index['months'].values():
+            if entry['dates']:
+                entry['first'], entry['last'] = entry['dates'][0], entry['dates'][-1]
+        index = {
+            'version': INDEX_VERSION,
+            'months': {m: self.index['months'][m] for m in sorted(self.index['months'])},
+        }
+        atomic_write(self.index_path, json.dumps(index, indent=2, ensure_ascii=False) + '\n')
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def months(self):
+        return sorted(self.index['months'])
+
+    def dates(self):
+        """Tutte le date presenti nello storico, ordinate."""
+        result = []
+        for month in self.months():
+            result.extend(self.index['months'][month]['dates'])
+        return result
+
+    def __contains__(self, date_str):
+        entry = self.index['months'].get(month_key(date_str))
+        return entry is not None and date_str in entry['dates']
+
+    def __len__(self):
+        return sum(len(e['dates']) for e in self.index['months'].values())
+
+    def segment_path(self, month):
+        return os.path.join(self.root, self.index['months'].get(month, {}).get('file', f'{month}.jsonl'))
+
+    # --- lettura ---
+
+    def is_archived(self, month):
+        return self.index['months'].get(month, {}).get('file', '').endswith(ARCHIVE_SUFFIX)
+
+    def _read_segment(self, month):
+        """Testo del segmento di un mese; per gli archivi verifica lo sha256 del manifest."""
+        path = self.segment_path(month)
+        if not self.is_archived(month):
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        with open(path, 'rb') as f:
+            blob = f.read()
+        expected = self.index['months'][month].get('sha256')
+        if expected and hashlib.sha256(blob).hexdigest() != expected:
+            raise ValueError(f"Checksum non valido per {path}")
+        return gzip.decompress(blob).decode('utf-8')
+
+    def load_month(self, month):
+        """dict date_str -> giorno per un mese (vuoto se il mese non esiste)."""
+        if month not in self.index['months'] or not os.path.exists(self.segment_path(month)):
+            return {}
+        days = {}
+        for line in self._read_segment(month).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            day = json.loads(line)
+            days.setdefault(day['date'], day)
+        return dict(sorted(days.items()))
+
+    def iter_days(self, start=None, end=None):
+        """Genera (date_str, giorno) in ordine, leggendo solo i mesi in [start, end]."""
+        for month in self.months():
+            if start and month < month_key(start):
+                continue
+            if end and month > month_key(end):
+                break
+            for date_str, day in self.load_month(month).items():
+                if start and date_str < start:
+                    continue
+                if end and date_str > end:
+                    return
+                yield date_str, day
+
+    def load_all(self):
+        """Tutto lo storico come dict (compatibile con il vecchio menu_history.json)."""
+        return dict(self.iter_days())
+
+    # --- scrittura ---
+
+    def append(self, days):
+        """
+        Aggiunge i giorni (dict date_str -> giorno) non ancora presenti.
+        Le date già nello storico non vengono toccate. Ritorna il numero di date aggiunte.
+        """
+        by_month = {}
+        for date_str in sorted(days):
+            if date_str in self:
+                continue
+            by_month.setdefault(month_key(date_str), []).append(date_str)
+        if not by_month:
+            return 0
+
+        os.makedirs(self.root, exist_ok=True)
+        for month, dates in by_month.items():
+            if self.is_archived(month):
+                # Raro (backfill di date vecchie): si riscrive l'archivio del mese
+                merged = self.load_month(month)
+                merged.update({d: days[d] for d in dates})
+                self._write_archive(month, merged)
+                continue
+            entry = self.index['months'].setdefault(month, {'file': f'{month}.jsonl', 'dates': []})
+            with open(self.segment_path(month), 'a', encoding='utf-8') as f:
+                for date_str in dates:
+                    day = dict(days[date_str])
+                    day.setdefault('date', date_str)
+                    f.write(json.dumps(day, ensure_ascii=False, separators=(',', ':')) + '\n')
+            entry['dates'] = sorted(set(entry['dates']) | set(dates))
+        self._save_index()
+        return sum(len(d) for d in by_month.values())
+
+    def _write_archive(self, month, days):
+        """Scrive il mese come archivio gzip (tmp + fsync + rename) e aggiorna la voce del manifest."""
+        lines = []
+        for date_str in sorted(days):
+            day = dict(days[date_str])
+            day.setdefault('date', date_str)
+            lines.append(json.dumps(day, ensure_ascii=False, separators=(',', ':')) + '\n')
+        blob = gzip.compress(''.join(lines).encode('utf-8'), compresslevel=9, mtime=0)
+
+        filename = f'{month}{ARCHIVE_SUFFIX}'
+        path = os.path.join(self.root, filename)
+        atomic_write(path, blob)
+
+        self.index['months'][month] = {
+            'file': filename,
+            'dates': sorted(days),
+            'sha256': hashlib.sha256(blob).hexdigest(),
+            'bytes': len(blob),
+        }
+
+    def compact(self, before_month):
+        """
+        Comprime i mesi precedenti a `before_month` ('YYYY-MM') ancora in chiaro.
+        Il .jsonl viene rimosso solo dopo che l'archivio è stato scritto e
+        l'indice salvato. Ritorna la lista dei mesi compattati.
+        """
+        compacted = []
+        for month in self.months():
+            if month >= before_month or self.is_archived(month):
+                continue
+            days = self.load_month(month)
+            plain_path = self.segment_path(month)
+            self._write_archive(month, days)
+            compacted.append((month, plain_path))
+        if not compacted:
+            return []
+        self._save_index()
+        for _, plain_path in compacted:
+            if os.path.exists(plain_path):
+                os.remove(plain_path)
+        return [month for month, _ in compacted]
+
+    def verify(self):
+        """Controlla checksum e date di ogni mese rispetto al manifest. Ritorna la lista dei problemi."""
+        problems = []
+        for month in self.months():
+            entry = self.index['months'][month]
+            if not os.path.exists(self.segment_path(month)):
+                problems.append(f"{month}: file {entry['file']} mancante")
+                continue
+            try:
+                dates = sorted(self.load_month(month))
+            except (ValueError, OSError) as e:
+                problems.append(f"{month}: {e}")
+                continue
+            if dates != entry['dates']:
+                problems.append(f"{month}: {len(dates)} date nel file, {len(entry['dates'])} nel manifest")
+        return problems
+
+    def migrate(self):
+        """
+        Converte il vecchio menu_history.json nei segmenti e lo rimuove.
+        Ritorna il numero di date migrate (0 se non c'era nulla da migrare).
+        """
+        if not os.path.exists(self.legacy_path):
+            return 0
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            raw = f.read().strip()
+        legacy = json.loads(raw) if raw else {}
+        migrated = self.append(legacy)
+        if not self.exists():
+            self._save_index()
+        os.remove(self.legacy_path)
+        return migrated
+
+
+def load_history(data_dir):
+    """Storico completo in sola lettura: segmenti se presenti, altrimenti menu_history.json."""
+    store = HistoryStore(data_dir)
+    if store.exists():
+        return store.load_all()
+    legacy_path = os.path.join(data_dir, LEGACY_FILENAME)
+    if not os.path.exists(legacy_path):
+        return {}
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        raw = f.read().strip()
+    return json.loads(raw) if raw else {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manutenzione dello storico menu a segmenti mensili.")
+    parser.add_argument("command", choices=['compact', 'verify'],
+                        help="compact: comprime i mesi conclusi; verify: controlla checksum e date.")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR,
+                        help="Directory dati del sito (default: data/).")
+    parser.add_argument("--before", type=str, default=None,
+                        help="Compatta i mesi precedenti a questo (YYYY-MM, default: mese corrente).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    store = HistoryStore(args.data_dir)
+    migrated = store.migrate()
+    if migrated:
+        print(f"menu_history.json convertito: {migrated} date.")
+    if not store.exists():
+        print(f"Nessuno storico in {args.data_dir}.")
+        return
+
+    if args.command == 'compact':
+        before = args.before or month_key(datetime.date.today().isoformat())
+        compacted = store.compact(before)
+        if compacted:
+            print(f"Compattati {len(compacted)} mesi: {', '.join(compacted)}")
+        else:
+            print("Nessun mese da compattare.")
+    else:
+        problems = store.verify()
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        print(f"{len(store.months())} mesi, {len(store)} date: {'OK' if not problems else f'{len(problems)} problemi'}")
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
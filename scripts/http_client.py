@@ -0,0 +1,158 @@
+"""
+HTTP layer condiviso dagli scraper.
+
+- un solo pool di connessioni (keep-alive) condiviso da tutte le sessioni:
+  ogni mensa mantiene la propria requests.Session (e quindi i propri cookie),
+  ma le connessioni TCP/TLS verso lo stesso host vengono riutilizzate
+- retry solo per errori temporanei (timeout, connessione, 429, 5xx) con
+  backoff esponenziale + jitter, rispettando l'header Retry-After
+- tempi registrati per ogni richiesta, con riepilogo a fine run
+"""
+import datetime
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+DEFAULT_TIMEOUT = 10
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0       # secondi, raddoppia a ogni tentativo
+BACKOFF_MAX = 30.0       # tetto per backoff e Retry-After
+POOL_SIZE = 10
+
+
+class FetchError(Exception):
+    """La richiesta è fallita definitivamente (errore non recuperabile o tentativi esauriti)."""
+
+
+def parse_retry_after(value):
+    """Retry-After in secondi (accetta sia secondi che data HTTP). None se assente/non valido."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class ScraperClient:
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, timeout=DEFAULT_TIMEOUT, sleep=time.sleep):
+        # Retry gestiti qui sotto, non da urllib3
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.sleep = sleep
+        self.rng = random.Random()
+        self.records = []
+        self.lock = threading.Lock()
+
+    def new_session(self):
+        """Nuova sessione (cookie propri) che usa il pool di connessioni condiviso."""
+        session = requests.Session()
+        session.headers.update({'User-Agent': USER_AGENT})
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full jitter: uniforme in [0, base * 2^attempt], con tetto. Retry-After ha la precedenza."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return self.rng.uniform(0, cap)
+
+    def request(self, session, method, url, **kwargs):
+        """
+        Esegue la richiesta con retry sugli errori temporanei.
+        Ritorna la Response (status 2xx/3xx). Solleva FetchError altrimenti.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = 0
+        start = time.perf_counter()
+        while True:
+            attempts += 1
+            retry_after = None
+            try:
+                response = session.request(method, url, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                error = f"{type(e).__name__}: {e}"
+            except requests.RequestException as e:
+                self._record(method, url, None, start, attempts, ok=False)
+                raise FetchError(f"{method} {url}: {e}") from e
+            else:
+                if response.status_code < 400:
+                    self._record(method, url, response.status_code, start, attempts, ok=True)
+                    return response
+                if response.status_code not in RETRYABLE_STATUS:
+                    self._record(method, url, response.status_code, start, attempts, ok=False)
+                    raise FetchError(f"{method} {url}: HTTP {response.status_code}")
+                error = f"HTTP {response.status_code}"
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            if attempts > self.max_retries:
+                self._record(method, url, None, start, attempts, ok=False)
+                raise FetchError(f"{method} {url}: {error} dopo {attempts} tentativi")
+
+            delay = self.backoff_delay(attempts - 1, retry_after)
+            print(f"  ⚠ {error} su {url} (tentativo {attempts}/{self.max_retries + 1}), riprovo tra {delay:.1f}s")
+            self.sleep(delay)
+
+    def _record(self, method, url, status, start, attempts, ok):
+        with self.lock:
+            self.records.append({
+                'method': method,
+                'url': url,
+                'status': status,
+                'elapsed': time.perf_counter() - start,
+                'attempts': attempts,
+                'ok': ok,
+            })
+
+    def summary(self, slowest=5):
+        """Riepilogo testuale dei tempi delle richieste registrate."""
+        with self.lock:
+            records = list(self.records)
+        if not records:
+            return "HTTP: nessuna richiesta."
+
+        times = sorted(r['elapsed'] for r in records)
+
+        def pct(p):
+            return times[min(len(times) - 1, int(p * len(times)))]
+
+        retried = sum(1 for r in records if r['attempts'] > 1)
+        failed = sum(1 for r in records if not r['ok'])
+        lines = [
+            f"HTTP: {len(records)} richieste in {sum(times):.1f}s | "
+            f"p50 {pct(0.5) * 1000:.0f}ms p95 {pct(0.95) * 1000:.0f}ms max {times[-1] * 1000:.0f}ms | "
+            f"con retry {retried} | fallite {failed}"
+        ]
+        for r in sorted(records, key=lambda r: r['elapsed'], reverse=True)[:slowest]:
+            status = r['status'] if r['status'] is not None else 'ERR'
+            lines.append(f"  {r['elapsed'] * 1000:7.0f}ms  {status}  x{r['attempts']}  {r['method']} {r['url']}")
+        return "\n".join(lines)
+
+
+# Client condiviso da tutti gli scraper dello stesso processo
+CLIENT = ScraperClient()
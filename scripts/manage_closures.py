@@ -2,6 +2,8 @@ import json
 import os
 import argparse
 
+from data_io import write_json
+
 FESTE_PATH = "data/feste.json"
 
 def main():
@@ -34,10 +36,8 @@ def main():
     feste[canteen] = [e for e in feste[canteen] if not (e["start_date"] == args.start and e["end_date"] == args.end)]
     feste[canteen].append(new_entry)
 
-    # Scrivi sul file
-    with open(FESTE_PATH, "w", encoding="utf-8") as f:
-        json.dump(feste, f, indent=2, ensure_ascii=False)
-        f.write("\n")
+    # Scrivi sul file (atomico, aggiorna data/manifest.json)
+    write_json(FESTE_PATH, feste, indent=2, trailing_newline=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,376 @@
+"""
+Database SQLite dei menu (menu corrente + storico), ricostruito da
+smart_update.py accanto ai file JSON.
+
+Tabelle:
+  days          (id, date, source)                  source: 'menu' | 'history'
+  meals         (id, day_id, meal)                  'Pranzo' | 'Cena'
+  courses       (id, meal_id, course, position)
+  dishes        (id, course_id, date, name, norm_name, link, position)
+  dish_canteen  (dish_id, canteen)
+  dish_names    (norm_name, first, last, days)     un record per piatto distinto
+
+Indici su days.date, dishes(norm_name, date) e dish_canteen.canteen: le domande
+"dove e quando servono X" e "cosa c'è oggi alla mensa Y" diventano query
+indicizzate invece di scansioni di tutti i JSON. dishes.date è ridondante
+(si ricava da courses -> meals -> days) ma permette di filtrare per periodo
+direttamente sull'indice del nome, senza leggere tutto lo storico del piatto.
+
+dish_names è il dizionario dei nomi: la ricerca per sottostringa (LIKE '%x%',
+che non può usare un indice) scorre solo i nomi distinti, poche migliaia
+anche dopo anni di storico, e poi ogni piatto trovato si risolve con una
+query su idx_dishes_norm_name_date.
+
+Uso:
+    db = MenuDB(os.path.join(DATA_DIR, 'menu.db'))
+    db.dish_schedule('PASTA AL POMODORO', start='2026-03-01')
+    db.canteen_menu('2026-03-02', 'Mensa Martiri')
+    db.last_served('arista', canteen='Mensa Betti', before='2026-03-02')
+"""
+import os
+import re
+import sqlite3
+
+DB_FILENAME = 'menu.db'
+SCHEMA_VERSION = 2
+
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+SCHEMA = """
+CREATE TABLE days (
+    id      INTEGER PRIMARY KEY,
+    date    TEXT NOT NULL UNIQUE,
+    source  TEXT NOT NULL
+);
+CREATE TABLE meals (
+    id      INTEGER PRIMARY KEY,
+    day_id  INTEGER NOT NULL REFERENCES days(id),
+    meal    TEXT NOT NULL,
+    UNIQUE (day_id, meal)
+);
+CREATE TABLE courses (
+    id       INTEGER PRIMARY KEY,
+    meal_id  INTEGER NOT NULL REFERENCES meals(id),
+    course   TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE dishes (
+    id        INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL REFERENCES courses(id),
+    date      TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    norm_name TEXT NOT NULL,
+    link      TEXT,
+    position  INTEGER NOT NULL
+);
+CREATE TABLE dish_canteen (
+    dish_id INTEGER NOT NULL REFERENCES dishes(id),
+    canteen TEXT NOT NULL
+);
+CREATE TABLE dish_names (
+    norm_name TEXT PRIMARY KEY,
+    first     TEXT NOT NULL,
+    last      TEXT NOT NULL,
+    days      INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX idx_meals_day ON meals(day_id);
+CREATE INDEX idx_courses_meal ON courses(meal_id);
+CREATE INDEX idx_dishes_course ON dishes(course_id);
+CREATE INDEX idx_dishes_norm_name_date ON dishes(norm_name, date);
+CREATE INDEX idx_dish_canteen_dish ON dish_canteen(dish_id);
+CREATE INDEX idx_dish_canteen_canteen ON dish_canteen(canteen);
+"""
+
+# Tutte le occorrenze di un piatto con data, pasto e mense
+_OCCURRENCES_SQL = """
+SELECT days.date, meals.meal, courses.course, dishes.id AS dish_id, dishes.name, dishes.link,
+       dish_canteen.canteen
+FROM dishes
+JOIN courses ON courses.id = dishes.course_id
+JOIN meals ON meals.id = courses.meal_id
+JOIN days ON days.id = meals.day_id
+LEFT JOIN dish_canteen ON dish_canteen.dish_id = dishes.id
+"""
+
+
+def _escape_like(term):
+    return normalize_name(term).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def normalize_name(name):
+    """Nome piatto normalizzato per confronti e ricerca: maiuscolo, spazi compressi."""
+    return re.sub(r'\s+', ' ', name or '').strip().upper()
+
+
+def _insert_day(cur, date_str, day, source):
+    cur.execute("INSERT INTO days (date, source) VALUES (?, ?)", (date_str, source))
+    day_id = cur.lastrowid
+    for meal in MEAL_ORDER:
+        courses = day.get(meal)
+        if courses is None:
+            continue
+        cur.execute("INSERT INTO meals (day_id, meal) VALUES (?, ?)", (day_id, meal))
+        meal_id = cur.lastrowid
+        for c_pos, (course, dishes) in enumerate(courses.items()):
+            cur.execute(
+                "INSERT INTO courses (meal_id, course, position) VALUES (?, ?, ?)",
+                (meal_id, course, c_pos),
+            )
+            course_id = cur.lastrowid
+            for d_pos, dish in enumerate(dishes or []):
+                if isinstance(dish, dict):
+                    name, link, canteens = dish.get('name', ''), dish.get('link'), dish.get('available_at', [])
+                else:
+                    name, link, canteens = dish, None, []
+                cur.execute(
+                    "INSERT INTO dishes (course_id, date, name, norm_name, link, position) VALUES (?, ?, ?, ?, ?, ?)",
+                    (course_id, date_str, name.strip(), normalize_name(name), link, d_pos),
+                )
+                dish_id = cur.lastrowid
+                cur.executemany(
+                    "INSERT INTO dish_canteen (dish_id, canteen) VALUES (?, ?)",
+                    [(dish_id, c) for c in canteens],
+                )
+
+
+def build_db(path, menu_days, history_days=()):
+    """
+    Ricostruisce il database da zero (file temporaneo + rename, così i lettori
+    non vedono mai un db a metà). menu_days: dict date -> giorno;
+    history_days: dict o iterabile di (date, giorno). Le date di menu_days
+    hanno la precedenza. Ritorna il numero di giorni inseriti.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        cur = conn.cursor()
+        history_items = history_days.items() if isinstance(history_days, dict) else history_days
+        count = 0
+        for date_str, day in history_items:
+            if date_str in menu_days:
+                continue
+            _insert_day(cur, date_str, day, 'history')
+            count += 1
+        for date_str in sorted(menu_days):
+            _insert_day(cur, date_str, menu_days[date_str], 'menu')
+            count += 1
+        cur.execute(
+            "INSERT INTO dish_names (norm_name, first, last, days) "
+            "SELECT norm_name, MIN(date), MAX(date), COUNT(DISTINCT date) FROM dishes "
+            "WHERE norm_name != '' GROUP BY norm_name"
+        )
+        conn.commit()
+        # Statistiche per il query planner: senza, le join partono da dish_canteen.canteen
+        # (poche mense, indice poco selettivo) invece che dal nome del piatto
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return count
+
+
+def schema_version(path):
+    """user_version di un menu.db esistente (None se manca o non è leggibile)."""
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+class MenuDB:
+    """API di sola lettura sul database dei menu."""
+
+    def __init__(self, path):
+        self.path = path
+        # check_same_thread=False: il bot interroga il db da più task
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+
+    def close(self):
+        self.conn.close()
+
+    def dates(self, start=None, end=None):
+        sql, params = "SELECT date FROM days WHERE 1=1", []
+        if start:
+            sql += " AND date >= ?"
+            params.append(start)
+        if end:
+            sql += " AND date <= ?"
+            params.append(end)
+        return [r['date'] for r in self.conn.execute(sql + " ORDER BY date", params)]
+
+    def dish_schedule(self, dish_name, start=None, end=None):
+        """
+        Dove e quando viene servito un piatto (nome esatto, normalizzato).
+        Returns [{'date', 'meal', 'canteens': [...]}] in ordine di data e pasto.
+        """
+        sql = """
+        SELECT dishes.date, meals.meal, dish_canteen.canteen
+        FROM dishes
+        JOIN courses ON courses.id = dishes.course_id
+        JOIN meals ON meals.id = courses.meal_id
+        LEFT JOIN dish_canteen ON dish_canteen.dish_id = dishes.id
+        WHERE dishes.norm_name = ?
+        """
+        params = [normalize_name(dish_name)]
+        if start:
+            sql += " AND dishes.date >= ?"
+            params.append(start)
+        if end:
+            sql += " AND dishes.date <= ?"
+            params.append(end)
+
+        grouped = {}
+        cur = self.conn.cursor()
+        cur.row_factory = None  # tuple semplici: molte righe per i piatti frequenti
+        for date_str, meal, canteen in cur.execute(sql, params):
+            canteens = grouped.setdefault((date_str, meal), set())
+            if canteen:
+                canteens.add(canteen)
+        return [
+            {'date': date_str, 'meal': meal, 'canteens': sorted(canteens)}
+            for (date_str, meal), canteens in sorted(
+                grouped.items(), key=lambda kv: (kv[0][0], MEAL_ORDER.index(kv[0][1]))
+            )
+        ]
+
+    def search_dishes(self, term, start=None, end=None, limit=50):
+        """
+        Piatti il cui nome contiene `term`.
+        Returns [{'name', 'first', 'last', 'count'}] ordinati per prima data utile.
+        """
+        sql = """
+        SELECT dishes.norm_name AS name, MIN(dishes.date) AS first, MAX(dishes.date) AS last,
+               COUNT(DISTINCT dishes.date || meals.meal) AS count
+        FROM dishes
+        JOIN courses ON courses.id = dishes.course_id
+        JOIN meals ON meals.id = courses.meal_id
+        WHERE dishes.norm_name LIKE ? ESCAPE '\\'
+        """
+        params = [f"%{_escape_like(term)}%"]
+        if start:
+            sql += " AND dishes.date >= ?"
+            params.append(start)
+        if end:
+            sql += " AND dishes.date <= ?"
+            params.append(end)
+        sql += " GROUP BY dishes.norm_name ORDER BY first, name LIMIT ?"
+        params.append(limit)
+        return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def last_served(self, term, canteen=None, before=None, limit=20):
+        """
+        Quando è stato servito l'ultima volta ogni piatto il cui nome contiene
+        `term`, per mensa, con date < before (tutte se None).
+        Returns [{'name', 'last', 'canteens': [{'canteen', 'last', 'meal', 'days'}]}]
+        dal piatto servito più di recente; con `canteen` solo quella mensa.
+        """
+        sql = """
+        SELECT dishes.norm_name, dish_canteen.canteen, MAX(dishes.date), COUNT(DISTINCT dishes.date)
+        FROM dish_names
+        CROSS JOIN dishes ON dishes.norm_name = dish_names.norm_name
+        CROSS JOIN dish_canteen ON dish_canteen.dish_id = dishes.id
+        WHERE dish_names.norm_name LIKE ? ESCAPE '\\'
+        """
+        # CROSS JOIN fissa l'ordine: prima i nomi (pochi), poi gli indici per nome e per piatto
+        params = [f"%{_escape_like(term)}%"]
+        if before:
+            sql += " AND dish_names.first < ? AND dishes.date < ?"
+            params += [before, before]
+        if canteen:
+            sql += " AND dish_canteen.canteen = ?"
+            params.append(canteen)
+        sql += " GROUP BY dishes.norm_name, dish_canteen.canteen"
+
+        by_name = {}
+        cur = self.conn.cursor()
+        cur.row_factory = None
+        for name, c_name, last, days in cur.execute(sql, params):
+            by_name.setdefault(name, []).append({'canteen': c_name, 'last': last, 'days': days})
+        ranked = sorted(
+            ((max(c['last'] for c in canteens), name, canteens) for name, canteens in by_name.items()),
+            reverse=True,
+        )[:limit]
+
+        # Pasto dell'ultimo servizio: Cena se quel giorno c'è stata, altrimenti Pranzo
+        meal_sql = """
+        SELECT meals.meal FROM dishes
+        CROSS JOIN dish_canteen ON dish_canteen.dish_id = dishes.id
+        JOIN courses ON courses.id = dishes.course_id
+        JOIN meals ON meals.id = courses.meal_id
+        WHERE dishes.norm_name = ? AND dishes.date = ? AND dish_canteen.canteen = ?
+        ORDER BY meals.meal = 'Pranzo' LIMIT 1
+        """
+        results = []
+        for last, name, canteens in ranked:
+            for c in canteens:
+                c['meal'] = cur.execute(meal_sql, [name, c['last'], c['canteen']]).fetchone()[0]
+            canteens.sort(key=lambda c: (c['last'], c['canteen']), reverse=True)
+            results.append({'name': name, 'last': last, 'canteens': canteens})
+        return results
+
+    def canteen_menu(self, date_str, canteen, meal=None):
+        """
+        Cosa c'è in una data in una mensa.
+        Returns {meal: {course: [dish_name, ...]}} nell'ordine originale.
+        """
+        sql = """
+        SELECT meals.meal, courses.course, dishes.name
+        FROM days
+        JOIN meals ON meals.day_id = days.id
+        JOIN courses ON courses.meal_id = meals.id
+        JOIN dishes ON dishes.course_id = courses.id
+        JOIN dish_canteen ON dish_canteen.dish_id = dishes.id
+        WHERE days.date = ? AND dish_canteen.canteen = ?
+        """
+        params = [date_str, canteen]
+        if meal:
+            sql += " AND meals.meal = ?"
+            params.append(meal)
+        sql += " ORDER BY meals.meal = 'Cena', courses.position, dishes.position"
+
+        result = {}
+        for row in self.conn.execute(sql, params):
+            result.setdefault(row['meal'], {}).setdefault(row['course'], []).append(row['name'])
+        return result
+
+    def day(self, date_str):
+        """Un giorno nella stessa struttura di menu.json (None se assente)."""
+        day_row = self.conn.execute("SELECT id FROM days WHERE date = ?", [date_str]).fetchone()
+        if day_row is None:
+            return None
+
+        # Pasti e portate anche se vuoti, come in menu.json
+        day = {'date': date_str}
+        for row in self.conn.execute(
+            "SELECT meals.meal, courses.course FROM meals LEFT JOIN courses ON courses.meal_id = meals.id "
+            "WHERE meals.day_id = ? ORDER BY meals.meal = 'Cena', courses.position", [day_row['id']]
+        ):
+            courses = day.setdefault(row['meal'], {})
+            if row['course'] is not None:
+                courses[row['course']] = []
+
+        rows = self.conn.execute(_OCCURRENCES_SQL + """
+            WHERE days.date = ?
+            ORDER BY meals.meal = 'Cena', courses.position, dishes.position, dish_canteen.rowid
+        """, [date_str])
+        last_id = None
+        for row in rows:
+            if row['dish_id'] != last_id:
+                dish = {'name': row['name'], 'link': row['link'], 'available_at': []}
+                day[row['meal']][row['course']].append(dish)
+                last_id = row['dish_id']
+            if row['canteen']:
+                dish['available_at'].append(row['canteen'])
+        return day
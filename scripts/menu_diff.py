@@ -0,0 +1,227 @@
+"""
+Diff strutturale tra due versioni di menu.json.
+
+Ogni piatto viene ridotto a fatti (date, meal, course, dish, canteen) -> link,
+così il confronto non dipende da ordine delle chiavi, formattazione o ordine
+di available_at. Il changeset risultante guida la decisione di riscrivere
+menu.json e viene salvato (menu_changes.json) per gli step successivi
+(generazione immagini, notifiche) che possono elaborare solo ciò che è cambiato.
+
+Il changeset è anche un feed di delta per i consumer (bot, immagini): ogni run
+ha un numero di sequenza crescente e per ogni servizio (data, pasto, mensa)
+toccato riporta l'hash del contenuto prima e dopo. Chi ha applicato la run
+N-1 può aggiornare solo quei servizi; chi ne ha saltata qualcuna ricarica tutto.
+"""
+import datetime
+import hashlib
+import json
+import os
+
+CHANGESET_FILENAME = 'menu_changes.json'
+CHANGESET_VERSION = 2
+
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+
+def menu_facts(days):
+    """dict date_str -> giorno  =>  {(date, meal, course, dish, canteen): link}"""
+    facts = {}
+    for date_str, day in days.items():
+        for meal in MEAL_ORDER:
+            for course, dishes in (day.get(meal) or {}).items():
+                for dish in dishes or []:
+                    if isinstance(dish, dict):
+                        name = dish.get('name', '').strip()
+                        link = dish.get('link')
+                        canteens = dish.get('available_at') or [None]
+                    else:
+                        name, link, canteens = dish.strip(), None, [None]
+                    for canteen in canteens:
+                        facts[(date_str, meal, course, name, canteen)] = link
+    return facts
+
+
+def service_hashes(days):
+    """
+    dict date_str -> giorno  =>  {(date, meal, canteen): hash del contenuto}
+    Il contenuto di un servizio sono i piatti (portata, nome, link) di quella
+    mensa in quel pasto, indipendentemente dall'ordine.
+    """
+    rows = {}
+    for (date_str, meal, course, dish, canteen), link in menu_facts(days).items():
+        rows.setdefault((date_str, meal, canteen), []).append([course, dish, link])
+    hashes = {}
+    for key, items in rows.items():
+        items.sort(key=lambda r: [str(x) for x in r])
+        blob = json.dumps(items, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        hashes[key] = hashlib.sha256(blob).hexdigest()[:16]
+    return hashes
+
+
+def menu_hash(hashes):
+    """Hash dell'intero menu a partire dagli hash dei servizi."""
+    blob = json.dumps(
+        sorted([list(key) + [h] for key, h in hashes.items()], key=lambda r: [str(x) for x in r]),
+        ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf-8')
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+def diff_services(old_hashes, new_hashes):
+    """Servizi con contenuto diverso: [{'date', 'meal', 'canteen', 'old', 'new'}] (None se assente)."""
+    services = []
+    for key in old_hashes.keys() | new_hashes.keys():
+        old, new = old_hashes.get(key), new_hashes.get(key)
+        if old != new:
+            date_str, meal, canteen = key
+            services.append({'date': date_str, 'meal': meal, 'canteen': canteen, 'old': old, 'new': new})
+    services.sort(key=lambda e: (e['date'], MEAL_ORDER.index(e['meal']), e['canteen'] or ''))
+    return services
+
+
+def _entry(meal, course, dish, canteen):
+    return {'meal': meal, 'course': course, 'dish': dish, 'canteen': canteen}
+
+
+def diff_menus(old_days, new_days):
+    """
+    Confronta due dict date_str -> giorno.
+    Returns (days, dates_added, dates_removed):
+      days: date_str -> {'added', 'removed', 'moved', 'relinked'} (solo date cambiate)
+      dates_added / dates_removed: date comparse o sparite del tutto.
+    """
+    old_facts = menu_facts(old_days)
+    new_facts = menu_facts(new_days)
+
+    removed = old_facts.keys() - new_facts.keys()
+    added = new_facts.keys() - old_facts.keys()
+
+    days = {}
+
+    def bucket(date_str):
+        return days.setdefault(date_str, {'added': [], 'removed': [], 'moved': [], 'relinked': []})
+
+    # Stesso piatto, stessa mensa e stesso pasto ma in una portata diversa: spostato
+    removed_by_dish = {}
+    for key in removed:
+        date_str, meal, course, dish, canteen = key
+        removed_by_dish.setdefault((date_str, meal, dish, canteen), []).append(course)
+
+    for key in sorted(added, key=lambda k: tuple(str(x) for x in k)):
+        date_str, meal, course, dish, canteen = key
+        old_courses = removed_by_dish.get((date_str, meal, dish, canteen))
+        if old_courses:
+            old_course = old_courses.pop(0)
+            bucket(date_str)['moved'].append({
+                'meal': meal, 'dish': dish, 'canteen': canteen,
+                'from': old_course, 'to': course,
+            })
+        else:
+            bucket(date_str)['added'].append(_entry(meal, course, dish, canteen))
+
+    for (date_str, meal, dish, canteen), courses in sorted(
+        removed_by_dish.items(), key=lambda kv: tuple(str(x) for x in kv[0])
+    ):
+        for course in courses:
+            bucket(date_str)['removed'].append(_entry(meal, course, dish, canteen))
+
+    for key in old_facts.keys() & new_facts.keys():
+        if old_facts[key] != new_facts[key]:
+            date_str, meal, course, dish, canteen = key
+            bucket(date_str)['relinked'].append(_entry(meal, course, dish, canteen))
+
+    for changes in days.values():
+        changes['relinked'].sort(key=lambda e: tuple(str(v) for v in e.values()))
+
+    dates_added = sorted(new_days.keys() - old_days.keys())
+    dates_removed = sorted(old_days.keys() - new_days.keys())
+    return dict(sorted(days.items())), dates_added, dates_removed
+
+
+def affected(changes):
+    """{meal: [canteen, ...]} toccati dalle modifiche di un giorno."""
+    result = {}
+    for kind in ('added', 'removed', 'moved', 'relinked'):
+        for entry in changes[kind]:
+            canteens = result.setdefault(entry['meal'], set())
+            if entry['canteen'] is not None:
+                canteens.add(entry['canteen'])
+    return {meal: sorted(result[meal]) for meal in MEAL_ORDER if meal in result}
+
+
+def build_changeset(old_days, new_days, archived_dates=(), label=None, sequence=1):
+    """
+    Changeset leggibile da macchina per una run di smart_update.
+    old_days / new_days: menu da oggi in poi (prima e dopo lo scraping).
+    archived_dates: date passate spostate da menu.json allo storico.
+    sequence: numero della run (quello del changeset precedente + 1).
+    """
+    days, dates_added, dates_removed = diff_menus(old_days, new_days)
+    for changes in days.values():
+        changes['affected'] = affected(changes)
+
+    summary = {
+        kind: sum(len(c[kind]) for c in days.values())
+        for kind in ('added', 'removed', 'moved', 'relinked')
+    }
+    summary['dates_changed'] = list(days.keys())
+    summary['dates_added'] = dates_added
+    summary['dates_removed'] = dates_removed
+    summary['dates_archived'] = sorted(archived_dates)
+
+    old_hashes = service_hashes(old_days)
+    new_hashes = service_hashes(new_days)
+    services = diff_services(old_hashes, new_hashes)
+    summary['services_changed'] = len(services)
+
+    return {
+        'version': CHANGESET_VERSION,
+        'sequence': sequence,
+        'site': label,
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'menu_hash': {'old': menu_hash(old_hashes), 'new': menu_hash(new_hashes)},
+        'summary': summary,
+        'services': services,
+        'days': days,
+    }
+
+
+def load_changeset(path):
+    """menu_changes.json come dict; {} se manca, è illeggibile o di un'altra versione."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            changeset = json.load(f)
+    except (json.JSONDecodeError, ValueError):
+        return {}
+    if changeset.get('version') != CHANGESET_VERSION:
+        return {}
+    return changeset
+
+
+def changed_services(changeset):
+    """Insieme di (date, meal, canteen) il cui contenuto è cambiato nella run."""
+    return {(e['date'], e['meal'], e['canteen']) for e in changeset.get('services', [])}
+
+
+def has_changes(changeset):
+    s = changeset['summary']
+    return bool(s['dates_changed'] or s['dates_added'] or s['dates_removed'])
+
+
+def format_changeset(changeset, label):
+    """Riepilogo per il log: una riga per giorno cambiato."""
+    s = changeset['summary']
+    lines = [
+        f"[{label}] Run #{changeset['sequence']} diff menu: +{s['added']} -{s['removed']} ~{s['moved']} spostati, "
+        f"{s['relinked']} link cambiati | giorni nuovi {len(s['dates_added'])}, "
+        f"spariti {len(s['dates_removed'])}, archiviati {len(s['dates_archived'])} | "
+        f"servizi cambiati {s['services_changed']}"
+    ]
+    for date_str, changes in changeset['days'].items():
+        lines.append(
+            f"  {date_str}: +{len(changes['added'])} -{len(changes['removed'])} "
+            f"~{len(changes['moved'])} link {len(changes['relinked'])}"
+        )
+    return '\n'.join(lines)
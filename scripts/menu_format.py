@@ -0,0 +1,201 @@
+"""
+Formato compatto (v2) di menu.json, con dizionario dei piatti e delle mense.
+
+In v1 ogni occorrenza ripete nome, link (~130 caratteri) e nomi completi
+delle mense. In v2:
+
+{
+  "format": "menu-v2",
+  "canteens": ["Mensa Martiri", ...],
+  "dishes":   [["PASTA POMODORO", 688, "pasta-pomodoro"], ["PIATTO SENZA LINK"], ...],
+  "days": {
+    "2026-03-02": {
+      "Pranzo": {"Primi Piatti": [[0, [0, 2], 4, 3, -1], ...]},
+      "Cena": {}
+    }
+  }
+}
+
+Ogni occorrenza è [indice piatto, [indici mense], ...link]:
+  - nessun altro elemento: piatto senza link
+  - tipo, pasto, offset: link ricostruito come
+      .../piatto/<id>-<slug>/<tipo>/<pasto>/<timestamp>
+    dove timestamp è mezzogiorno (Europe/Rome) del giorno + offset giorni
+    (il sito usa il timestamp di un giorno della stessa settimana)
+  - un'unica stringa: link originale che non segue lo schema sopra
+
+expand_menu() riporta i dati alla struttura v1 usata da tutti i consumer;
+load_menu() legge menu.json in entrambi i formati.
+
+    python scripts/menu_format.py [data/menu.json]
+
+confronta dimensione e tempi di parsing dei due formati.
+"""
+import datetime
+import functools
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from zoneinfo import ZoneInfo
+
+FORMAT_V2 = 'menu-v2'
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+LINK_PREFIX = 'https://canteen.dsutoscana.cloud/menu#cbp=https://canteen.dsutoscana.cloud/piatto/'
+LINK_RE = re.compile(r'^' + re.escape(LINK_PREFIX) + r'(\d+)-([^/]+)/(\d+)/(\d+)/(\d+)$')
+
+ROME = ZoneInfo('Europe/Rome')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+@functools.lru_cache(maxsize=None)
+def _noon_ts(date_obj):
+    return int(datetime.datetime.combine(date_obj, datetime.time(12), tzinfo=ROME).timestamp())
+
+
+def is_compact(data):
+    return isinstance(data, dict) and data.get('format') == FORMAT_V2
+
+
+def _encode_link(link, date_obj):
+    """(chiave piatto id/slug, coda dell'occorrenza) per un link v1."""
+    if not link:
+        return None, []
+    m = LINK_RE.match(link)
+    if not m:
+        return None, [link]
+    dish_id, slug, tipo, meal_code, ts = m.groups()
+    ts = int(ts)
+    offset = round((ts - _noon_ts(date_obj)) / 86400)
+    if _noon_ts(date_obj + datetime.timedelta(days=offset)) != ts:
+        return None, [link]
+    return (int(dish_id), slug), [int(tipo), int(meal_code), offset]
+
+
+def encode_menu(days):
+    """dict date_str -> giorno (v1)  =>  dict v2."""
+    canteen_index = {}
+    dish_index = {}
+    out_days = {}
+
+    for date_str, day in days.items():
+        date_obj = datetime.date.fromisoformat(date_str)
+        out_day = {}
+        for meal in MEAL_ORDER:
+            if meal not in day:
+                continue
+            out_meal = {}
+            for course, dishes in day[meal].items():
+                entries = []
+                for dish in dishes:
+                    ref, tail = _encode_link(dish.get('link'), date_obj)
+                    key = (dish['name'],) + (ref or ())
+                    d_idx = dish_index.setdefault(key, len(dish_index))
+                    c_idx = [canteen_index.setdefault(c, len(canteen_index)) for c in dish.get('available_at', [])]
+                    entries.append([d_idx, c_idx] + tail)
+                out_meal[course] = entries
+            out_day[meal] = out_meal
+        out_days[date_str] = out_day
+
+    return {
+        'format': FORMAT_V2,
+        'canteens': list(canteen_index),
+        'dishes': [list(key) for key in dish_index],
+        'days': out_days,
+    }
+
+
+def expand_menu(data):
+    """dict v2  =>  dict date_str -> giorno (v1). I dati già in v1 sono restituiti così come sono."""
+    if not is_compact(data):
+        return data
+
+    canteens = data['canteens']
+    dishes = data['dishes']
+    # Parte fissa del link per ogni piatto, calcolata una volta sola
+    prefixes = [f"{LINK_PREFIX}{d[1]}-{d[2]}/" if len(d) == 3 else None for d in dishes]
+    result = {}
+    for date_str, day in data['days'].items():
+        date_obj = datetime.date.fromisoformat(date_str)
+        timestamps = {}
+        out_day = {'date': date_str}
+        for meal, courses in day.items():
+            out_meal = {}
+            for course, entries in courses.items():
+                out_dishes = []
+                for entry in entries:
+                    d_idx = entry[0]
+                    link = None
+                    if len(entry) == 5:
+                        offset = entry[4]
+                        ts = timestamps.get(offset)
+                        if ts is None:
+                            ts = timestamps[offset] = _noon_ts(date_obj + datetime.timedelta(days=offset))
+                        link = f"{prefixes[d_idx]}{entry[2]}/{entry[3]}/{ts}"
+                    elif len(entry) == 3:
+                        link = entry[2]
+                    out_dishes.append({
+                        'name': dishes[d_idx][0],
+                        'link': link,
+                        'available_at': [canteens[i] for i in entry[1]],
+                    })
+                out_meal[course] = out_dishes
+            out_day[meal] = out_meal
+        result[date_str] = out_day
+    return result
+
+
+def dumps_menu(days, compact=False):
+    """Serializzazione minificata di menu.json nel formato richiesto."""
+    data = encode_menu(days) if compact else days
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+
+def load_menu(path):
+    """menu.json (v1 o v2) come dict date_str -> giorno. {} se manca o è vuoto."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = f.read()
+    if not raw.strip():
+        return {}
+    return expand_menu(json.loads(raw))
+
+
+def compare_formats(days, repeat=20):
+    """Dimensioni (raw e gzip) e tempo di parsing di v1 e v2 per gli stessi dati."""
+    rows = []
+    for label, compact in (('v1', False), ('v2', True)):
+        text = dumps_menu(days, compact=compact)
+        raw = text.encode('utf-8')
+        start = time.perf_counter()
+        for _ in range(repeat):
+            json.loads(text)
+        parse = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expand_menu(json.loads(text))
+        load = (time.perf_counter() - start) / repeat
+        rows.append((label, len(raw), len(gzip.compress(raw)), parse, load))
+    return rows
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(DATA_DIR, 'menu.json')
+    days = load_menu(path)
+    if not days:
+        print(f"Nessun dato in {path}.")
+        return
+
+    restored = expand_menu(json.loads(dumps_menu(days, compact=True)))
+    print(f"{path}: {len(days)} giorni, round-trip v2 -> v1 {'OK' if restored == days else 'DIVERSO'}")
+    print(f"{'formato':<8} {'byte':>10} {'gzip':>10} {'parse':>10} {'parse+expand':>14}")
+    for label, size, gz, parse, load in compare_formats(days):
+        print(f"{label:<8} {size:>10} {gz:>10} {parse * 1000:>8.1f}ms {load * 1000:>12.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+Registro dei siti (UNIPI, UNIFI, ...) serviti dal bot.
+
+Ogni sito ha la sua directory dati (menu.json, canteens.json, menu.db, ...)
+e viene caricato in uno snapshot SiteData indipendente:
+
+- canteens.json (piccolo) viene letto subito; menu, menu.db, statistiche e
+  previsioni solo al primo uso del sito (lazy=True) oppure all'avvio per il
+  sito principale.
+- Le stringhe ripetute (date, pasti, portate, nomi piatti, mense) passano da
+  sys.intern: tra giorni, file e siti diversi resta una sola copia.
+- refresh() applica l'ultima run di smart_update (menu_changes.json):
+  ricarica i dati e invalida solo i testi dei servizi cambiati. Gli hash
+  di manifest.json (scripts/data_io.py) dicono quali file sono cambiati:
+  gli altri non vengono ri-parsati.
+
+Le query inline possono iniziare con un alias del sito ("fi p:arista"),
+i callback dei siti non principali hanno il prefisso "<id>:".
+
+    registry = SiteRegistry(DATA_DIR)
+    site, rest = registry.route_query("fi p:arista")
+    site.menu, site.canteens, site.db
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+from data_io import load_manifest
+from dish_predictions import PREDICTIONS_FILENAME, load_predictions
+from dish_stats import STATS_FILENAME, load_stats
+from history_store import load_history
+from menu_db import DB_FILENAME, SCHEMA_VERSION, MenuDB, build_db, schema_version
+from menu_diff import CHANGESET_FILENAME, changed_services, load_changeset
+from menu_format import expand_menu
+
+logger = logging.getLogger(__name__)
+
+# Il primo sito è quello principale: query senza alias e callback senza prefisso
+SITES = [
+    {'id': 'pi', 'label': 'UNIPI', 'subdir': '', 'aliases': ['pi', 'pisa', 'unipi'], 'lazy': False},
+    {'id': 'fi', 'label': 'UNIFI', 'subdir': 'unifi', 'aliases': ['fi', 'firenze', 'unifi'], 'lazy': True},
+]
+
+MEAL_ORDER = ['Pranzo', 'Cena']
+
+
+def site_dirs(data_root):
+    """[(data_dir, label)] di tutti i siti, nell'ordine del registro (per smart_update)."""
+    return [(os.path.join(data_root, s['subdir']) if s['subdir'] else data_root, s['label']) for s in SITES]
+
+
+def intern_menu(days):
+    """Internalizza (in place) le stringhe ripetute di un menu v1. Ritorna un nuovo dict con chiavi internalizzate."""
+    result = {}
+    for date_str, day in days.items():
+        out_day = {}
+        for key, value in day.items():
+            if key in MEAL_ORDER and isinstance(value, dict):
+                out_day[sys.intern(key)] = {
+                    sys.intern(course): [_intern_dish(d) for d in dishes or []]
+                    for course, dishes in value.items()
+                }
+            else:
+                out_day[sys.intern(key)] = sys.intern(value) if isinstance(value, str) else value
+        result[sys.intern(date_str)] = out_day
+    return result
+
+
+def _intern_dish(dish):
+    if not isinstance(dish, dict):
+        return sys.intern(dish)
+    dish['name'] = sys.intern(dish.get('name', ''))
+    dish['available_at'] = [sys.intern(c) for c in dish.get('available_at', [])]
+    return dish
+
+
+def _read_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.error(f"Errore: {path} non trovato!")
+        return default
+
+
+class SiteData:
+    """Snapshot dei dati di un sito."""
+
+    def __init__(self, spec, data_root):
+        self.id = spec['id']
+        self.label = spec['label']
+        self.aliases = spec['aliases']
+        self.lazy = spec['lazy']
+        self.data_dir = os.path.join(data_root, spec['subdir']) if spec['subdir'] else data_root
+
+        self.canteens_full = _read_json(os.path.join(self.data_dir, 'canteens.json'), [])
+        # id -> nome, come il vecchio CANTEENS del bot
+        self.canteens = {c['id']: sys.intern(c['name']) for c in self.canteens_full}
+
+        self.loaded = False
+        self.menu = {}
+        self.db = None
+        self.stats = {}
+        self.predictions = {}
+        # Testi dei menu già formattati: (data, pasto, mensa) -> corpo del messaggio
+        self.text_cache = {}
+        self.sequence = 0
+        # filename -> sha256 del manifest all'ultima lettura
+        self.versions = {}
+        self.prefix = f"{self.id}:"
+
+    def path(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def load(self):
+        """Carica menu, menu.db, statistiche e previsioni (una volta sola)."""
+        if self.loaded:
+            return self
+        files = load_manifest(self.data_dir)['files']
+        versions = {}
+        self._stale(files, CHANGESET_FILENAME, versions)
+        self._stale(files, 'menu.json', versions)
+        self.sequence = load_changeset(self.path(CHANGESET_FILENAME)).get('sequence', 0)
+        self.menu = self.load_menu()
+        self.db = self.load_db()
+        indexes = self.read_indexes(files, versions)
+        self.stats = indexes.get('stats', self.stats)
+        self.predictions = indexes.get('predictions', self.predictions)
+        self.versions.update(versions)
+        self.loaded = True
+        logger.info(f"[{self.label}] caricato: {len(self.menu)} giorni, {len(self.canteens)} mense.")
+        return self
+
+    def load_menu(self):
+        # menu.json può essere nel formato compatto v2 (scripts/menu_format.py)
+        return intern_menu(expand_menu(_read_json(self.path('menu.json'), {})))
+
+    def load_db(self, menu=None):
+        """
+        menu.db (menu + storico, indicizzato). Lo genera smart_update.py; non è
+        versionato, quindi se manca, è di uno schema vecchio o è più vecchio di
+        menu.json lo ricostruiamo qui (da `menu`, default quello caricato).
+        None se non è utilizzabile.
+        """
+        menu = self.menu if menu is None else menu
+        path = self.path(DB_FILENAME)
+        menu_path = self.path('menu.json')
+        try:
+            if schema_version(path) != SCHEMA_VERSION or (
+                os.path.exists(menu_path) and os.path.getmtime(path) < os.path.getmtime(menu_path)
+            ):
+                days = build_db(path, menu, load_history(self.data_dir))
+                logger.info(f"[{self.label}] menu.db ricostruito con {days} giorni.")
+            return MenuDB(path)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.error(f"[{self.label}] menu.db non disponibile, uso solo menu.json: {e}")
+            return None
+
+    def _stale(self, files, filename, versions):
+        """
+        True se il file va (ri)letto: hash diverso dall'ultima lettura o assente
+        dal manifest. Il nuovo hash va in `versions`, non in self.versions: lo
+        registra il chiamante solo dopo aver letto e applicato il file.
+        """
+        digest = files.get(filename, {}).get('sha256')
+        if digest is not None and digest == self.versions.get(filename):
+            return False
+        versions[filename] = digest
+        return True
+
+    def read_indexes(self, files, versions):
+        """{'stats': ..., 'predictions': ...} con i soli indici cambiati dall'ultima lettura."""
+        # Statistiche (scripts/dish_stats.py) e previsioni (scripts/dish_predictions.py): nome normalizzato -> dati
+        indexes = {}
+        if self._stale(files, STATS_FILENAME, versions):
+            stats = load_stats(self.path(STATS_FILENAME)).get('dishes', {})
+            indexes['stats'] = {sys.intern(name): entry for name, entry in stats.items()}
+        if self._stale(files, PREDICTIONS_FILENAME, versions):
+            predictions = load_predictions(self.path(PREDICTIONS_FILENAME)).get('dishes', {})
+            indexes['predictions'] = {
+                sys.intern(name): [[d, m, [sys.intern(c) for c in cs], conf] for d, m, cs, conf in rows]
+                for name, rows in predictions.items()
+            }
+        return indexes
+
+    def invalidate(self, changeset):
+        """Rimuove dalla cache solo i testi dei servizi cambiati (più le viste TUTTE e senza mensa)."""
+        dropped = 0
+        for date_str, meal, canteen in changed_services(changeset):
+            if canteen is None:
+                # Piatto senza available_at: compare in tutte le mense, quindi in tutti i testi del servizio
+                stale = [key for key in self.text_cache if key[:2] == (date_str, meal)]
+                for key in stale:
+                    del self.text_cache[key]
+                dropped += len(stale)
+                continue
+            for name in {canteen, 'TUTTE', None}:
+                if self.text_cache.pop((date_str, meal, name), None) is not None:
+                    dropped += 1
+        return dropped
+
+    def refresh(self):
+        """
+        Applica una nuova run di smart_update, se c'è. Ritorna
+        (sequenza precedente, sequenza nuova, servizi cambiati, testi invalidati)
+        oppure None se non c'era nulla da fare.
+        """
+        update = self.prepare_refresh()
+        return self.apply_refresh(update) if update else None
+
+    def prepare_refresh(self):
+        """
+        Parte lenta di refresh(): legge changeset, menu.json e indici e, se
+        serve, ricostruisce menu.db, senza toccare lo stato del sito (nemmeno
+        gli hash già letti: se qui qualcosa fallisce il prossimo giro riprova).
+        Può girare in un thread (asyncio.to_thread). None se non c'è nulla da fare.
+        """
+        if not self.loaded:
+            return None
+        files = load_manifest(self.data_dir)['files']
+        versions = {}
+        if not self._stale(files, CHANGESET_FILENAME, versions):
+            return None
+        changeset = load_changeset(self.path(CHANGESET_FILENAME))
+        sequence = changeset.get('sequence', 0)
+        if sequence == self.sequence:
+            # File riscritto con la stessa run: basta ricordarne l'hash
+            return {'versions': versions}
+
+        menu = self.load_menu() if self._stale(files, 'menu.json', versions) else self.menu
+        return {
+            'changeset': changeset,
+            'sequence': sequence,
+            'menu': menu,
+            'db': self.load_db(menu),
+            **self.read_indexes(files, versions),
+            'versions': versions,
+        }
+
+    def apply_refresh(self, update):
+        """
+        Sostituisce tutti insieme i dati preparati da prepare_refresh() e
+        invalida i testi in cache. Va chiamata dall'event loop del bot: gli
+        handler vedono o solo i dati vecchi o solo quelli nuovi. None se
+        l'aggiornamento registra solo gli hash letti.
+        """
+        self.versions.update(update['versions'])
+        if 'sequence' not in update:
+            return None
+        changeset, sequence = update['changeset'], update['sequence']
+        old_db = self.db
+        self.menu, self.db = update['menu'], update['db']
+        self.stats = update.get('stats', self.stats)
+        self.predictions = update.get('predictions', self.predictions)
+        if old_db is not None:
+            old_db.close()
+
+        if sequence == self.sequence + 1:
+            dropped = self.invalidate(changeset)
+        else:
+            # Run saltate (o file rigenerato): non sappiamo cosa è cambiato nel mezzo
+            dropped = len(self.text_cache)
+            self.text_cache.clear()
+        # Giorni passati nello storico
+        for key in [k for k in self.text_cache if k[0] not in self.menu]:
+            del self.text_cache[key]
+
+        previous, self.sequence = self.sequence, sequence
+        return previous, sequence, len(changeset.get('services', [])), dropped
+
+    def callback(self, data):
+        """callback_data per un bottone di questo sito (senza prefisso per il sito principale)."""
+        return self.prefix + data
+
+
+class SiteRegistry:
+    def __init__(self, data_root, specs=SITES):
+        self.sites = [SiteData(spec, data_root) for spec in specs]
+        self.default = self.sites[0]
+        self.default.prefix = ''
+        self._by_alias = {alias: site for site in self.sites for alias in site.aliases}
+        self._by_id = {site.id: site for site in self.sites}
+        for site in self.sites:
+            if not site.lazy:
+                site.load()
+
+    def get(self, site_id=None):
+        """Sito per id (caricandolo se serve); quello principale se None o sconosciuto."""
+        return self._by_id.get(site_id, self.default).load()
+
+    def loaded(self):
+        return [site for site in self.sites if site.loaded]
+
+    def route_query(self, query):
+        """'fi p:arista' -> (sito UNIFI, 'p:arista'). Senza alias: (sito principale, query)."""
+        head, _, rest = query.partition(' ')
+        site = self._by_alias.get(head.lower())
+        if site is None:
+            return self.default.load(), query
+        return site.load(), rest.lstrip()
+
+    def route_callback(self, data):
+        """'fi:nav|...' -> (sito UNIFI, 'nav|...'). I callback senza prefisso sono del sito principale."""
+        prefix, sep, rest = data.partition(':')
+        if sep and '|' not in prefix and prefix in self._by_id:
+            return self._by_id[prefix].load(), rest
+        return self.default.load(), data
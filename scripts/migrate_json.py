@@ -2,6 +2,8 @@ import json
 import re
 import os
 
+from data_io import write_json
+
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 
 DAYS_MAP = {
@@ -73,8 +75,7 @@ def migrate():
             
             canteen["opening_hours"] = new_oh
             
-    with open(os.path.join(DATA_DIR, "canteens.json"), "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    write_json(os.path.join(DATA_DIR, "canteens.json"), data, indent=2)
         
     print("Migration complete.")
 
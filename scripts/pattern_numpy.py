@@ -0,0 +1,362 @@
+"""
+NumPy backend for the post background patterns (alternative to ImageDraw).
+
+Each pattern is computed as a distance field from its geometry (lines,
+dots, rings, segments) and turned into an antialiased 8-bit mask:
+coverage = clip(half_width + 0.5 - distance, 0, 1). The float maths never
+runs on the full canvas: periodic patterns are computed on one cell,
+quantized and tiled; stripes and the diamond grid are 1-D profiles spread
+over the canvas with broadcasting / sliding-window views; the rings use
+one quadrant.
+
+Geometry (phase, spacing, thickness) is the same as
+generate_menu_images._pattern_mask, so the two backends are
+interchangeable: only the edges differ (antialiased here, aliased there).
+Patterns without a vectorized version (triangles) return None and the
+caller falls back to ImageDraw.
+
+    python scripts/pattern_numpy.py [--repeat 3]
+
+times both backends, reports how far apart they are and checks both
+against the reference images in test/patterns/.
+"""
+import argparse
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+REFERENCE_DIR = REPO_ROOT / "test" / "patterns"
+
+# Colour the reference images were rendered with
+REFERENCE_BASE_COLOR = "#E6E7EB"
+
+# (spacing, thickness) measured on the reference images, which predate the
+# current 240-360 px spacing
+REFERENCE_SPECS = {
+    "dot_grid":           (180, None),
+    "diagonal_stripes":   (160, 30),
+    "crosshatch":         (180, 20),
+    "diamond_grid":       (200, 20),
+    "zigzag":             (180, 18),
+    "concentric_circles": (180, 18),
+    "plus_grid":          (200, 18),
+    "waves":              (180, 20),
+    "x_shapes":           (200, 25),
+    "vertical_stripes":   (160, 40),
+    "horizontal_stripes": (160, 40),
+}
+
+# Mean absolute difference (0-255, after phase alignment) allowed against a reference
+REFERENCE_TOLERANCE = 6.0
+
+
+def _wrap(v, period):
+    """Signed offset from the nearest multiple of `period` (in [-period/2, period/2))."""
+    # floor() instead of % : the float modulo is several times slower on large arrays
+    return v - period * np.floor(v / period + 0.5)
+
+
+def _cover(distance, half_width):
+    """Antialiased coverage of a band of `half_width` around distance 0."""
+    return np.clip(half_width + 0.5 - distance, 0.0, 1.0)
+
+
+def _line_center(thickness):
+    # ImageDraw puts the extra pixel of an even-width horizontal/vertical line after the axis
+    return 0.5 if thickness % 2 == 0 else 0.0
+
+
+def _quantize(cover, value):
+    return (cover * value + 0.5).astype(np.uint8)
+
+
+def _tile(cell, width, height, x0, y0):
+    """Repeat `cell` over width x height so that cell[0, 0] lands on (x0, y0) modulo its size."""
+    ph, pw = cell.shape
+    rolled = np.roll(cell, (y0 % ph, x0 % pw), axis=(0, 1))
+    return np.tile(rolled, (height // ph + 1, width // pw + 1))[:height, :width]
+
+
+def _cell_coords(pw, ph):
+    ly, lx = np.mgrid[0:ph, 0:pw].astype(np.float32)
+    return lx, ly
+
+
+def _segment_cover(lx, ly, x0, y0, x1, y1, half_width):
+    """Coverage of a butt-ended segment of width 2 * half_width, like ImageDraw.line."""
+    length = math.hypot(x1 - x0, y1 - y0)
+    ux, uy = (x1 - x0) / length, (y1 - y0) / length
+    along = (lx - x0) * ux + (ly - y0) * uy
+    perp = np.abs((lx - x0) * -uy + (ly - y0) * ux)
+    return _cover(perp, half_width) * np.clip(np.minimum(along, length - along) + 0.5, 0.0, 1.0)
+
+
+def _stripes(width, height, spacing, thickness, value, origin, axis):
+    profile_len = width if axis == "x" else height
+    d = np.abs(_wrap(np.arange(profile_len, dtype=np.float32) - origin - _line_center(thickness), spacing))
+    profile = _quantize(_cover(d, thickness / 2), value)
+    if axis == "x":
+        return np.broadcast_to(profile[None, :], (height, width))
+    return np.broadcast_to(profile[:, None], (height, width))
+
+
+def _dot_grid(width, height, spacing, value):
+    radius = spacing // 4 + 0.5
+    ox = (width // 2) % spacing
+    oy = (height // 2) % spacing
+    lx = np.arange(spacing, dtype=np.float32)[None, :]
+    ly = np.arange(2 * spacing, dtype=np.float32)[:, None]
+    even = np.hypot(_wrap(lx, spacing), _wrap(ly, 2 * spacing))
+    odd = np.hypot(_wrap(lx - spacing // 2, spacing), _wrap(ly - spacing, 2 * spacing))
+    cell = _quantize(_cover(np.minimum(even, odd), radius), value)
+    # Row 0 of the grid is at oy - 2 * spacing
+    return _tile(cell, width, height, ox, oy - 2 * spacing)
+
+
+def _diagonal_stripes(width, height, spacing, thickness, value):
+    size = (width + height) * 2
+    ox = -(size - width) // 2
+    oy = -(size - height) // 2
+    # Lines x - y = i + ox - oy, for i = -size + k * spacing
+    c = (-size + ox - oy) % spacing
+    lx, ly = _cell_coords(spacing, spacing)
+    d = np.abs(_wrap(lx - ly - c, spacing)) / math.sqrt(2)
+    return _tile(_quantize(_cover(d, thickness / 2), value), width, height, 0, 0)
+
+
+def _crosshatch(width, height, spacing, thickness, value):
+    ox = (width // 2) % spacing
+    oy = (height // 2) % spacing
+    return np.maximum(
+        _stripes(width, height, spacing, thickness, value, ox, "x"),
+        _stripes(width, height, spacing, thickness, value, oy, "y"),
+    )
+
+
+def _diamond_grid(width, height, spacing, thickness, value):
+    # Square grid drawn on a (w+h)*2 square, rotated 45° around its centre and cropped.
+    # Inverse of Image.rotate(45), output pixel (x, y) -> source (qx, qy):
+    #   qx = ((x + left + 0.5 - c) - (y + top + 0.5 - c)) / sqrt(2) + c - 0.5   (depends on x - y)
+    #   qy = ((x + left + 0.5 - c) + (y + top + 0.5 - c)) / sqrt(2) + c - 0.5   (depends on x + y)
+    size = (width + height) * 2
+    c = size // 2
+    left = -(-(size - width) // 2)
+    top = -(-(size - height) // 2)
+    line = (-size) % spacing + _line_center(thickness)
+    half = thickness / 2
+    k = math.sqrt(0.5)
+
+    s = np.arange(-(height - 1), width, dtype=np.float32)          # x - y
+    qx = (s + left - top) * k + c - 0.5
+    profile_x = _quantize(_cover(np.abs(_wrap(qx - line, spacing)), half), value)
+    t = np.arange(0, width + height - 1, dtype=np.float32)         # x + y
+    qy = (t + left + top + 1 - 2 * c) * k + c - 0.5
+    profile_y = _quantize(_cover(np.abs(_wrap(qy - line, spacing)), half), value)
+
+    # Row y reads profile_x[x - y + height - 1] and profile_y[x + y]: sliding windows, no copies
+    windows_x = np.lib.stride_tricks.sliding_window_view(profile_x, width)[::-1]
+    windows_y = np.lib.stride_tricks.sliding_window_view(profile_y, width)[:height]
+    return np.maximum(windows_x, windows_y)
+
+
+def _zigzag(width, height, spacing, thickness, value):
+    amplitude = spacing // 2
+    step = 60
+    ox = (width // 2) % (step * 2)
+    oy = (height // 2) % spacing
+    # Cell of one period: x in [0, 2 * step), y in [0, spacing), band axis at y = 0.
+    # x // step even -> -amplitude, odd -> +amplitude
+    lx, ly = _cell_coords(2 * step, spacing)
+    cover = np.zeros_like(lx)
+    for k in range(-1, 3):
+        x0, x1 = k * step, (k + 1) * step
+        y0 = amplitude if k % 2 else -amplitude
+        for band in (-1, 0, 1):
+            base = band * spacing
+            cover = np.maximum(cover, _segment_cover(lx, ly, x0, base + y0, x1, base - y0, thickness / 2))
+    return _tile(_quantize(cover, value), width, height, ox, oy)
+
+
+def _concentric_circles(width, height, spacing, thickness, value):
+    cx, cy = width // 2, height // 2
+    max_r = int((width ** 2 + height ** 2) ** 0.5 // 2) + 200
+    last = (max_r - 1) // spacing
+    # One quadrant of |dx|, |dy|, then mirrored onto the canvas with a single gather
+    dx = np.arange(max(cx, width - cx) + 1, dtype=np.float32)
+    dy = np.arange(max(cy, height - cy) + 1, dtype=np.float32)[:, None]
+    d = np.hypot(dx[None, :], dy)
+    # ImageDraw outlines grow inwards from the bounding box: ring k covers [k*spacing - thickness + 1, k*spacing]
+    inset = (thickness - 1) / 2
+    k = np.clip(np.rint((d + inset) / spacing), 1, last)
+    quadrant = _quantize(_cover(np.abs(d - (k * spacing - inset)), thickness / 2), value)
+    rows = np.abs(np.arange(height) - cy)
+    cols = np.abs(np.arange(width) - cx)
+    return quadrant[rows[:, None], cols[None, :]]
+
+
+def _plus_grid(width, height, spacing, thickness, value, diagonal=False):
+    arm = spacing // 3
+    ox = (width // 2) % spacing
+    oy = (height // 2) % spacing
+    lx, ly = _cell_coords(spacing, spacing)
+    dx, dy = _wrap(lx, spacing), _wrap(ly, spacing)
+    half = thickness / 2
+    if diagonal:
+        a, b = (dx + dy) / math.sqrt(2), (dx - dy) / math.sqrt(2)
+        reach = arm * math.sqrt(2) + 0.5
+        cell = np.maximum(
+            _cover(np.abs(b), half) * _cover(np.abs(a), reach),
+            _cover(np.abs(a), half) * _cover(np.abs(b), reach),
+        )
+    else:
+        c = _line_center(thickness)
+        cell = np.maximum(
+            _cover(np.abs(dy - c), half) * _cover(np.abs(dx), arm + 0.5),
+            _cover(np.abs(dx - c), half) * _cover(np.abs(dy), arm + 0.5),
+        )
+    return _tile(_quantize(cell, value), width, height, ox, oy)
+
+
+def _waves(width, height, spacing, thickness, value):
+    amplitude = spacing // 3
+    oy = (height // 2) % spacing
+    cx = width / 2.0
+    # Same polyline as ImageDraw: a point every 40 px, y truncated to int
+    xs = np.arange(-40, width + 80, 40)
+    ys = (np.sin((xs - cx) / 100.0) * amplitude).astype(int).astype(np.float32)
+    cols = np.arange(width, dtype=np.float32)
+    center = np.interp(cols, xs, ys)
+    slope = np.diff(ys)[np.clip(np.searchsorted(xs, cols, side="right") - 1, 0, len(xs) - 2)] / 40.0
+    # Vertical distance to the nearest band, scaled to the distance perpendicular to the segment
+    band = np.arange(spacing, dtype=np.float32)[:, None]
+    d = np.abs(_wrap(band - center[None, :], spacing)) / np.sqrt(1 + slope ** 2)[None, :]
+    return _tile(_quantize(_cover(d, thickness / 2), value), width, height, 0, oy)
+
+
+def pattern_mask(pattern_type, spacing, thickness, width, height, value):
+    """L mask (0..value, antialiased) for a pattern, or None if there is no vectorized version."""
+    if pattern_type == "dot_grid":
+        mask = _dot_grid(width, height, spacing, value)
+    elif pattern_type == "diagonal_stripes":
+        mask = _diagonal_stripes(width, height, spacing, thickness, value)
+    elif pattern_type == "crosshatch":
+        mask = _crosshatch(width, height, spacing, thickness, value)
+    elif pattern_type == "diamond_grid":
+        mask = _diamond_grid(width, height, spacing, thickness, value)
+    elif pattern_type == "zigzag":
+        mask = _zigzag(width, height, spacing, thickness, value)
+    elif pattern_type == "concentric_circles":
+        mask = _concentric_circles(width, height, spacing, thickness, value)
+    elif pattern_type == "plus_grid":
+        mask = _plus_grid(width, height, spacing, thickness, value)
+    elif pattern_type == "x_shapes":
+        mask = _plus_grid(width, height, spacing, thickness, value, diagonal=True)
+    elif pattern_type == "waves":
+        mask = _waves(width, height, spacing, thickness, value)
+    elif pattern_type == "vertical_stripes":
+        mask = _stripes(width, height, spacing, thickness, value, (width // 2) % spacing, "x")
+    elif pattern_type == "horizontal_stripes":
+        mask = _stripes(width, height, spacing, thickness, value, (height // 2) % spacing, "y")
+    else:
+        return None
+    return Image.fromarray(np.ascontiguousarray(mask), "L")
+
+
+# --- confronto e benchmark ---
+
+def _aligned_difference(image, reference):
+    """
+    Mean absolute difference (grey levels) after shifting `image` by the
+    translation that best matches `reference` (FFT cross-correlation on a
+    4x downscale): the references were rendered with another phase.
+    """
+    def grey(im, scale=1):
+        if scale > 1:
+            im = im.resize((im.width // scale, im.height // scale), Image.Resampling.BOX)
+        a = np.asarray(im.convert("L"), dtype=np.float32)
+        return a - a.mean()
+
+    small_a, small_b = grey(image, 4), grey(reference, 4)
+    corr = np.fft.irfft2(np.fft.rfft2(small_b) * np.conj(np.fft.rfft2(small_a)), s=small_a.shape)
+    sy, sx = np.unravel_index(np.argmax(corr), corr.shape)
+    shifted = np.roll(np.asarray(image.convert("L"), dtype=np.float32), (sy * 4, sx * 4), axis=(0, 1))
+    ref = np.asarray(reference.convert("L"), dtype=np.float32)
+    # Ignore a border as wide as the shift: wrapped pixels do not match anyway
+    m = 4 * 4 + 8
+    return float(np.abs(shifted - ref)[m:-m, m:-m].mean())
+
+
+def compare_backends(width=2160, height=2880, repeat=3):
+    """[(pattern, ms ImageDraw, ms NumPy, mean |diff|)] at the production spacing/thickness."""
+    import generate_menu_images as gmi
+
+    rows = []
+    for pattern_type in gmi.PATTERN_TYPES:
+        spec = gmi._pattern_spec("benchmark", pattern_type)
+        timings = {}
+        masks = {}
+        for backend in ("draw", "numpy"):
+            best = None
+            for _ in range(repeat):
+                gmi._pattern_mask.cache_clear()
+                start = time.perf_counter()
+                masks[backend] = gmi._pattern_mask(*spec, width, height, 150, backend)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[backend] = best
+        diff = np.abs(np.asarray(masks["draw"], dtype=np.int16) - np.asarray(masks["numpy"], dtype=np.int16)).mean()
+        rows.append((pattern_type, timings["draw"] * 1000, timings["numpy"] * 1000, float(diff)))
+    return rows
+
+
+def check_references():
+    """[(pattern, diff ImageDraw, diff NumPy)] against test/patterns/ at REFERENCE_SPECS."""
+    import generate_menu_images as gmi
+
+    rows = []
+    for pattern_type, (spacing, thickness) in REFERENCE_SPECS.items():
+        path = REFERENCE_DIR / f"{pattern_type}.jpg"
+        if not path.exists():
+            continue
+        reference = Image.open(path)
+        width, height = reference.size
+        pc = gmi._pattern_color(REFERENCE_BASE_COLOR)
+        if pattern_type in gmi._DOUBLE_PASTE_PATTERNS:
+            pc = gmi._double_paste_color(pc)
+        diffs = []
+        for backend in ("draw", "numpy"):
+            mask = gmi._pattern_mask(pattern_type, spacing, thickness, width, height, pc[3], backend)
+            image = Image.new("RGB", (width, height), REFERENCE_BASE_COLOR)
+            image.paste(pc[:3], (0, 0, width, height), mask)
+            diffs.append(_aligned_difference(image, reference))
+        rows.append((pattern_type, *diffs))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronta i backend ImageDraw e NumPy dei pattern di sfondo.")
+    parser.add_argument("--repeat", type=int, default=3, help="Ripetizioni per la misura dei tempi (si tiene la migliore).")
+    args = parser.parse_args()
+
+    print(f"{'pattern':<20} {'ImageDraw':>10} {'NumPy':>10} {'diff':>7}")
+    for pattern_type, draw_ms, numpy_ms, diff in compare_backends(repeat=args.repeat):
+        print(f"{pattern_type:<20} {draw_ms:>8.0f}ms {numpy_ms:>8.0f}ms {diff:>7.2f}")
+
+    print(f"\nRiferimenti in {REFERENCE_DIR.relative_to(REPO_ROOT)} (diff media dopo l'allineamento, "
+          f"tolleranza {REFERENCE_TOLERANCE}):")
+    failed = []
+    for pattern_type, draw_diff, numpy_diff in check_references():
+        ok = numpy_diff <= REFERENCE_TOLERANCE
+        if not ok:
+            failed.append(pattern_type)
+        print(f"  {'✓' if ok else '✗'} {pattern_type:<20} ImageDraw {draw_diff:5.2f}  NumPy {numpy_diff:5.2f}")
+    if failed:
+        raise SystemExit(f"Fuori tolleranza: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ try:
 except ImportError:
     ZoneInfo = None
 
+from menu_format import expand_menu
+
 REPO_ROOT = Path(__file__).resolve().parent.parent
 MENU_PATH = REPO_ROOT / "data" / "menu.json"
 
@@ -416,7 +418,7 @@ def main():
     menu_data = {}
     if MENU_PATH.exists():
         with MENU_PATH.open("r", encoding="utf-8") as f:
-            menu_data = json.load(f)
+            menu_data = expand_menu(json.load(f))
 
     didascalia = build_caption(
         menu_data,
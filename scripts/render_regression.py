@@ -0,0 +1,247 @@
+"""
+Regressione a immagini golden e benchmark del renderer dei post.
+
+Ogni caso viene renderizzato in un processo separato (così il picco di
+memoria è quello del solo caso) e confrontato con la sua immagine golden
+in test/golden/:
+
+- pattern/<tipo>: _generate_background_pattern() per ogni PATTERN_TYPES,
+  sul canvas del feed;
+- menu/<fixture>[/<formato>]: build_and_save_gt() su menu di prova (nomi
+  lunghi, overflow, sezioni vuote, ...) nei formati di POST_FORMATS.
+
+Il confronto è percettivo: entrambe le immagini sono ridotte a
+GOLDEN_WIDTH px (media dei pixel, assorbe aliasing e artefatti JPEG) e
+si misurano la differenza media e la quota di pixel che differiscono più
+di PIXEL_THRESHOLD livelli. Per ogni caso vengono registrati il tempo del
+primo render (font da caricare), il migliore dei render successivi (cache
+dei pattern svuotata ogni volta) e il picco di RSS del processo.
+
+    python scripts/render_regression.py [--repeat 3] [--only menu/] [--json report.json]
+    python scripts/render_regression.py --update     # rigenera le golden dopo una modifica voluta
+
+Con numpy installato controlla anche i pattern contro i riferimenti di
+test/patterns/ (vedi scripts/pattern_numpy.py).
+"""
+import argparse
+import json
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageStat
+
+import generate_menu_images as gmi
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+GOLDEN_DIR = REPO_ROOT / "test" / "golden"
+
+# Le golden sono salvate e confrontate a questa larghezza
+GOLDEN_WIDTH = 540
+# Tolleranze: differenza media (0-255) e quota di pixel con differenza > PIXEL_THRESHOLD
+MAX_MEAN_DIFF = 1.5
+PIXEL_THRESHOLD = 24
+MAX_CHANGED_PIXELS = 0.005
+
+FIXTURE_DATE = "2026-10-26"
+FIXTURE_CANTEEN = ("Mensa Martiri", "martiri")
+
+FIXTURE_MENUS = {
+    "normale": ("Pranzo", {
+        "Primi Piatti": ["Pasta al pomodoro", "Risotto zucchine e curry", "Crema di zucca con crostini"],
+        "Secondi Piatti": ["Polpette in umido", "Tortino ceci, porri e peperoni"],
+        "Contorni": ["Carote al vapore", "Insalata mista"],
+    }),
+    "nomi_lunghi": ("Cena", {
+        "Primi Piatti": [
+            "Garganelli integrali al ragù bianco di cinta senese con pecorino di Pienza e granella di pistacchi",
+            "Zuppa",
+        ],
+        "Secondi Piatti": [
+            "Filetto di merluzzo gratinato alle erbe aromatiche su vellutata di ceci e rosmarino, "
+            "con chips di cavolo nero croccante",
+        ],
+        "Contorni": ["Patate"],
+    }),
+    "overflow": ("Pranzo", {
+        "Primi Piatti": [f"Primo del giorno numero {i}" for i in range(1, 9)],
+        "Secondi Piatti": [f"Secondo piatto della casa {i}" for i in range(1, 9)],
+        "Contorni": [f"Contorno di stagione {i}" for i in range(1, 9)],
+    }),
+    "sezioni_vuote": ("Cena", {
+        "Primi Piatti": [],
+        "Secondi Piatti": ["Arista al forno"],
+        "Contorni": [],
+    }),
+    "senza_menu": ("Pranzo", {}),
+}
+
+# Fixture renderizzate anche negli altri formati
+FORMAT_FIXTURES = ["normale", "overflow"]
+
+
+def build_cases():
+    """{nome caso: (tipo, argomento)} nell'ordine in cui vengono eseguiti."""
+    cases = {f"pattern/{pattern_type}": ("pattern", pattern_type) for pattern_type in gmi.PATTERN_TYPES}
+    for name in FIXTURE_MENUS:
+        cases[f"menu/{name}"] = ("menu", (name, "feed"))
+    for name in FORMAT_FIXTURES:
+        for post_format in gmi.POST_FORMATS:
+            if post_format != "feed":
+                cases[f"menu/{name}/{post_format}"] = ("menu", (name, post_format))
+    return cases
+
+
+def _render(kind, arg, workdir):
+    if kind == "pattern":
+        width, height = gmi.POST_FORMATS["feed"]["canvas"]
+        base = gmi._random_light_color(FIXTURE_DATE, FIXTURE_CANTEEN[1])
+        return gmi._generate_background_pattern(base, width, height, f"golden_{arg}", force_pattern=arg)
+
+    name, post_format = arg
+    meal, meal_menu = FIXTURE_MENUS[name]
+    canteen_name, canteen_id = FIXTURE_CANTEEN
+    output_path = Path(workdir) / f"{name}.jpg"
+    stats = gmi.build_and_save_gt(
+        canteen_name, meal, meal_menu, FIXTURE_DATE, gmi._random_light_color(FIXTURE_DATE, canteen_id),
+        output_path, render_key=f"golden_{name}", variants=("full",), formats=(post_format,),
+    )
+    with Image.open(stats[0]["path"]) as image:
+        return image.convert("RGB")
+
+
+def run_case(case):
+    """
+    Eseguito in un processo nuovo per ogni caso. Ritorna
+    (immagine ridotta, ms primo render, ms migliore, picco RSS in MB).
+    """
+    kind, arg, repeat = case
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        image = _render(kind, arg, workdir)
+        cold = time.perf_counter() - start
+        warm = []
+        for _ in range(repeat):
+            gmi._pattern_mask.cache_clear()
+            start = time.perf_counter()
+            _render(kind, arg, workdir)
+            warm.append(time.perf_counter() - start)
+        best = min(warm, default=cold)
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    return _downscale(image), cold * 1000, best * 1000, peak_mb
+
+
+def _downscale(image):
+    height = round(image.height * GOLDEN_WIDTH / image.width)
+    return image.convert("RGB").resize((GOLDEN_WIDTH, height), Image.Resampling.BOX)
+
+
+def golden_path(case_name):
+    return GOLDEN_DIR / f"{case_name.replace('/', '__')}.png"
+
+
+def compare(image, golden):
+    """(differenza media, quota di pixel cambiati) tra due immagini già ridotte."""
+    if image.size != golden.size:
+        return 255.0, 1.0
+    # Differenza per pixel = massimo sui tre canali
+    r, g, b = ImageChops.difference(image, golden.convert("RGB")).split()
+    diff = ImageChops.lighter(ImageChops.lighter(r, g), b)
+    histogram = diff.histogram()
+    changed = sum(histogram[PIXEL_THRESHOLD + 1:]) / (diff.width * diff.height)
+    return ImageStat.Stat(diff).mean[0], changed
+
+
+def run(cases, repeat=3, update=False):
+    """[{case, cold_ms, best_ms, peak_mb, mean_diff, changed, status}] per tutti i casi."""
+    results = []
+    names = list(cases)
+    # Un processo per caso: il picco di RSS non si porta dietro i casi precedenti
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+        outputs = pool.map(run_case, [(*cases[name], repeat) for name in names])
+        for name, (image, cold_ms, best_ms, peak_mb) in zip(names, outputs):
+            path = golden_path(name)
+            row = {"case": name, "cold_ms": round(cold_ms, 1), "best_ms": round(best_ms, 1),
+                   "peak_mb": round(peak_mb, 1), "mean_diff": None, "changed": None}
+            if update:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                image.save(path, optimize=True)
+                row["status"] = "aggiornata"
+            elif not path.exists():
+                row["status"] = "golden mancante"
+            else:
+                with Image.open(path) as golden:
+                    mean_diff, changed = compare(image, golden)
+                row["mean_diff"] = round(mean_diff, 3)
+                row["changed"] = round(changed, 5)
+                ok = mean_diff <= MAX_MEAN_DIFF and changed <= MAX_CHANGED_PIXELS
+                row["status"] = "ok" if ok else "diversa"
+            results.append(row)
+            _print_row(row)
+    return results
+
+
+def _print_row(row):
+    mark = {"ok": "✓", "aggiornata": "↻"}.get(row["status"], "✗")
+    diff = "" if row["mean_diff"] is None else f"diff {row['mean_diff']:5.2f}  pixel {row['changed']:6.2%}"
+    print(f"  {mark} {row['case']:<32} {row['cold_ms']:7.0f}ms {row['best_ms']:7.0f}ms "
+          f"{row['peak_mb']:6.0f}MB  {diff}  {row['status'] if mark == '✗' else ''}".rstrip())
+
+
+def check_pattern_references():
+    """Controllo dei riferimenti di test/patterns con pattern_numpy; [] se numpy/pattern_numpy non ci sono."""
+    try:
+        import pattern_numpy
+    except ImportError:
+        return []
+    failed = []
+    print(f"\nRiferimenti in {pattern_numpy.REFERENCE_DIR.relative_to(REPO_ROOT)} "
+          f"(tolleranza {pattern_numpy.REFERENCE_TOLERANCE}):")
+    for pattern_type, draw_diff, _ in pattern_numpy.check_references():
+        ok = draw_diff <= pattern_numpy.REFERENCE_TOLERANCE
+        if not ok:
+            failed.append(f"riferimento/{pattern_type}")
+        print(f"  {'✓' if ok else '✗'} {pattern_type:<32} diff {draw_diff:5.2f}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regressione a immagini golden e benchmark del renderer dei post.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Render a caldo per caso dopo il primo (si tiene il più veloce, default: 3).")
+    parser.add_argument("--only", type=str, default=None,
+                        help="Solo i casi il cui nome inizia così (es. pattern/, menu/overflow).")
+    parser.add_argument("--update", action="store_true",
+                        help="Riscrive le immagini golden con il render attuale invece di confrontarle.")
+    parser.add_argument("--json", type=Path, default=None,
+                        help="Scrive anche i risultati (tempi, memoria, differenze) in questo file.")
+    args = parser.parse_args()
+
+    cases = build_cases()
+    if args.only:
+        cases = {name: case for name, case in cases.items() if name.startswith(args.only)}
+        if not cases:
+            raise SystemExit(f"Nessun caso per '{args.only}'.")
+
+    print(f"{'':4}{'caso':<32} {'primo':>9} {'migliore':>9} {'picco':>8}")
+    results = run(cases, repeat=args.repeat, update=args.update)
+    failed = [row["case"] for row in results if row["status"] not in ("ok", "aggiornata")]
+
+    if not args.update and not args.only:
+        failed += check_pattern_references()
+
+    if args.json:
+        args.json.write_text(json.dumps({"cases": results}, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    print(f"\n{len(results)} casi, render totale {sum(r['best_ms'] for r in results) / 1000:.2f}s (migliori)")
+    if failed:
+        raise SystemExit(f"Regressioni: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Pianificatore incrementale per lo scraping dei menu.
+
+Usa lo stato della run precedente (hash del contenuto e timestamp per ogni
+settimana) per decidere quali settimane riscaricare:
+- settimana corrente e successiva: sempre
+- settimane più lontane: con intervallo crescente in base alla distanza
+- settimane mai viste o cambiate all'ultimo fetch: sempre
+- scansione completa (fino a MAX_EMPTY_WEEKS vuote) una volta a settimana
+  oppure su richiesta con --full
+
+Simulazione di più notti consecutive (stato riletto da disco ogni notte,
+come nel workflow), con le settimane scaricate e le scritture dello stato:
+    python scripts/scrape_planner.py --nights 28 --published-weeks 5
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+from data_io import write_json
+
+STATE_FILENAME = 'scrape_state.json'
+STATE_VERSION = 1
+
+# Settimane (a partire da quella corrente) da riscaricare a ogni run
+ALWAYS_REFRESH_WEEKS = 2
+
+# Intervallo massimo tra due fetch della stessa settimana
+MAX_REFRESH_INTERVAL_DAYS = 7
+
+# Ogni quanti giorni forzare una scansione completa
+FULL_RESCAN_DAYS = 7
+
+DAY_NAMES = ['lun', 'mar', 'mer', 'gio', 'ven', 'sab', 'dom']
+
+
+def week_monday(date_obj):
+    return date_obj - datetime.timedelta(days=date_obj.weekday())
+
+
+def week_hash(days):
+    """Hash stabile del contenuto di una settimana (dict date_str -> giorno)."""
+    payload = json.dumps(days, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def group_days_by_week(days):
+    """Raggruppa un dict date_str -> giorno per lunedì della settimana (ISO)."""
+    weeks = {}
+    for date_str, day in days.items():
+        try:
+            monday = week_monday(datetime.date.fromisoformat(date_str)).isoformat()
+        except ValueError:
+            continue
+        weeks.setdefault(monday, {})[date_str] = day
+    return weeks
+
+
+def load_state(data_dir):
+    path = os.path.join(data_dir, STATE_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (json.JSONDecodeError, ValueError):
+        return {}
+    if state.get('version') != STATE_VERSION:
+        return {}
+    return state
+
+
+def _state_signature(state, start_monday):
+    """
+    Le parti dello stato che cambiano il piano. Il fetched_at conta solo per
+    le settimane oltre ALWAYS_REFRESH_WEEKS, dove decide l'intervallo di
+    refresh; le prime vengono riscaricate comunque a ogni run.
+    """
+    first_scheduled = (start_monday + datetime.timedelta(days=7 * ALWAYS_REFRESH_WEEKS)).isoformat()
+    weeks = {
+        monday: (
+            w.get('hash'), w.get('days'), w.get('changed_at'),
+            # "cambiata all'ultimo fetch" dipende dal fetched_at anche per le prime settimane
+            w.get('changed_at') == w.get('fetched_at'),
+            w.get('fetched_at') if monday >= first_scheduled else None,
+        )
+        for monday, w in state.get('weeks', {}).items()
+    }
+    return state.get('version'), state.get('last_full_scan'), weeks
+
+
+def save_state(data_dir, state, start_monday):
+    """
+    Scrive scrape_state.json solo se cambia qualcosa che conta per il piano:
+    hash, changed_at, settimane, ultima scansione completa o il fetched_at di
+    una settimana a intervallo (vedi _state_signature). Una run che scarica
+    solo la settimana corrente e la successiva, senza novità, non tocca il
+    file e il workflow non committa nulla.
+    Ritorna True se il file è stato scritto.
+    """
+    if _state_signature(load_state(data_dir), start_monday) == _state_signature(state, start_monday):
+        return False
+    path = os.path.join(data_dir, STATE_FILENAME)
+    write_json(path, state, indent=2, sort_keys=True, trailing_newline=True)
+    return True
+
+
+def refresh_interval_days(weeks_ahead):
+    """Intervallo di refresh per una settimana a `weeks_ahead` settimane da oggi.
+
+    Raddoppia per ogni settimana oltre quelle sempre aggiornate:
+    1, 2, 4, 7, 7, ... giorni.
+    """
+    if weeks_ahead < ALWAYS_REFRESH_WEEKS:
+        return 0
+    return min(2 ** (weeks_ahead - ALWAYS_REFRESH_WEEKS), MAX_REFRESH_INTERVAL_DAYS)
+
+
+def _parse_ts(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_weeks(state, start_monday, now, full=False):
+    """
+    Costruisce il piano di scraping.
+    Returns dict: {'full': bool, 'reason': str, 'weeks': [{'monday', 'fetch', 'reason'}]}
+    In modalità completa 'weeks' è vuoto: lo scraper procede fino a MAX_EMPTY_WEEKS vuote.
+    """
+    if full:
+        return {'full': True, 'reason': 'richiesta esplicita (--full)', 'weeks': []}
+
+    known_weeks = state.get('weeks', {})
+    last_full = _parse_ts(state.get('last_full_scan'))
+    if not known_weeks or last_full is None:
+        return {'full': True, 'reason': 'nessuno stato precedente', 'weeks': []}
+
+    full_age = now - last_full
+    if full_age >= datetime.timedelta(days=FULL_RESCAN_DAYS):
+        return {
+            'full': True,
+            'reason': f'ultima scansione completa {full_age.days}g fa',
+            'weeks': [],
+        }
+
+    # Orizzonte: ultima settimana con dati + una settimana di frontiera
+    with_data = [m for m, w in known_weeks.items() if w.get('days', 0) > 0]
+    last_known = max(with_data) if with_data else start_monday.isoformat()
+    last_monday = max(
+        datetime.date.fromisoformat(last_known) + datetime.timedelta(days=7),
+        start_monday + datetime.timedelta(days=7 * (ALWAYS_REFRESH_WEEKS - 1)),
+    )
+
+    weeks = []
+    monday = start_monday
+    weeks_ahead = 0
+    while monday <= last_monday:
+        key = monday.isoformat()
+        entry = known_weeks.get(key)
+
+        if weeks_ahead == 0:
+            fetch, reason = True, 'settimana corrente'
+        elif weeks_ahead < ALWAYS_REFRESH_WEEKS:
+            fetch, reason = True, 'settimana successiva'
+        elif entry is None:
+            fetch, reason = True, 'frontiera: nuova settimana' if key > last_known else 'mai scaricata'
+        else:
+            fetched_at = _parse_ts(entry.get('fetched_at'))
+            interval = refresh_interval_days(weeks_ahead)
+            if fetched_at is None:
+                fetch, reason = True, 'timestamp mancante'
+            elif entry.get('changed_at') == entry.get('fetched_at'):
+                fetch, reason = True, 'cambiata all\'ultimo fetch'
+            else:
+                age = now - fetched_at
+                if age >= datetime.timedelta(days=interval):
+                    fetch, reason = True, f'aggiornata {age.days}g fa, intervallo {interval}g'
+                else:
+                    fetch, reason = False, f'aggiornata {age.days}g fa, intervallo {interval}g'
+
+        weeks.append({'monday': monday, 'fetch': fetch, 'reason': reason})
+        monday += datetime.timedelta(days=7)
+        weeks_ahead += 1
+
+    return {'full': False, 'reason': 'incrementale', 'weeks': weeks}
+
+
+def format_plan(plan, label):
+    """Testo leggibile del piano (quali settimane vengono scaricate e perché)."""
+    if plan['full']:
+        return f"[{label}] Piano di scraping: scansione completa ({plan['reason']})."
+
+    fetched = sum(1 for w in plan['weeks'] if w['fetch'])
+    lines = [f"[{label}] Piano di scraping incrementale: {fetched}/{len(plan['weeks'])} settimane da scaricare."]
+    for w in plan['weeks']:
+        action = 'FETCH' if w['fetch'] else 'skip '
+        lines.append(f"  {w['monday'].isoformat()}  {action}  {w['reason']}")
+    return '\n'.join(lines)
+
+
+def update_state(state, plan, new_days, fetched_mondays, now, start_monday):
+    """
+    Aggiorna lo stato dopo la run.
+    new_days: dict date_str -> giorno (struttura finale di menu.json).
+    fetched_mondays: lunedì (ISO) effettivamente scaricati senza errori.
+    """
+    now_str = now.isoformat(timespec='seconds')
+    by_week = group_days_by_week(new_days)
+
+    previous = state.get('weeks', {})
+    if plan['full']:
+        weeks = {}
+        state['last_full_scan'] = now_str
+    else:
+        weeks = dict(previous)
+
+    for monday in fetched_mondays:
+        days = by_week.get(monday, {})
+        new_hash = week_hash(days)
+        old = previous.get(monday)
+        if old is None:
+            # Prima volta che la vediamo: nessun cambiamento da segnalare
+            changed_at = None
+        elif old.get('hash') == new_hash:
+            changed_at = old.get('changed_at')
+        else:
+            changed_at = now_str
+        weeks[monday] = {
+            'hash': new_hash,
+            'days': len(days),
+            'fetched_at': now_str,
+            'changed_at': changed_at,
+        }
+
+    start_key = start_monday.isoformat()
+    state['weeks'] = {m: w for m, w in sorted(weeks.items()) if m >= start_key}
+    state['version'] = STATE_VERSION
+    return state
+
+
+def _simulated_menu(today, published_weeks):
+    """
+    Menu di prova per le settimane dalla corrente a `published_weeks` dopo,
+    con contenuto stabile. Include anche i giorni già passati della settimana
+    corrente, così nessun hash cambia e si vede solo l'effetto del piano.
+    """
+    day = week_monday(today)
+    last = day + datetime.timedelta(days=7 * published_weeks + 6)
+    days = {}
+    while day <= last:
+        date_str = day.isoformat()
+        days[date_str] = {'date': date_str, 'Pranzo': {'Primi Piatti': [{'name': f'Primo del {date_str}'}]}}
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def simulate(nights, published_weeks, first_day, data_dir):
+    """
+    Ripete plan_weeks + update_state + save_state per `nights` notti senza
+    novità nei menu. Ritorna [(data, completa, settimane scaricate, settimane nel piano, scritto)].
+    """
+    rows = []
+    for night in range(nights):
+        today = first_day + datetime.timedelta(days=night)
+        now = datetime.datetime.combine(today, datetime.time(3, 0))
+        start_monday = week_monday(today)
+        state = load_state(data_dir)
+        plan = plan_weeks(state, start_monday, now)
+        days = _simulated_menu(today, published_weeks)
+        if plan['full']:
+            last = max(group_days_by_week(days))
+            fetched = [m for m in sorted(group_days_by_week(days)) if m <= last]
+            planned = len(fetched)
+        else:
+            fetched = [w['monday'].isoformat() for w in plan['weeks'] if w['fetch']]
+            planned = len(plan['weeks'])
+        update_state(state, plan, days, fetched, now, start_monday)
+        written = save_state(data_dir, state, start_monday)
+        rows.append((today, plan['full'], len(fetched), planned, written))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula il piano di scraping incrementale su più notti.")
+    parser.add_argument("--nights", type=int, default=28, help="Notti da simulare (default: 28).")
+    parser.add_argument("--published-weeks", type=int, default=5,
+                        help="Settimane pubblicate oltre quella corrente (default: 5).")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="Prima notte YYYY-MM-DD (default: oggi).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        rows = simulate(args.nights, args.published_weeks, args.start, data_dir)
+    print(f"{args.nights} notti, menu pubblicato fino a {args.published_weeks} settimane avanti:")
+    for today, full, fetched, planned, written in rows:
+        mode = 'completa' if full else 'incrementale'
+        print(f"  {today.isoformat()} {DAY_NAMES[today.weekday()]}  {mode:<12}  {fetched}/{planned} settimane"
+              f"  {'scritto' if written else '-'}")
+    print(f"Totale: {sum(r[2] for r in rows)} settimane scaricate, "
+          f"{sum(1 for r in rows if r[4])} scritture di {STATE_FILENAME}.")
+
+
+if __name__ == "__main__":
+    main()
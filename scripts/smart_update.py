@@ -1,8 +1,22 @@
+import argparse
 import json
 import datetime
 import os
 import sys
+from data_io import write_data, write_json
+from dish_predictions import PREDICTIONS_FILENAME, update_predictions
+from dish_stats import STATS_FILENAME, update_stats
 from extract_menu import init_session, fetch_week_data, parse_menu_html
+from http_client import CLIENT, FetchError
+from history_store import HistoryStore, month_key
+from menu_db import DB_FILENAME, build_db
+from menu_diff import CHANGESET_FILENAME, build_changeset, format_changeset, has_changes, load_changeset
+from menu_format import dumps_menu, expand_menu, is_compact
+from menu_sites import site_dirs
+from scrape_planner import (
+    load_state, save_state, plan_weeks, format_plan, update_state,
+    group_days_by_week, week_monday,
+)
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 
@@ -25,14 +39,19 @@ def get_tipo_menu_id(url):
     return '3'
 
 
-def scrape_from_today(canteens, start_monday):
+def scrape_from_today(canteens, start_monday, weeks=None):
     """
     Scrapes all canteens week by week starting from `start_monday`.
-    Returns aggregated dict: date_str -> meal -> course -> dish_name -> dish_obj
-    Only includes dates >= today.
+    If `weeks` (list of Monday dates) is given, only those weeks are fetched
+    and the empty-weeks stop is disabled.
+    Returns (aggregated, failed_mondays):
+      aggregated: date_str -> meal -> course -> dish_name -> dish_obj (only dates >= today)
+      failed_mondays: set of Monday ISO dates that could not be fetched for some canteen.
+    A failed week never counts as empty, so it cannot trigger the early stop.
     """
     today = datetime.date.today()
     aggregated = {}  # date_str -> meal -> course -> dish_name -> dish_obj
+    failed_mondays = set()
 
     for canteen in canteens:
         c_name = canteen.get('name')
@@ -42,16 +61,30 @@ def scrape_from_today(canteens, start_monday):
 
         tipo_menu_id = get_tipo_menu_id(c_url)
         session = init_session(c_url)
-        print(f"Scraping {c_name} da {start_monday}...")
+        if weeks is None:
+            print(f"Scraping {c_name} da {start_monday}...")
+            mondays = None
+        else:
+            print(f"Scraping {c_name}: {len(weeks)} settimane pianificate...")
+            mondays = iter(weeks)
 
-        current_monday = start_monday
+        current_monday = start_monday if mondays is None else next(mondays, None)
         empty_streak = 0
 
-        while True:
+        while current_monday is not None:
             timestamp = int(
                 datetime.datetime.combine(current_monday, datetime.time(12, 0)).timestamp()
             )
-            data = fetch_week_data(session, timestamp, tipo_menu_id)
+            try:
+                data = fetch_week_data(session, timestamp, tipo_menu_id)
+            except FetchError as e:
+                print(f"  -> Settimana {current_monday} non scaricata per {c_name}: {e}")
+                failed_mondays.add(current_monday.isoformat())
+                if mondays is not None:
+                    current_monday = next(mondays, None)
+                else:
+                    current_monday += datetime.timedelta(days=7)
+                continue
 
             week_has_data = False
 
@@ -93,6 +126,10 @@ def scrape_from_today(canteens, start_monday):
                                 if c_name not in entry['available_at']:
                                     entry['available_at'].append(c_name)
 
+            if mondays is not None:
+                current_monday = next(mondays, None)
+                continue
+
             if week_has_data:
                 empty_streak = 0
             else:
@@ -106,7 +143,7 @@ def scrape_from_today(canteens, start_monday):
 
             current_monday += datetime.timedelta(days=7)
 
-    return aggregated
+    return aggregated, failed_mondays
 
 
 MEAL_ORDER = ['Pranzo', 'Cena']
@@ -131,6 +168,20 @@ def build_final_days(aggregated):
     return result
 
 
+def _weeks_until_last(start_monday, days):
+    """Lunedì (ISO) da start_monday fino all'ultima settimana con dati."""
+    weeks = group_days_by_week(days)
+    if not weeks:
+        return []
+    last = datetime.date.fromisoformat(max(weeks))
+    mondays = []
+    monday = start_monday
+    while monday <= last:
+        mondays.append(monday.isoformat())
+        monday += datetime.timedelta(days=7)
+    return mondays
+
+
 def _load_json(path, fallback=None):
     """Load a JSON file, returning fallback if missing or empty/invalid."""
     if fallback is None:
@@ -162,11 +213,14 @@ def _load_json_raw(path):
         return '', {}
 
 
-def update_site(data_dir, label):
+def update_site(data_dir, label, full=False, plan_only=False, compact=False):
     """
     Runs the full smart-update pipeline for a single site (Pisa or Firenze).
     data_dir: path to the data directory containing canteens.json, menu.json, etc.
     label: human-readable label for log output (e.g. "UNIPI", "UNIFI").
+    full: force a full rescan instead of the incremental plan.
+    plan_only: print the scraping plan and exit without fetching.
+    compact: write menu.json in the dictionary-encoded v2 format (see menu_format.py).
     Returns True if any file was changed.
     """
     print(f"\n{'='*50}")
@@ -174,7 +228,6 @@ def update_site(data_dir, label):
     print(f"{'='*50}")
 
     _menu_path = os.path.join(data_dir, 'menu.json')
-    _history_path = os.path.join(data_dir, 'menu_history.json')
     _canteens_path = os.path.join(data_dir, 'canteens.json')
     _today_path = os.path.join(data_dir, 'menu_today.json')
 
@@ -188,78 +241,144 @@ def update_site(data_dir, label):
         return False
 
     menu_raw, menu_data = _load_json_raw(_menu_path)
-    history_data = _load_json(_history_path)
+    menu_was_compact = is_compact(menu_data)
+    menu_data = expand_menu(menu_data)
+    history = HistoryStore(data_dir)
+    migrated = history.migrate()
+    if migrated:
+        print(f"[{label}] menu_history.json convertito in {len(history.months())} segmenti mensili ({migrated} date).")
 
     today = datetime.date.today()
-    start_monday = today - datetime.timedelta(days=today.weekday())
+    now = datetime.datetime.now()
+    start_monday = week_monday(today)
+    today_str = today.isoformat()
     print(f"[{label}] Oggi: {today} | Scraping da lunedì: {start_monday}")
 
-    # Scarica i menu da oggi in poi
-    aggregated = scrape_from_today(canteens, start_monday)
+    state = load_state(data_dir)
+    plan = plan_weeks(state, start_monday, now, full=full)
+    print(format_plan(plan, label))
+    if plan_only:
+        return False, {d: v for d, v in menu_data.items() if d >= today_str}
 
-    today_str = today.isoformat()
+    # Scarica i menu da oggi in poi (solo le settimane pianificate se incrementale)
+    if plan['full']:
+        aggregated, failed_mondays = scrape_from_today(canteens, start_monday)
+    else:
+        planned = [w['monday'] for w in plan['weeks'] if w['fetch']]
+        aggregated, failed_mondays = scrape_from_today(canteens, start_monday, weeks=planned)
+    if failed_mondays:
+        print(f"[{label}] Settimane con errori di rete (mantengo i dati precedenti): {', '.join(sorted(failed_mondays))}")
 
     # Sposta i giorni passati dallo snapshot corrente allo storico.
     past_days = {d: v for d, v in menu_data.items() if d < today_str}
-    history_merged = dict(history_data)
-    appended_to_history = 0
-    for date_key in sorted(past_days.keys()):
-        if date_key not in history_merged:
-            history_merged[date_key] = past_days[date_key]
-            appended_to_history += 1
-    sorted_history = dict(sorted(history_merged.items()))
+    # Prima lo storico, poi menu.json: se la run si interrompe nel mezzo
+    # i giorni passati restano in menu.json e verranno archiviati la prossima volta.
+    appended_to_history = history.append(past_days)
+    compacted = history.compact(month_key(today_str))
+    if compacted:
+        print(f"[{label}] Storico: compressi i mesi conclusi {', '.join(compacted)}.")
 
     if aggregated:
         new_days = build_final_days(aggregated)
         print(f"[{label}] Trovati dati per {len(new_days)} giorni (da oggi in poi).")
+        if plan['full']:
+            fetched_mondays = _weeks_until_last(start_monday, new_days)
+        else:
+            fetched_mondays = [w['monday'].isoformat() for w in plan['weeks'] if w['fetch']]
+        fetched_mondays = [m for m in fetched_mondays if m not in failed_mondays]
+
+        # Le settimane non riscaricate (o fallite) restano quelle della run precedente
+        for monday, days in group_days_by_week(new_days).items():
+            if monday in failed_mondays:
+                for date_str in days:
+                    del new_days[date_str]
+        for monday, days in group_days_by_week(menu_data).items():
+            if monday in fetched_mondays:
+                continue
+            if plan['full'] and monday not in failed_mondays:
+                continue
+            for date_str, day in days.items():
+                if date_str >= today_str:
+                    new_days[date_str] = day
         sorted_menu = dict(sorted(new_days.items()))
+        update_state(state, plan, sorted_menu, fetched_mondays, now, start_monday)
+        save_state(data_dir, state, start_monday)
     else:
         print(f"[{label}] Nessun dato nuovo trovato. Mantengo in menu.json solo i giorni da oggi in poi.")
         future_days = {d: v for d, v in menu_data.items() if d >= today_str}
         sorted_menu = dict(sorted(future_days.items()))
+        # Anche una run vuota va registrata (settimane scaricate senza dati),
+        # altrimenti la prossima run ripartirebbe da una scansione completa
+        if plan['full']:
+            empty_mondays = [start_monday.isoformat()]
+        else:
+            empty_mondays = [w['monday'].isoformat() for w in plan['weeks'] if w['fetch']]
+        empty_mondays = [m for m in empty_mondays if m not in failed_mondays]
+        if empty_mondays:
+            update_state(state, plan, {}, empty_mondays, now, start_monday)
+            save_state(data_dir, state, start_monday)
+
+    # Diff strutturale: confronta i piatti, non la serializzazione
+    old_future = {d: v for d, v in menu_data.items() if d >= today_str}
+    changeset_path = os.path.join(data_dir, CHANGESET_FILENAME)
+    sequence = load_changeset(changeset_path).get('sequence', 0) + 1
+    changeset = build_changeset(old_future, sorted_menu, archived_dates=past_days.keys(), label=label,
+                                sequence=sequence)
+    menu_changed = has_changes(changeset) or bool(past_days)
+    if menu_changed:
+        print(format_changeset(changeset, label))
+    history_changed = appended_to_history > 0 or migrated > 0 or bool(compacted)
 
-    # Salva solo se ci sono modifiche effettive
-    old_json = json.dumps(dict(sorted(menu_data.items())), ensure_ascii=False)
-    new_json = json.dumps(sorted_menu, ensure_ascii=False)
-    menu_changed = old_json != new_json
-
-    old_history_json = json.dumps(dict(sorted(history_data.items())), ensure_ascii=False)
-    new_history_json = json.dumps(sorted_history, ensure_ascii=False)
-    history_changed = old_history_json != new_history_json
-
-    minified_menu_json = json.dumps(sorted_menu, separators=(',', ':'), ensure_ascii=False)
-    menu_already_minified = menu_raw.strip() == minified_menu_json
-    menu_write_required = menu_changed or not menu_already_minified
+    # Riscrive anche se il file non è (più) minificato o è nell'altro formato
+    menu_write_required = (
+        menu_changed or not menu_raw.strip() or '\n' in menu_raw.strip()
+        or menu_was_compact != compact
+    )
 
     if menu_write_required:
-        with open(_menu_path, 'w', encoding='utf-8') as f:
-            f.write(minified_menu_json)
+        write_data(_menu_path, dumps_menu(sorted_menu, compact=compact))
+
+    # Una run senza modifiche lascia il changeset precedente (stessa sequence):
+    # per i consumer una nuova sequence vuol dire sempre "qualcosa è cambiato"
+    if menu_changed:
+        write_json(changeset_path, changeset, indent=2)
+    else:
+        print(f"[{label}] {CHANGESET_FILENAME} invariato (sequence {sequence - 1}).")
 
     if menu_changed:
         print(f"[{label}] menu.json aggiornato con {len(sorted_menu)} giorni da oggi in poi.")
     elif menu_write_required:
-        print(f"[{label}] Nessuna modifica dati rilevata. menu.json riscritto in formato minificato.")
+        print(f"[{label}] Nessuna modifica dati rilevata. menu.json riscritto in formato {'v2' if compact else 'v1'} minificato.")
     else:
         print(f"[{label}] Nessuna modifica rilevata. menu.json invariato.")
 
-    if history_changed:
-        with open(_history_path, 'w', encoding='utf-8') as f:
-            json.dump(sorted_history, f, indent=2, ensure_ascii=False)
-        print(f"[{label}] menu_history.json aggiornato: aggiunte {appended_to_history} nuove date passate.")
+    if appended_to_history:
+        print(f"[{label}] Storico aggiornato: aggiunte {appended_to_history} nuove date passate.")
     else:
-        print(f"[{label}] Nessuna modifica rilevata su menu_history.json.")
+        print(f"[{label}] Nessuna nuova data nello storico.")
 
     # Genera sempre menu_today.json con il menu di oggi
     if today_str in sorted_menu:
         today_menu = {today_str: sorted_menu[today_str]}
-        with open(_today_path, 'w', encoding='utf-8') as f:
-            json.dump(today_menu, f, separators=(',', ':'), ensure_ascii=False)
+        write_json(_today_path, today_menu)
         print(f"[{label}] menu_today.json generato per {today_str}.")
     else:
-        with open(_today_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, separators=(',', ':'), ensure_ascii=False)
+        write_json(_today_path, {})
         print(f"[{label}] Nessun menu trovato per oggi ({today_str}). menu_today.json vuoto.")
 
+    # Database SQLite (menu + storico) per query indicizzate da bot e script
+    db_days = build_db(os.path.join(data_dir, DB_FILENAME), sorted_menu, history.iter_days())
+    print(f"[{label}] {DB_FILENAME} ricostruito con {db_days} giorni.")
+
+    # Statistiche dei piatti dallo storico (frequenza, ultima volta, intervallo medio)
+    stats_dishes = update_stats(data_dir, history)
+    print(f"[{label}] {STATS_FILENAME} aggiornato: {stats_dishes} piatti.")
+
+    # Previsioni oltre il menu pubblicato, dalla rotazione delle mense
+    predictions = update_predictions(data_dir, history, sorted_menu)
+    print(f"[{label}] {PREDICTIONS_FILENAME} aggiornato: {len(predictions['dishes'])} piatti previsti "
+          f"oltre il {predictions['published_until']}.")
+
     return menu_changed or history_changed, sorted_menu
 
 
@@ -356,25 +475,38 @@ def generate_shortcuts(all_today_menus):
                 }
 
     _shortcuts_path = os.path.join(DATA_DIR, 'shortcuts.json')
-    with open(_shortcuts_path, 'w', encoding='utf-8') as f:
-        json.dump(shortcuts, f, indent=2, ensure_ascii=False)
+    write_json(_shortcuts_path, shortcuts, indent=2)
     print(f"\nshortcuts.json generato con {len(shortcuts)} mense.")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Aggiorna menu.json, menu_today.json e lo storico per ogni sito."
+    )
+    parser.add_argument("--full", action="store_true",
+                        help="Forza una scansione completa invece del piano incrementale.")
+    parser.add_argument("--plan", action="store_true",
+                        help="Mostra solo il piano di scraping (settimane e motivi) senza scaricare.")
+    parser.add_argument("--menu-format", choices=['v1', 'v2'], default='v1',
+                        help="Formato di menu.json: v1 (classico) o v2 (dizionario piatti/mense, più compatto).")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     today = datetime.date.today()
 
-    # Siti da aggiornare: (data_dir, label)
-    sites = [
-        (DATA_DIR, 'UNIPI'),
-        (os.path.join(DATA_DIR, 'unifi'), 'UNIFI'),
-    ]
+    # Siti da aggiornare: (data_dir, label), gli stessi serviti dal bot
+    sites = site_dirs(DATA_DIR)
 
     any_changed = False
     all_today_menus = []
 
     for data_dir, label in sites:
-        changed, sorted_menu = update_site(data_dir, label)
+        changed, sorted_menu = update_site(
+            data_dir, label, full=args.full, plan_only=args.plan,
+            compact=args.menu_format == 'v2',
+        )
         if changed:
             any_changed = True
         # Raccogli il menu di oggi per lo shortcuts
@@ -382,9 +514,14 @@ def main():
         if today_str in sorted_menu:
             all_today_menus.append({today_str: sorted_menu[today_str]})
 
+    if args.plan:
+        return
+
     # Genera sempre shortcuts.json (anche se i menu non sono cambiati)
     generate_shortcuts(all_today_menus)
 
+    print(f"\n{CLIENT.summary()}")
+
     if not any_changed:
         print("\nNessuna modifica rilevata su nessun sito.")
         sys.exit(0)